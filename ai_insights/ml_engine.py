@@ -10,7 +10,7 @@ import os
 from datetime import datetime, timedelta
 from django.utils import timezone
 from django.db.models import Sum, Count, Avg, F
-from billing.models import Bill, BillItem
+from billing.models import Bill, BillItem, CustomerStats
 from products.models import Product
 
 class MLSalesPredictor:
@@ -348,30 +348,26 @@ class MLCustomerSegmentation:
     
     def segment_customers(self):
         """Segment customers using RFM analysis"""
-        # Get customer data
-        customer_data = Bill.objects.filter(
+        # Customers active in the last 90 days, read from the maintained
+        # lifetime stats instead of every bill they ever had
+        customer_data = CustomerStats.objects.filter(
             shop=self.shop,
-            date__gte=timezone.now() - timedelta(days=90)
-        ).values('customer_name', 'total', 'date')
+            last_purchase__gte=timezone.now() - timedelta(days=90)
+        ).values('customer__name', 'last_purchase', 'bill_count', 'total_spent')
         
         if not customer_data:
             return []
         
         df = pd.DataFrame(customer_data)
         
-        # Convert numeric columns to float
-        df['total'] = df['total'].astype(float)
-        df['date'] = pd.to_datetime(df['date'])
-        
         # Calculate RFM metrics
         current_date = timezone.now().date()
         
-        rfm = df.groupby('customer_name').agg({
-            'date': lambda x: (current_date - x.max().date()).days,  # Recency
-            'total': ['count', 'sum']  # Frequency, Monetary
-        }).round(2)
-        
-        rfm.columns = ['Recency', 'Frequency', 'Monetary']
+        rfm = pd.DataFrame({
+            'Recency': [(current_date - date.date()).days for date in df['last_purchase']],
+            'Frequency': df['bill_count'].astype(int).tolist(),
+            'Monetary': df['total_spent'].astype(float).tolist()
+        }, index=df['customer__name'].tolist()).round(2)
         
         if len(rfm) < 3:
             return self._simple_segmentation(rfm)
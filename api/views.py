@@ -4,7 +4,10 @@ from django.shortcuts import get_object_or_404
 from django.db.models import Q, F, Sum
 from django.utils import timezone
 from products.models import Product, Category
+from products.search_index import filter_by_search
+from products.stock import apply_stock_updates
 from billing.models import Bill, BillItem
+from billing.checkout import commit_bill
 from .utils import APIResponse, APIValidator, handle_api_errors
 import json
 
@@ -19,9 +22,7 @@ def products_api(request):
     products = Product.objects.filter(shop=request.user.shop, is_active=True)
     
     if search:
-        products = products.filter(
-            Q(name__icontains=search) | Q(barcode__icontains=search)
-        )
+        products = filter_by_search(products, request.user.shop, search)
     
     if category_id:
         products = products.filter(category_id=category_id)
@@ -117,26 +118,16 @@ def bulk_update_stock_api(request):
     if not updates:
         return APIResponse.error("No updates provided")
     
-    updated_count = 0
-    errors = []
+    if not isinstance(updates, list) or not all(isinstance(update, dict) for update in updates):
+        return APIResponse.error("Updates must be a list of objects")
     
-    for update in updates:
-        try:
-            product_id = update.get('product_id')
-            new_stock = APIValidator.validate_integer(update.get('stock'), 'Stock', 0)
-            
-            product = Product.objects.get(id=product_id, shop=request.user.shop)
-            product.stock = new_stock
-            product.save()
-            updated_count += 1
-        except Product.DoesNotExist:
-            errors.append(f"Product {product_id} not found")
-        except Exception as e:
-            errors.append(f"Error updating product {product_id}: {str(e)}")
+    # Each update is {product_id or barcode, stock or change}; kind is adjustment, receipt or return
+    result = apply_stock_updates(request.user.shop, updates, data.get('kind') or 'adjustment')
     
     return APIResponse.success({
-        'updated_count': updated_count,
-        'errors': errors
+        'updated_count': result.updated,
+        'unchanged_count': result.unchanged,
+        'errors': [f"Row {row}: {error}" for row, error in result.errors]
     })
 
 @login_required
@@ -172,44 +163,30 @@ def create_bill_api(request):
     if not items:
         return APIResponse.error("No items provided")
     
-    subtotal = APIValidator.validate_decimal(data.get('subtotal', 0), 'Subtotal', 0)
-    tax = APIValidator.validate_decimal(data.get('tax', 0), 'Tax', 0)
+    # Items are priced from the products and the totals by commit_bill; a sent unit_price is ignored
     discount = APIValidator.validate_decimal(data.get('discount', 0), 'Discount', 0)
-    total = APIValidator.validate_decimal(data.get('total'), 'Total', 0.01)
     
-    bill = Bill.objects.create(
-        shop=request.user.shop,
+    lines = []
+    for item_data in items:
+        quantity = APIValidator.validate_integer(item_data.get('quantity'), 'Quantity', 1)
+        lines.append((item_data.get('product_id'), quantity))
+    
+    bill = commit_bill(
+        request.user.shop,
+        lines,
         customer_name=data.get('customer_name', '').strip()[:100],
         customer_phone=data.get('customer_phone', '').strip()[:15],
         payment_type=data.get('payment_type', 'cash'),
-        subtotal=subtotal,
-        tax=tax,
-        discount=discount,
-        total=total
+        discount=discount
     )
     
-    for item_data in items:
-        product = get_object_or_404(Product, id=item_data['product_id'], shop=request.user.shop)
-        quantity = APIValidator.validate_integer(item_data['quantity'], 'Quantity', 1)
-        unit_price = APIValidator.validate_decimal(item_data['unit_price'], 'Unit price', 0)
-        
-        if product.stock < quantity:
-            return APIResponse.error(f"Insufficient stock for {product.name}")
-        
-        BillItem.objects.create(
-            bill=bill,
-            product=product,
-            quantity=quantity,
-            unit_price=unit_price,
-            total_price=unit_price * quantity
-        )
-        
-        product.stock -= quantity
-        product.save()
-    
     return APIResponse.success({
         'bill_id': bill.id,
         'bill_number': bill.bill_number,
+        'subtotal': float(bill.subtotal),
+        'tax': float(bill.tax),
+        'discount': float(bill.discount),
+        'total': float(bill.total),
         'message': 'Bill created successfully'
     }, status=201)
 
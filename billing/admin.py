@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Bill, BillItem, Customer
+from .models import Bill, BillItem, CreditLedgerEntry, Customer
 
 @admin.register(Bill)
 class BillAdmin(admin.ModelAdmin):
@@ -18,3 +18,16 @@ class CustomerAdmin(admin.ModelAdmin):
     list_display = ['name', 'phone', 'email', 'shop', 'created_at']
     list_filter = ['shop', 'created_at']
     search_fields = ['name', 'phone', 'email']
+
+@admin.register(CreditLedgerEntry)
+class CreditLedgerEntryAdmin(admin.ModelAdmin):
+    list_display = ['customer', 'kind', 'amount', 'balance_after', 'created_at', 'shop']
+    list_filter = ['kind', 'shop']
+    search_fields = ['customer__name', 'customer__phone', 'note']
+
+    # The ledger is append-only; corrections are posted as adjustments
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,105 @@
+"""
+Server-side POS cart store, kept out of the session
+"""
+from decimal import Decimal
+from django.db import IntegrityError, transaction
+from products.models import Product
+from .checkout import FRACTIONAL_UNITS, stock_decrement
+from .models import CartLine
+from .reservations import release, reserve
+
+
+def get_till_id(request):
+    """Till the request comes from; one cashier can run several tills"""
+    till = request.headers.get('X-Till-Id') or request.GET.get('till') or 'default'
+    return till[:32]
+
+
+class CartStore:
+    """
+    Open cart of one cashier at one till.
+
+    Lines are ``CartLine`` rows, one per product, read and written one line
+    at a time, so every worker process sees the same cart and the cost of a
+    mutation does not depend on the size of the cart. Every line holds a
+    stock reservation for its quantity while the cart is in use.
+    """
+
+    def __init__(self, user, till='default'):
+        self.user = user
+        self.till = till
+
+    @classmethod
+    def for_request(cls, request):
+        return cls(request.user, get_till_id(request))
+
+    def _rows(self):
+        return CartLine.objects.filter(user=self.user, till=self.till)
+
+    def lines(self):
+        """Current cart lines as ``{product_id: (quantity, unit_price)}``"""
+        return {
+            product_id: (quantity, unit_price)
+            for product_id, quantity, unit_price in self._rows().values_list(
+                'product_id', 'quantity', 'unit_price'
+            )
+        }
+
+    def get(self, product_id):
+        """``(quantity, unit_price)`` of one line, or ``None``"""
+        return self._rows().filter(product_id=int(product_id)).values_list('quantity', 'unit_price').first()
+
+    def set_line(self, product_id, quantity, unit_price):
+        """Write one line; raises ``ValidationError`` if the stock cannot be reserved"""
+        product_id = int(product_id)
+        quantity = Decimal(str(quantity))
+        unit_price = Decimal(str(unit_price))
+
+        reserve(self.user, self.till, product_id, stock_decrement(quantity))
+
+        if self._rows().filter(product_id=product_id).update(quantity=quantity, unit_price=unit_price):
+            return
+        try:
+            with transaction.atomic():
+                CartLine.objects.create(
+                    user=self.user,
+                    till=self.till,
+                    product_id=product_id,
+                    quantity=quantity,
+                    unit_price=unit_price
+                )
+        except IntegrityError:
+            # Another request added the line first
+            self._rows().filter(product_id=product_id).update(quantity=quantity, unit_price=unit_price)
+
+    def remove_line(self, product_id):
+        product_id = int(product_id)
+        self._rows().filter(product_id=product_id).delete()
+        release(self.user, self.till, [product_id])
+
+    def clear(self, product_ids=None):
+        """Empty the cart, or only the lines of ``product_ids``, e.g. the ones just billed"""
+        rows = self._rows()
+        if product_ids is not None:
+            rows = rows.filter(product_id__in=product_ids)
+        rows.delete()
+        release(self.user, self.till, product_ids)
+
+    def as_dict(self):
+        """Cart in the JSON shape the POS screens render"""
+        lines = self.lines()
+        if not lines:
+            return {}
+
+        products = Product.objects.filter(id__in=lines.keys()).values('id', 'name', 'stock', 'unit')
+        cart = {}
+        for product in products:
+            quantity, unit_price = lines[product['id']]
+            cart[str(product['id'])] = {
+                'name': product['name'],
+                'price': float(unit_price),
+                'quantity': float(quantity) if product['unit'] in FRACTIONAL_UNITS else int(quantity),
+                'stock': product['stock'],
+                'unit': product['unit']
+            }
+        return cart
@@ -0,0 +1,328 @@
+"""
+Bill commit pipeline shared by the POS checkout and the billing API
+"""
+import math
+from decimal import Decimal, InvalidOperation
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Case, When, F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from events.outbox import emit_bill_committed
+from products.models import Product, StockMovement
+from .credit import record_credit_sale
+from .customer_stats import record_bill
+from .models import Bill, BillItem, Customer
+from .pricing import price_bill
+from .phones import find_customer
+from .receipts import prerender_receipt
+from .reservations import release_expired, take_reservations, unreserve_expression
+from .sequences import allocate_bill_number, format_bill_number, reserve_block
+
+# Units sold by weight/volume; everything else is sold in whole numbers
+FRACTIONAL_UNITS = ('kg', 'liter')
+
+
+def normalize_quantity(quantity, unit):
+    """Coerce a cart quantity to the precision allowed for the product unit"""
+    quantity = float(quantity)
+    if not math.isfinite(quantity):
+        raise ValueError('Quantity must be a finite number')
+    if unit in FRACTIONAL_UNITS:
+        return Decimal(str(quantity))
+    return Decimal(int(quantity))
+
+
+def stock_decrement(quantity):
+    """Whole units to take off ``Product.stock`` for a sold quantity"""
+    # Stock is an integer column, so part of a kg/liter uses up a whole unit
+    return math.ceil(quantity)
+
+
+def _product_id(value):
+    """Product id of a cart line as an int; anything else is a validation error"""
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        raise ValidationError(f'Product {value} not found')
+
+
+def _reserved_items(shop, lines, held):
+    """
+    Bill items for cart lines whose stock is already reserved; prices are read without locking.
+
+    Quantities are normalized to the product unit as in ``_checked_items``.
+    Returns ``None`` when the till's reservations do not cover every line.
+    """
+    products = {
+        product_id: (name, unit, sale_price)
+        for product_id, name, unit, sale_price in Product.objects.filter(
+            id__in={product_id for product_id, _ in lines}, shop=shop
+        ).values_list('id', 'name', 'unit', 'sale_price')
+    }
+
+    items = []
+    sold = {}
+    for product_id, quantity in lines:
+        if product_id not in products:
+            raise ValidationError(f'Product {product_id} not found')
+        name, unit, sale_price = products[product_id]
+        try:
+            quantity = normalize_quantity(quantity, unit)
+        except (ValueError, TypeError, InvalidOperation):
+            raise ValidationError(f'Invalid quantity for {name}')
+
+        if quantity <= 0:
+            continue
+
+        sold[product_id] = sold.get(product_id, 0) + quantity
+        if stock_decrement(sold[product_id]) > held.get(product_id, 0):
+            return None
+        items.append(BillItem(
+            product_id=product_id,
+            quantity=quantity,
+            unit_price=sale_price
+        ))
+    return items, sold
+
+
+def _checked_items(shop, lines, held):
+    """Bill items for ``lines``, validated against the products' unreserved stock"""
+    product_ids = {str(product_id) for product_id, _ in lines}
+    products = {
+        str(product.id): product
+        for product in Product.objects.select_for_update().filter(
+            id__in=product_ids, shop=shop
+        )
+    }
+    # Abandoned carts may still be holding units past their expiry
+    if products and release_expired(product_ids=[product.id for product in products.values()]):
+        for product_id, reserved in Product.objects.filter(id__in=products.keys()).values_list('id', 'reserved'):
+            products[str(product_id)].reserved = reserved
+
+    items = []
+    sold = {}
+    for product_id, quantity in lines:
+        product = products.get(str(product_id))
+        if product is None:
+            raise ValidationError(f'Product {product_id} not found')
+
+        try:
+            quantity = normalize_quantity(quantity, product.unit)
+        except (ValueError, TypeError, InvalidOperation):
+            raise ValidationError(f'Invalid quantity for {product.name}')
+
+        if quantity <= 0:
+            continue
+
+        # Units other carts hold are not for sale; this cart's own are
+        sold[product.id] = sold.get(product.id, 0) + quantity
+        if product.stock - product.reserved + held.get(product.id, 0) < stock_decrement(sold[product.id]):
+            raise ValidationError(f'Insufficient stock for {product.name}')
+
+        items.append(BillItem(
+            product=product,
+            quantity=quantity,
+            unit_price=product.sale_price
+        ))
+    return items, sold
+
+
+def commit_bill(shop, lines, customer_name='', customer_phone='', payment_type='cash',
+                discount=0, client_key=None, date=None, bill_number=None, customer=None, held_by=None):
+    """
+    Write a bill, its items and the stock decrements in one transaction.
+
+    ``lines`` is an iterable of ``(product_id, quantity)`` tuples.
+    All products are loaded with a single query, validated in memory and then
+    written with one bulk insert, one conditional UPDATE and one insert into
+    the stock journal, so the number of queries does not grow with the
+    number of lines. Every line is priced at the product's ``sale_price``
+    and the totals with the shop's rules; only the ``discount`` comes from
+    the till.
+    Raises ``ValidationError`` without writing anything if a line or the
+    discount is invalid.
+
+    ``held_by`` is the ``(user, till)`` whose cart the lines come from. When
+    the cart's stock reservations cover every line the products are neither
+    locked nor checked for stock: the reservations become the stock decrement.
+
+    ``client_key`` is the idempotency key of a bill recorded offline and
+    ``date`` the time it was rung up at the till. Without an explicit
+    ``customer`` the bill is linked to the shop's customer with the same
+    phone number, if there is one. Udhaar bills always need a customer to
+    post the credit to; one is created from the phone number if needed.
+    """
+    lines = [(_product_id(product_id), quantity) for product_id, quantity in lines]
+    if not lines:
+        raise ValidationError('Cart is empty')
+
+    # Taken in its own short transaction so tills never queue on the counter
+    # row for the length of a checkout; a failed checkout leaves a gap
+    bill_number = bill_number or allocate_bill_number(shop)
+    customer = customer or find_customer(shop, customer_phone)
+
+    with transaction.atomic():
+        held = take_reservations(*held_by, product_ids=[product_id for product_id, _ in lines]) if held_by else {}
+        reserved = _reserved_items(shop, lines, held) if held else None
+        items, sold = reserved or _checked_items(shop, lines, held)
+
+        if not items:
+            raise ValidationError('Cart is empty')
+
+        # Priced on the server; the till's own totals are never trusted
+        totals = price_bill(shop, [(item.quantity, item.unit_price) for item in items], discount)
+        for item, line_total in zip(items, totals.line_totals):
+            item.total_price = line_total
+
+        if payment_type == 'udhaar' and customer is None:
+            if not customer_phone:
+                raise ValidationError('Customer phone is required for udhaar bills')
+            customer = Customer.objects.create(
+                shop=shop,
+                name=customer_name or customer_phone,
+                phone=customer_phone
+            )
+
+        bill = Bill.objects.create(
+            bill_number=bill_number,
+            shop=shop,
+            customer_name=customer_name,
+            customer_phone=customer_phone,
+            customer=customer,
+            payment_type=payment_type,
+            subtotal=totals.subtotal,
+            tax=totals.tax,
+            discount=totals.discount,
+            total=totals.total,
+            client_key=client_key
+        )
+        if date is not None:
+            # auto_now_add ignores a passed value, so keep the till's sale time explicitly
+            Bill.objects.filter(pk=bill.pk).update(date=date)
+            bill.date = date
+
+        for item in items:
+            item.bill = bill
+        BillItem.objects.bulk_create(items)
+        emit_bill_committed(bill, items)
+
+        # One UPDATE for every product on the bill; clamp at zero like the old per-row save.
+        # The catalog version is left alone: tills read sold stock from the journal
+        changes = {
+            'stock': Greatest(
+                Case(*[
+                    When(id=product_id, then=F('stock') - Value(stock_decrement(quantity)))
+                    for product_id, quantity in sold.items()
+                ], default=F('stock')),
+                Value(0)
+            ),
+        }
+        if held:
+            # The cart's reserved units leave ``reserved`` as they leave ``stock``
+            changes['reserved'] = unreserve_expression(held)
+        Product.objects.filter(id__in=set(sold) | set(held)).update(**changes)
+        StockMovement.objects.bulk_create([
+            StockMovement(shop=shop, product_id=product_id, kind='sale', change=-stock_decrement(quantity), bill=bill)
+            for product_id, quantity in sold.items() if stock_decrement(quantity)
+        ])
+
+        record_bill(bill)
+        record_credit_sale(bill)
+
+        transaction.on_commit(lambda: prerender_receipt(bill))
+
+    return bill
+
+
+def _offline_sale_time(value):
+    """Parse the till's timestamp for an offline bill; ignore missing or future values"""
+    if not value:
+        return None
+    try:
+        date = parse_datetime(str(value))
+    except ValueError:
+        return None
+    if date is None:
+        return None
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date if date <= timezone.now() else None
+
+
+def commit_bill_batch(shop, bills):
+    """
+    Commit bills recorded offline by a till, all in one transaction.
+
+    Each bill carries a client-generated ``client_key``; bills whose key is
+    already known are reported as duplicates instead of being written again,
+    so a till can safely retry an upload. Every bill gets a savepoint, so one
+    invalid bill is reported without rolling back the rest of the batch.
+    Items are priced at today's ``sale_price``; a ``unit_price`` sent by
+    the till is ignored. Returns one result dict per bill, in input order.
+    """
+    keys = [str(bill.get('client_key') or '')[:64] for bill in bills]
+    existing = {
+        key: (bill_id, bill_number)
+        for key, bill_id, bill_number in Bill.objects.filter(
+            shop=shop, client_key__in=[key for key in keys if key]
+        ).values_list('client_key', 'id', 'bill_number')
+    }
+    valid_payment_types = [choice[0] for choice in Bill.PAYMENT_CHOICES]
+
+    results = []
+    with transaction.atomic():
+        # One counter update numbers the whole batch
+        day = timezone.now().date()
+        pending = sum(1 for key in set(keys) if key and key not in existing)
+        next_value, _ = reserve_block(shop.id, day, pending) if pending else (0, 0)
+
+        for key, data in zip(keys, bills):
+            result = {'client_key': key}
+            results.append(result)
+
+            if not key:
+                result.update(status='error', error='client_key is required')
+                continue
+            if key in existing:
+                bill_id, bill_number = existing[key]
+                result.update(status='duplicate', bill_id=bill_id, bill_number=bill_number)
+                continue
+
+            try:
+                payment_type = data.get('payment_type', 'cash')
+                with transaction.atomic():
+                    bill = commit_bill(
+                        shop,
+                        [
+                            (item.get('product_id'), item.get('quantity', 0))
+                            for item in data.get('items', [])
+                        ],
+                        customer_name=str(data.get('customer_name', '')).strip()[:100],
+                        customer_phone=str(data.get('customer_phone', '')).strip()[:15],
+                        payment_type=payment_type if payment_type in valid_payment_types else 'cash',
+                        discount=Decimal(str(data.get('discount', 0))),
+                        client_key=key,
+                        date=_offline_sale_time(data.get('created_at')),
+                        bill_number=format_bill_number(shop.id, day, next_value)
+                    )
+                next_value += 1
+            except ValidationError as e:
+                result.update(status='error', error=' '.join(e.messages))
+                continue
+            except (ValueError, TypeError, AttributeError, InvalidOperation):
+                result.update(status='error', error='Invalid bill data')
+                continue
+            except IntegrityError:
+                # The same key arrived twice in this batch or from a parallel upload
+                duplicate = Bill.objects.filter(shop=shop, client_key=key).values_list('id', 'bill_number').first()
+                if duplicate is None:
+                    raise
+                result.update(status='duplicate', bill_id=duplicate[0], bill_number=duplicate[1])
+                continue
+
+            existing[key] = (bill.id, bill.bill_number)
+            result.update(status='created', bill_id=bill.id, bill_number=bill.bill_number, total=str(bill.total))
+
+    return results
@@ -0,0 +1,148 @@
+"""
+Udhaar (credit) ledger
+
+Every credit sale, repayment and adjustment is appended to
+``CreditLedgerEntry`` with the customer's balance after it, and the current
+balance is kept on ``CustomerStats.outstanding_udhaar``. Receivables screens
+read those two tables through their indexes, so they cost the same with a
+month of history as with ten years of it.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+from .models import CreditLedgerEntry, CustomerStats
+
+# Aging buckets, in days since the credit sale
+AGING_BUCKETS = (30, 60)
+
+# Customers are reminded once credit older than this is still unpaid
+REMINDER_AFTER_DAYS = 30
+
+
+def _stats_row(customer):
+    """The customer's stats row, locked for the rest of the transaction"""
+    try:
+        with transaction.atomic():
+            CustomerStats.objects.get_or_create(customer_id=customer.id, defaults={'shop_id': customer.shop_id})
+    except IntegrityError:
+        # Created concurrently by a checkout for the same customer
+        pass
+    return CustomerStats.objects.select_for_update().get(customer_id=customer.id)
+
+
+def post_entry(customer, kind, amount, bill=None, note='', created_at=None):
+    """
+    Append one ledger entry and move the customer's balance by ``amount``.
+
+    Sales and positive adjustments increase what the customer owes,
+    repayments and negative adjustments reduce it. The stats row is locked
+    while the entry is written, so ``balance_after`` is a true running
+    balance even with several tills posting for the same customer.
+    """
+    amount = Decimal(str(amount))
+    if kind == 'repayment':
+        amount = -abs(amount)
+    elif kind == 'sale':
+        amount = abs(amount)
+    if not amount:
+        raise ValidationError('Amount must not be zero')
+
+    with transaction.atomic():
+        stats = _stats_row(customer)
+        balance = stats.outstanding_udhaar + amount
+        CustomerStats.objects.filter(pk=stats.pk).update(outstanding_udhaar=balance)
+        return CreditLedgerEntry.objects.create(
+            shop_id=customer.shop_id,
+            customer=customer,
+            kind=kind,
+            amount=amount,
+            balance_after=balance,
+            bill=bill,
+            note=note[:200],
+            created_at=created_at or timezone.now()
+        )
+
+
+def record_credit_sale(bill):
+    """Post an udhaar bill to its customer's ledger; called inside the checkout transaction"""
+    if bill.payment_type != 'udhaar' or bill.customer_id is None or not bill.total:
+        return None
+    return post_entry(bill.customer, 'sale', bill.total, bill=bill, note=bill.bill_number, created_at=bill.date)
+
+
+def receivables(shop):
+    """Customers of the shop who owe anything, largest balance first"""
+    return (
+        CustomerStats.objects.filter(shop=shop, outstanding_udhaar__gt=0)
+        .select_related('customer')
+        .order_by('-outstanding_udhaar', 'customer_id')
+    )
+
+
+def aging_report(shop, now=None):
+    """
+    Outstanding udhaar per customer split into 0-30, 31-60 and 60+ day buckets.
+
+    Repayments settle the oldest credit first, so a balance is made up of the
+    most recent credit sales: whatever the last 30 days of sales do not
+    explain falls into 31-60, and the rest is older than 60 days. Only sales
+    from the last 60 days are read, whatever the length of the history.
+    Returns ``(rows, totals)``.
+    """
+    now = now or timezone.now()
+    recent, older = (now - timedelta(days=days) for days in AGING_BUCKETS)
+
+    debtors = list(receivables(shop))
+    sales = {
+        row['customer_id']: row
+        for row in CreditLedgerEntry.objects.filter(
+            shop=shop, kind='sale', created_at__gt=older, customer_id__in=[stats.customer_id for stats in debtors]
+        ).values('customer_id').annotate(
+            current=Sum('amount', filter=Q(created_at__gt=recent)),
+            middle=Sum('amount', filter=Q(created_at__lte=recent)),
+        ).order_by()
+    }
+
+    rows = []
+    totals = {'current': Decimal(0), 'middle': Decimal(0), 'overdue': Decimal(0), 'balance': Decimal(0)}
+    for stats in debtors:
+        balance = stats.outstanding_udhaar
+        credit = sales.get(stats.customer_id, {})
+        current = min(balance, credit.get('current') or 0)
+        middle = min(balance - current, credit.get('middle') or 0)
+        row = {
+            'customer': stats.customer,
+            'balance': balance,
+            'current': current,
+            'middle': middle,
+            'overdue': balance - current - middle,
+            'last_purchase': stats.last_purchase,
+        }
+        rows.append(row)
+        for key in totals:
+            totals[key] += row[key]
+    return rows, totals
+
+
+def reminder_list(shop, days=REMINDER_AFTER_DAYS, now=None):
+    """Customers with credit older than ``days`` still unpaid, largest overdue amount first"""
+    now = now or timezone.now()
+    since = now - timedelta(days=days)
+
+    debtors = list(receivables(shop))
+    recent = dict(
+        CreditLedgerEntry.objects.filter(
+            shop=shop, kind='sale', created_at__gt=since, customer_id__in=[stats.customer_id for stats in debtors]
+        ).values('customer_id').annotate(total=Sum('amount')).values_list('customer_id', 'total').order_by()
+    )
+
+    reminders = []
+    for stats in debtors:
+        due = stats.outstanding_udhaar - (recent.get(stats.customer_id) or 0)
+        if due > 0:
+            reminders.append({'customer': stats.customer, 'balance': stats.outstanding_udhaar, 'due': due})
+    reminders.sort(key=lambda row: row['due'], reverse=True)
+    return reminders
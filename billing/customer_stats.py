@@ -0,0 +1,91 @@
+"""
+Incrementally maintained per-customer lifetime stats
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Min, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, Least
+from .models import Bill, CreditLedgerEntry, Customer, CustomerStats
+
+
+def _apply_bill(customer_id, total, date):
+    return CustomerStats.objects.filter(customer_id=customer_id).update(
+        bill_count=F('bill_count') + 1,
+        total_spent=F('total_spent') + Value(total),
+        first_purchase=Coalesce(Least(F('first_purchase'), Value(date)), Value(date)),
+        last_purchase=Coalesce(Greatest(F('last_purchase'), Value(date)), Value(date)),
+    )
+
+
+def record_bill(bill):
+    """
+    Add a committed bill to its customer's stats.
+
+    Call inside the transaction that writes the bill so the two never
+    disagree. The row is updated in place with F() expressions, so concurrent
+    checkouts for the same customer do not lose each other's totals.
+    The udhaar balance is moved by the credit ledger, not here.
+    """
+    if bill.customer_id is None:
+        return
+
+    if _apply_bill(bill.customer_id, bill.total, bill.date):
+        return
+
+    try:
+        with transaction.atomic():
+            CustomerStats.objects.create(
+                customer_id=bill.customer_id,
+                shop_id=bill.shop_id,
+                first_purchase=bill.date,
+                last_purchase=bill.date,
+                bill_count=1,
+                total_spent=bill.total
+            )
+    except IntegrityError:
+        # Another checkout created the row first
+        _apply_bill(bill.customer_id, bill.total, bill.date)
+
+
+def rebuild_customer_stats(shop=None, customer_ids=None):
+    """Recompute stats from the bills and the credit ledger; repairs drift after bulk edits or backfills"""
+    bills = Bill.objects.filter(customer__isnull=False)
+    ledger = CreditLedgerEntry.objects.all()
+    stats = CustomerStats.objects.all()
+    if shop is not None:
+        bills = bills.filter(shop=shop)
+        ledger = ledger.filter(shop=shop)
+        stats = stats.filter(shop=shop)
+    if customer_ids is not None:
+        bills = bills.filter(customer_id__in=customer_ids)
+        ledger = ledger.filter(customer_id__in=customer_ids)
+        stats = stats.filter(customer_id__in=customer_ids)
+
+    rows = bills.values('customer_id', 'customer__shop_id').annotate(
+        bill_count=Count('id'),
+        total_spent=Sum('total'),
+        first_purchase=Min('date'),
+        last_purchase=Max('date')
+    ).order_by()
+    balances = dict(ledger.values('customer_id').annotate(balance=Sum('amount')).values_list('customer_id', 'balance').order_by())
+    totals = {row['customer_id']: row for row in rows}
+    # Customers with ledger entries but no linked bills still carry a balance
+    for customer_id, shop_id in Customer.objects.filter(id__in=set(balances) - set(totals)).values_list('id', 'shop_id'):
+        totals[customer_id] = {
+            'customer_id': customer_id, 'customer__shop_id': shop_id, 'bill_count': 0,
+            'total_spent': 0, 'first_purchase': None, 'last_purchase': None
+        }
+
+    with transaction.atomic():
+        stats.delete()
+        CustomerStats.objects.bulk_create([
+            CustomerStats(
+                customer_id=row['customer_id'],
+                shop_id=row['customer__shop_id'],
+                first_purchase=row['first_purchase'],
+                last_purchase=row['last_purchase'],
+                bill_count=row['bill_count'],
+                total_spent=row['total_spent'],
+                outstanding_udhaar=balances.get(row['customer_id'], 0)
+            )
+            for row in totals.values()
+        ], batch_size=1000)
@@ -0,0 +1,103 @@
+"""
+Bulk receipt export as a streamed ZIP archive
+"""
+import multiprocessing
+import os
+import zipfile
+import django
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from django.conf import settings
+from .receipts import receipt_data_many, render_pdf
+
+# Bills read from the database and handed to the workers at a time
+EXPORT_CHUNK_SIZE = 200
+
+# Below this many bills starting worker processes costs more than it saves
+MIN_PARALLEL_EXPORT = 50
+
+
+class _ZipBuffer:
+    """Write-only file object that hands back what the ZIP writer produced so far"""
+
+    def __init__(self):
+        self.chunks = []
+        self.offset = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _export_workers():
+    return getattr(settings, 'RECEIPT_EXPORT_WORKERS', None) or os.cpu_count() or 1
+
+
+def _chunks(bills):
+    chunk = []
+    for bill in bills.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        chunk.append(bill)
+        if len(chunk) == EXPORT_CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _rendered(bills, workers):
+    """``(filename, pdf)`` pairs for ``bills``, in whatever order the workers finish"""
+    if workers <= 1:
+        for chunk in _chunks(bills):
+            for data in receipt_data_many(chunk):
+                yield f"bill_{data['bill_number']}.pdf", render_pdf(data)
+        return
+
+    # Spawned workers start from a fresh interpreter instead of a fork of the
+    # request thread's state; they only render and never touch the database
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup) as pool:
+        pending = {}
+        for chunk in _chunks(bills):
+            for data in receipt_data_many(chunk):
+                pending[pool.submit(render_pdf, data)] = f"bill_{data['bill_number']}.pdf"
+
+            # Keep roughly one chunk in flight so memory stays flat however many bills there are
+            while len(pending) > EXPORT_CHUNK_SIZE:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future.result()
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+
+
+def receipt_archive(bills):
+    """
+    Yield a ZIP archive of the PDF receipts of ``bills`` piece by piece.
+
+    Receipts are rendered in a process pool and written to the archive as
+    they complete; only the chunk of bills in flight and each finished file
+    are held in memory, never the archive itself.
+    """
+    bills = bills.select_related('shop').order_by('id')
+    workers = _export_workers() if bills.count() >= MIN_PARALLEL_EXPORT else 1
+
+    buffer = _ZipBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for filename, pdf in _rendered(bills, workers):
+            archive.writestr(filename, pdf)
+            yield buffer.drain()
+    yield buffer.drain()
@@ -0,0 +1,205 @@
+"""
+Full-text search over bills and customers
+
+On SQLite the searchable columns are mirrored into FTS5 tables with the
+trigram tokenizer, kept in sync by triggers, so any substring of three or
+more characters is an index lookup. Other backends (or SQLite builds without
+FTS5) use the ``SearchTrigram`` table maintained by signal handlers instead.
+Queries shorter than three characters fall back to ``icontains``.
+"""
+from django.db import connection
+from django.db.models import Count, Q
+from django.db.models.expressions import RawSQL
+from .models import Bill, Customer, SearchTrigram
+
+MIN_QUERY_LENGTH = 3
+
+# Matches up to this many are passed to the listing query as a literal id list
+MAX_FILTER_IDS = 2000
+
+SEARCH_MODELS = {
+    'bill': (Bill, ('bill_number', 'customer_name', 'customer_phone')),
+    'customer': (Customer, ('name', 'phone')),
+}
+
+
+def _fts_table(kind):
+    return f'billing_{kind}_fts'
+
+
+def _fts_statements(kind):
+    model, fields = SEARCH_MODELS[kind]
+    table = model._meta.db_table
+    fts = _fts_table(kind)
+    columns = ', '.join(fields)
+    new_values = ', '.join(f'new.{field}' for field in fields)
+    old_values = ', '.join(f'old.{field}' for field in fields)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"{columns}, content='{table}', content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {columns} ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); "
+        f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new_values}); END",
+    ]
+
+
+_fts_available = None
+
+
+def fts_available():
+    """Whether this database carries the FTS5 tables"""
+    global _fts_available
+    if _fts_available is None:
+        if connection.vendor != 'sqlite':
+            _fts_available = False
+        else:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [_fts_table('bill')])
+                _fts_available = cursor.fetchone() is not None
+    return _fts_available
+
+
+def ensure_search_schema(schema_connection=None, rebuild=False):
+    """
+    Create the FTS5 tables and their triggers if they are missing.
+
+    Safe to run repeatedly; SQLite drops the triggers whenever a migration
+    rebuilds the underlying table, so this also runs after every migrate.
+    Returns ``False`` when the database cannot host FTS5 tables.
+    """
+    global _fts_available
+    schema_connection = schema_connection or connection
+    if schema_connection.vendor != 'sqlite':
+        return False
+
+    with schema_connection.cursor() as cursor:
+        for kind in SEARCH_MODELS:
+            fts = _fts_table(kind)
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [fts])
+            created = cursor.fetchone() is None
+            try:
+                for statement in _fts_statements(kind):
+                    cursor.execute(statement)
+            except Exception:
+                # SQLite built without FTS5 or older than 3.34 (no trigram tokenizer)
+                return False
+            if created or rebuild:
+                cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+    _fts_available = None
+    return True
+
+
+def _match_expression(query):
+    # One quoted phrase: with the trigram tokenizer this is a substring match
+    return '"' + query.replace('"', '""') + '"'
+
+
+def _text_filter(fields, query):
+    condition = Q()
+    for field in fields:
+        condition |= Q(**{f'{field}__icontains': query})
+    return condition
+
+
+def trigrams(text):
+    text = ' '.join((text or '').casefold().split())
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _trigram_matches(kind, shop_id, query):
+    """Ids of ``kind`` objects in the shop whose fields contain every trigram of ``query``"""
+    grams = trigrams(query)
+    return (
+        SearchTrigram.objects.filter(shop_id=shop_id, kind=kind, gram__in=grams)
+        .values('object_id')
+        .annotate(matched=Count('gram', distinct=True))
+        .filter(matched=len(grams))
+        .values('object_id')
+    )
+
+
+def filter_by_text(queryset, kind, shop, query):
+    """Restrict a ``kind`` queryset of ``shop`` to rows containing ``query``"""
+    query = (query or '').strip()
+    if not query:
+        return queryset
+
+    model, fields = SEARCH_MODELS[kind]
+    if len(query) < MIN_QUERY_LENGTH:
+        return queryset.filter(_text_filter(fields, query))
+
+    if fts_available():
+        fts = _fts_table(kind)
+        table = model._meta.db_table
+        # Joined to the shop's rows, so other shops' matches never use up the limit
+        match = (
+            f'SELECT {fts}.rowid FROM {fts} JOIN {table} ON {table}.id = {fts}.rowid '
+            f'WHERE {fts} MATCH %s AND {table}.shop_id = %s'
+        )
+        params = [_match_expression(query), shop.id]
+        with connection.cursor() as cursor:
+            cursor.execute(f'{match} LIMIT %s', params + [MAX_FILTER_IDS + 1])
+            ids = [row[0] for row in cursor.fetchall()]
+        if len(ids) <= MAX_FILTER_IDS:
+            # A short id list lets the planner fetch the matches by primary key
+            # instead of walking the listing index and probing every row
+            return queryset.filter(id__in=ids)
+        return queryset.filter(id__in=RawSQL(match, params))
+
+    # Trigram candidates can include false positives, so confirm the substring
+    return queryset.filter(id__in=_trigram_matches(kind, shop.id, query)).filter(_text_filter(fields, query))
+
+
+def search_ids(kind, shop, query, limit=20):
+    """Ids of the shop's ``kind`` objects matching ``query``, best matches first"""
+    query = (query or '').strip()
+    if not query:
+        return []
+
+    model, fields = SEARCH_MODELS[kind]
+    if len(query) >= MIN_QUERY_LENGTH and fts_available():
+        fts = _fts_table(kind)
+        table = model._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT {fts}.rowid FROM {fts} JOIN {table} ON {table}.id = {fts}.rowid '
+                f'WHERE {fts} MATCH %s AND {table}.shop_id = %s '
+                f'ORDER BY {fts}.rank, {fts}.rowid DESC LIMIT %s',
+                [_match_expression(query), shop.id, limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    queryset = filter_by_text(model.objects.filter(shop=shop), kind, shop, query)
+    return list(queryset.order_by('-id').values_list('id', flat=True)[:limit])
+
+
+def search_bill_ids(shop, query, limit=20):
+    return search_ids('bill', shop, query, limit)
+
+
+def search_customer_ids(shop, query, limit=20):
+    return search_ids('customer', shop, query, limit)
+
+
+def index_object(kind, instance):
+    """Rewrite the trigram rows of one object (fallback backends only)"""
+    if fts_available():
+        return
+    _, fields = SEARCH_MODELS[kind]
+    grams = set()
+    for field in fields:
+        grams |= trigrams(getattr(instance, field))
+    SearchTrigram.objects.filter(kind=kind, object_id=instance.id).delete()
+    SearchTrigram.objects.bulk_create([
+        SearchTrigram(shop_id=instance.shop_id, kind=kind, object_id=instance.id, gram=gram)
+        for gram in grams
+    ])
+
+
+def unindex_object(kind, object_id):
+    if not fts_available():
+        SearchTrigram.objects.filter(kind=kind, object_id=object_id).delete()
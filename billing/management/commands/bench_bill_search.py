@@ -0,0 +1,76 @@
+import random
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from users.models import Shop
+from billing.fulltext import filter_by_text, search_bill_ids
+from billing.models import Bill
+
+NAMES = ['Ahmed', 'Ali', 'Ayesha', 'Bilal', 'Fatima', 'Hamza', 'Hassan', 'Imran', 'Khadija', 'Omar',
+         'Saad', 'Sana', 'Tariq', 'Usman', 'Zainab']
+SURNAMES = ['Khan', 'Malik', 'Qureshi', 'Sheikh', 'Butt', 'Chaudhry', 'Raza', 'Siddiqui']
+QUERIES = ['khan', 'ayesha mal', '0300123', '1202', 'siddiqui', 'zzzz']
+
+
+class Command(BaseCommand):
+    help = 'Compare full-text bill search against the icontains OR-chain at several table sizes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'bills':>9} {'icontains ms':>13} {'filter ms':>10} {'ranked ms':>10} {'speedup':>8}")
+        for size in [int(size) for size in options['sizes'].split(',')]:
+            # Everything is created inside a transaction that is rolled back afterwards
+            with transaction.atomic():
+                self._bench(size, options['repeat'])
+                transaction.set_rollback(True)
+
+    def _bench(self, size, repeat):
+        rng = random.Random(size)
+        user = User.objects.create(username=f'bench-bills-{size}-{time.time_ns()}')
+        shop = Shop.objects.create(name='Benchmark', address='-', whatsapp='-', owner=user)
+        Bill.objects.bulk_create([
+            Bill(
+                bill_number=f'B{shop.id}{i:09d}',
+                customer_name=f'{rng.choice(NAMES)} {rng.choice(SURNAMES)}',
+                customer_phone=f'03{rng.randrange(10 ** 9):09d}',
+                total=100,
+                shop=shop
+            )
+            for i in range(size)
+        ], batch_size=5000)
+
+        bills = Bill.objects.filter(shop=shop)
+
+        def page(queryset):
+            # What a listing page costs: the first page and the filtered count
+            list(queryset.order_by('-date', '-id').values_list('id', flat=True)[:50])
+            queryset.count()
+
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for query in QUERIES:
+                page(bills.filter(
+                    Q(bill_number__icontains=query) | Q(customer_name__icontains=query) | Q(customer_phone__icontains=query)
+                ))
+        orm_ms = (time.perf_counter() - started) * 1000 / (repeat * len(QUERIES))
+
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for query in QUERIES:
+                page(filter_by_text(bills, 'bill', shop, query))
+        filter_ms = (time.perf_counter() - started) * 1000 / (repeat * len(QUERIES))
+
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for query in QUERIES:
+                search_bill_ids(shop, query, limit=20)
+        ranked_ms = (time.perf_counter() - started) * 1000 / (repeat * len(QUERIES))
+
+        self.stdout.write(
+            f'{size:>9} {orm_ms:>13.2f} {filter_ms:>10.2f} {ranked_ms:>10.2f} {orm_ms / filter_ms:>7.1f}x'
+        )
@@ -0,0 +1,35 @@
+import random
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from billing.pricing import PricingRules
+
+
+class Command(BaseCommand):
+    help = 'Time server-side pricing of bills with many lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', default='10,50,200,1000')
+        parser.add_argument('--repeat', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        rules = {
+            'no tax': PricingRules(),
+            '17% on top': PricingRules(17),
+            '17% included': PricingRules(17, prices_include_tax=True),
+        }
+        self.stdout.write(f"{'lines':>6} " + ' '.join(f'{name + " ms":>16}' for name in rules))
+        for size in [int(size) for size in options['lines'].split(',')]:
+            lines = [
+                (Decimal(rng.randint(1, 5)) if i % 3 else Decimal(rng.randint(1, 2000)) / 1000,
+                 Decimal(rng.randint(100, 500000)) / 100)
+                for i in range(size)
+            ]
+            timings = []
+            for engine in rules.values():
+                started = time.perf_counter()
+                for _ in range(options['repeat']):
+                    engine.price(lines, discount=Decimal('10'))
+                timings.append((time.perf_counter() - started) * 1000 / options['repeat'])
+            self.stdout.write(f'{size:>6} ' + ' '.join(f'{ms:>16.4f}' for ms in timings))
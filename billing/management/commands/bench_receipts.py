@@ -0,0 +1,59 @@
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from billing.receipts import THERMAL_LAYOUTS, render_escpos, render_pdf, render_text
+
+
+class Command(BaseCommand):
+    help = 'Compare the reportlab PDF receipt against the thermal text and ESC/POS renderers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', default='5,20,60', help='Comma separated item counts per bill')
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        layout = THERMAL_LAYOUTS['thermal80']
+        self.stdout.write(
+            f"{'items':>6} {'pdf ms':>9} {'text ms':>9} {'escpos ms':>10} {'pdf KB':>7} {'escpos KB':>10} {'speedup':>8}"
+        )
+
+        for count in [int(count) for count in options['items'].split(',')]:
+            data = self._receipt(count)
+            repeat = options['repeat']
+
+            pdf_ms, pdf = self._time(render_pdf, (data,), max(repeat // 20, 5))
+            text_ms, _ = self._time(render_text, (data, layout), repeat)
+            escpos_ms, escpos = self._time(render_escpos, (data, layout), repeat)
+
+            self.stdout.write(
+                f'{count:>6} {pdf_ms:>9.3f} {text_ms:>9.3f} {escpos_ms:>10.3f} '
+                f'{len(pdf) / 1024:>7.1f} {len(escpos) / 1024:>10.1f} {pdf_ms / escpos_ms:>7.0f}x'
+            )
+
+    def _time(self, render, args, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            output = render(*args)
+        return (time.perf_counter() - started) * 1000 / repeat, output
+
+    def _receipt(self, count):
+        items = []
+        for i in range(count):
+            quantity = Decimal('1.500') if i % 4 == 0 else Decimal(i % 3 + 1)
+            unit_price = Decimal('149.99') + i
+            items.append((f'Benchmark Product {i}', quantity, unit_price, (quantity * unit_price).quantize(Decimal('0.01'))))
+        subtotal = sum(item[3] for item in items)
+        return {
+            'shop_name': 'Benchmark Store',
+            'shop_address': '12 Main Bazaar, Lahore',
+            'bill_number': '1202610170001',
+            'date': '17 Oct 2026, 10:00',
+            'payment': 'Cash',
+            'customer_name': 'Walk-in Customer',
+            'customer_phone': '03001234567',
+            'items': items,
+            'subtotal': subtotal,
+            'tax': Decimal('0'),
+            'discount': Decimal('10'),
+            'total': subtotal - 10,
+        }
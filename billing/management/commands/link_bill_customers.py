@@ -0,0 +1,66 @@
+from collections import defaultdict
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from billing.credit import record_credit_sale
+from billing.customer_stats import rebuild_customer_stats
+from billing.models import Bill, Customer
+from billing.phones import normalize_phone
+
+
+class Command(BaseCommand):
+    help = 'Link historical bills to customers by normalized phone number, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shop', type=int, help='Only link bills of this shop')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        customers = Customer.objects.exclude(phone_normalized='')
+        if options['shop']:
+            customers = customers.filter(shop_id=options['shop'])
+
+        # Oldest customer wins when several share a number
+        by_phone = {}
+        for customer_id, shop_id, phone in customers.order_by('-id').values_list('id', 'shop_id', 'phone_normalized'):
+            by_phone[(shop_id, phone)] = customer_id
+
+        bills = Bill.objects.filter(customer__isnull=True).exclude(customer_phone='')
+        if options['shop']:
+            bills = bills.filter(shop_id=options['shop'])
+
+        linked = 0
+        linked_customers = set()
+        last_id = 0
+        while True:
+            # Walk the primary key so every batch is an index range, however far in
+            batch = list(
+                bills.filter(id__gt=last_id).order_by('id').values_list('id', 'shop_id', 'customer_phone')[:options['batch_size']]
+            )
+            if not batch:
+                break
+            last_id = batch[-1][0]
+
+            matches = defaultdict(list)
+            for bill_id, shop_id, phone in batch:
+                customer_id = by_phone.get((shop_id, normalize_phone(phone)))
+                if customer_id is not None:
+                    matches[customer_id].append(bill_id)
+
+            with transaction.atomic():
+                for customer_id, bill_ids in matches.items():
+                    linked += Bill.objects.filter(id__in=bill_ids).update(customer_id=customer_id)
+                # Udhaar bills that now have a customer move onto their credit ledger
+                udhaar_bills = Bill.objects.filter(
+                    id__in=[bill_id for bill_ids in matches.values() for bill_id in bill_ids],
+                    payment_type='udhaar',
+                    ledger_entry__isnull=True
+                ).select_related('customer').order_by('date', 'id')
+                for bill in udhaar_bills:
+                    record_credit_sale(bill)
+            linked_customers.update(matches)
+
+            self.stdout.write(f'Scanned up to bill {last_id}, {linked} linked so far')
+
+        if linked_customers:
+            rebuild_customer_stats(customer_ids=linked_customers)
+        self.stdout.write(self.style.SUCCESS(f'Linked {linked} bills to customers'))
@@ -0,0 +1,294 @@
+import contextlib
+import io
+import json
+import logging
+import math
+import multiprocessing
+import platform
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from decimal import Decimal
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from api.views import create_bill_api
+from products.models import Category, Product
+from users.models import Shop
+
+OPERATIONS = ('add_to_cart', 'update_cart', 'create_bill', 'create_bill_api')
+
+# Error texts of the database backends when writers collide
+LOCK_MARKERS = ('database is locked', 'deadlock', 'could not serialize', 'lock wait timeout')
+
+PERCENTILES = (50, 95, 99)
+
+
+def _host():
+    """A host name the deployment accepts, so requests pass ALLOWED_HOSTS"""
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*':
+            return host.lstrip('.')
+    return 'testserver'
+
+
+def _timed(samples, operation, call):
+    """Run one request, recording its latency, query count and error"""
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        try:
+            data = json.loads(call().content)
+            error = None if data.get('success') else str(data.get('error') or data.get('message') or 'Failed')
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        elapsed = (time.perf_counter() - started) * 1000
+    samples[operation].append((elapsed, len(queries), error))
+    return error is None
+
+
+def _cashier(job):
+    """One till ringing up ``job['bills']`` bills, through the POS cart or the billing API"""
+    rng = random.Random(job['seed'])
+    samples = {operation: [] for operation in OPERATIONS}
+    try:
+        user = User.objects.get(id=job['user_id'])
+        client = Client(HTTP_HOST=_host(), HTTP_X_TILL_ID=job['till'])
+        client.force_login(user)
+        factory = RequestFactory(HTTP_HOST=_host())
+
+        def post(url, data):
+            return lambda: client.post(url, json.dumps(data), content_type='application/json')
+
+        def post_api(data):
+            def call():
+                request = factory.post('/api/bills/', json.dumps(data), content_type='application/json')
+                request.user = user
+                return create_bill_api(request)
+            return call
+
+        for _ in range(job['bills']):
+            lines = rng.sample(job['products'], min(job['lines'], len(job['products'])))
+            if rng.random() < job['api_share']:
+                _timed(samples, 'create_bill_api', post_api({
+                    'items': [
+                        {'product_id': product_id, 'quantity': rng.randint(1, 3), 'unit_price': str(price)}
+                        for product_id, price in lines
+                    ],
+                    'payment_type': 'cash',
+                }))
+                continue
+
+            for product_id, _ in lines:
+                _timed(samples, 'add_to_cart', post('/billing/add-to-cart/', {'product_id': product_id, 'quantity': 1}))
+            product_id, _ = rng.choice(lines)
+            _timed(samples, 'update_cart', post('/billing/update-cart/', {'product_id': product_id, 'quantity': rng.randint(2, 3)}))
+            if not _timed(samples, 'create_bill', post('/billing/create-bill/', {'payment_type': 'cash'})):
+                # Start the next bill from an empty cart; if even that fails it starts from this one
+                try:
+                    client.post('/billing/clear-cart/')
+                except Exception:
+                    pass
+    finally:
+        connection.close()
+    return samples
+
+
+def _run_cashiers(jobs):
+    """Run tills concurrently, one thread each; returns their merged samples"""
+    merged = {operation: [] for operation in OPERATIONS}
+    with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+        for samples in pool.map(_cashier, jobs):
+            for operation, rows in samples.items():
+                merged[operation].extend(rows)
+    return merged
+
+
+def _percentile(values, percent):
+    """Nearest-rank percentile of sorted ``values``"""
+    return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+
+def _summary(rows):
+    latencies = sorted(row[0] for row in rows)
+    errors = [row[2] for row in rows if row[2] is not None]
+    summary = {
+        'requests': len(rows),
+        'errors': len(errors),
+        'lock_errors': sum(1 for error in errors if any(marker in error.lower() for marker in LOCK_MARKERS)),
+        'queries_mean': round(sum(row[1] for row in rows) / len(rows), 2) if rows else 0,
+        'queries_max': max((row[1] for row in rows), default=0),
+        'latency_ms': {},
+    }
+    if latencies:
+        summary['latency_ms'] = {f'p{percent}': round(_percentile(latencies, percent), 2) for percent in PERCENTILES}
+        summary['latency_ms']['mean'] = round(sum(latencies) / len(latencies), 2)
+        summary['latency_ms']['max'] = round(latencies[-1], 2)
+    # A few distinct messages are enough to tell what went wrong
+    summary['sample_errors'] = sorted(set(errors))[:5]
+    return summary
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test checkout: generate shops, catalogs and tills, then drive add-to-cart, update-cart and '
+        'create-bill (and the billing API) concurrently, reporting latency percentiles, bills/sec, '
+        'query counts and lock errors as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shops', type=int, default=2)
+        parser.add_argument('--products', type=int, default=200, help='Products per shop')
+        parser.add_argument('--tills', type=int, default=4, help='Concurrent tills per shop')
+        parser.add_argument('--bills', type=int, default=25, help='Bills rung up per till')
+        parser.add_argument('--lines', type=int, default=5, help='Products per bill')
+        parser.add_argument('--api-share', type=float, default=0.2, help='Share of bills sent through the billing API')
+        parser.add_argument('--processes', type=int, default=1, help='Split the tills over this many processes')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--compare', help='Results JSON of an earlier run to compare against')
+        parser.add_argument('--keep', action='store_true', help='Keep the generated shops, products and bills')
+
+    def handle(self, *args, **options):
+        if options['shops'] < 1 or options['tills'] < 1 or options['products'] < 1:
+            raise CommandError('--shops, --tills and --products must be at least 1')
+        if not 0 <= options['api_share'] <= 1:
+            raise CommandError('--api-share must be between 0 and 1')
+        baseline = self._load_baseline(options['compare'])
+
+        run_id = timezone.now().strftime('%Y%m%d%H%M%S')
+        users = self._create_shops(run_id, options)
+        jobs = [
+            {
+                'user_id': user.id,
+                'products': products,
+                'till': f'load-{till}',
+                'bills': options['bills'],
+                'lines': options['lines'],
+                'api_share': options['api_share'],
+                'seed': options['seed'] * 100003 + shop_number * 1009 + till,
+            }
+            for shop_number, (user, products) in enumerate(users)
+            for till in range(options['tills'])
+        ]
+
+        # Failed requests are counted in the results; their tracebacks would drown the report
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        try:
+            # The checkout view prints the traceback of every failed bill
+            with contextlib.redirect_stdout(io.StringIO()):
+                started = time.perf_counter()
+                samples = self._run(jobs, options['processes'])
+                elapsed = time.perf_counter() - started
+        finally:
+            request_logger.setLevel(level)
+            if not options['keep']:
+                User.objects.filter(id__in=[user.id for user, _ in users]).delete()
+
+        operations = {operation: _summary(rows) for operation, rows in samples.items() if rows}
+        bills = sum(
+            summary['requests'] - summary['errors']
+            for operation, summary in operations.items() if operation.startswith('create_bill')
+        )
+        results = {
+            'run': run_id,
+            'environment': {
+                'database': connection.vendor,
+                'django': django.get_version(),
+                'python': platform.python_version(),
+            },
+            'options': {
+                key: options[key]
+                for key in ('shops', 'products', 'tills', 'bills', 'lines', 'api_share', 'processes', 'seed')
+            },
+            'seconds': round(elapsed, 3),
+            'bills': bills,
+            'bills_per_sec': round(bills / elapsed, 2) if elapsed else 0,
+            'lock_errors': sum(summary['lock_errors'] for summary in operations.values()),
+            'operations': operations,
+        }
+
+        self._report(results, baseline)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def _load_baseline(self, path):
+        if not path:
+            return None
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Cannot read {path}: {e}')
+
+    def _create_shops(self, run_id, options):
+        """Shops with an owner and a catalog stocked well beyond what the run can sell"""
+        stock = options['tills'] * options['bills'] * options['lines'] * 3 + 100
+        users = []
+        for number in range(options['shops']):
+            user = User.objects.create_user(username=f'loadtest-{run_id}-{number}')
+            shop = Shop.objects.create(owner=user, name=f'Load test {number}', address='-', whatsapp='0')
+            category = Category.objects.create(shop=shop, name='Load test')
+            Product.objects.bulk_create([
+                Product(
+                    shop=shop, category=category, name=f'Load item {i}', barcode=f'LT{shop.id}-{i}',
+                    cost_price=Decimal(10 + i % 50), sale_price=Decimal(15 + i % 50), stock=stock
+                )
+                for i in range(options['products'])
+            ], batch_size=1000)
+            products = [
+                (product_id, str(price))
+                for product_id, price in Product.objects.filter(shop=shop).values_list('id', 'sale_price')
+            ]
+            users.append((user, products))
+        return users
+
+    def _run(self, jobs, processes):
+        if processes <= 1:
+            return _run_cashiers(jobs)
+
+        chunks = [jobs[i::processes] for i in range(processes) if jobs[i::processes]]
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else None)
+        merged = {operation: [] for operation in OPERATIONS}
+        with ProcessPoolExecutor(max_workers=len(chunks), mp_context=context) as pool:
+            for samples in pool.map(_run_cashiers, chunks):
+                for operation, rows in samples.items():
+                    merged[operation].extend(rows)
+        return merged
+
+    def _report(self, results, baseline):
+        self.stdout.write(
+            f"{results['bills']} bills in {results['seconds']}s: {results['bills_per_sec']} bills/sec, "
+            f"{results['lock_errors']} lock errors ({results['environment']['database']})"
+        )
+        self.stdout.write(f"{'operation':<16} {'requests':>8} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>7}")
+        for operation, summary in results['operations'].items():
+            latency = summary['latency_ms']
+            self.stdout.write(
+                f"{operation:<16} {summary['requests']:>8} {summary['errors']:>6} {latency.get('p50', 0):>8} "
+                f"{latency.get('p95', 0):>8} {latency.get('p99', 0):>8} {summary['queries_mean']:>7}"
+            )
+            for error in summary['sample_errors']:
+                self.stdout.write(f'    {error}')
+
+        if baseline is None:
+            return
+        self.stdout.write(f"Compared with run {baseline.get('run')}:")
+        self.stdout.write(f"  bills/sec {baseline.get('bills_per_sec')} -> {results['bills_per_sec']}")
+        for operation, summary in results['operations'].items():
+            before = baseline.get('operations', {}).get(operation)
+            if before:
+                self.stdout.write(
+                    f"  {operation}: p95 {before['latency_ms'].get('p95')} -> {summary['latency_ms'].get('p95')} ms, "
+                    f"queries {before['queries_mean']} -> {summary['queries_mean']}"
+                )
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from users.models import Shop
+from billing.customer_stats import rebuild_customer_stats
+from billing.models import CustomerStats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-customer lifetime stats from the bills'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shop', type=int, help='Only rebuild the stats of this shop')
+
+    def handle(self, *args, **options):
+        shop = None
+        if options['shop']:
+            try:
+                shop = Shop.objects.get(id=options['shop'])
+            except Shop.DoesNotExist:
+                raise CommandError(f"Shop {options['shop']} not found")
+
+        rebuild_customer_stats(shop=shop)
+        rows = CustomerStats.objects.filter(shop=shop) if shop else CustomerStats.objects.all()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt stats for {rows.count()} customers'))
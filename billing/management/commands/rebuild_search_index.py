@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from billing.fulltext import SEARCH_MODELS, ensure_search_schema, index_object
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the bill and customer full-text search index from the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if ensure_search_schema(rebuild=True):
+            self.stdout.write(self.style.SUCCESS('Rebuilt the FTS5 search tables'))
+            return
+
+        # No FTS5 here: fill the trigram fallback table instead
+        for kind, (model, _) in SEARCH_MODELS.items():
+            count = 0
+            for instance in model.objects.iterator(chunk_size=options['batch_size']):
+                index_object(kind, instance)
+                count += 1
+            self.stdout.write(f'Indexed {count} {kind} rows')
+        self.stdout.write(self.style.SUCCESS('Rebuilt the trigram search table'))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q, Sum
+from products.models import Product
+from billing.models import StockReservation
+from billing.reservations import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Give the stock held by expired cart reservations back; run every few minutes from cron'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--resync', action='store_true',
+            help='Also recompute every product\'s reserved counter from the live reservations'
+        )
+
+    def handle(self, *args, **options):
+        released = release_expired()
+        self.stdout.write(f'Released {released} expired reservations')
+
+        if options['resync']:
+            with transaction.atomic():
+                held = dict(
+                    StockReservation.objects.values('product_id').annotate(units=Sum('quantity'))
+                    .values_list('product_id', 'units').order_by()
+                )
+                drifted = 0
+                products = Product.objects.filter(~Q(reserved=0) | Q(id__in=held.keys()))
+                for product_id, reserved in products.values_list('id', 'reserved').iterator():
+                    if reserved != held.get(product_id, 0):
+                        Product.objects.filter(id=product_id).update(reserved=held.get(product_id, 0))
+                        drifted += 1
+            self.stdout.write(f'Corrected the reserved counter of {drifted} products')
+
+        self.stdout.write(self.style.SUCCESS('Done'))
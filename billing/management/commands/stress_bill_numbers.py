@@ -0,0 +1,61 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, OperationalError, connection
+from users.models import Shop
+from billing.models import Bill
+
+# Result of a bill insert rejected for reusing a number
+DUPLICATE = 'duplicate'
+
+
+class Command(BaseCommand):
+    help = 'Create bills for one shop from many threads at once and check that no bill number is issued twice'
+
+    def add_arguments(self, parser):
+        parser.add_argument('shop_id', type=int)
+        parser.add_argument('--bills', type=int, default=300)
+        parser.add_argument('--workers', type=int, default=16)
+        parser.add_argument('--keep', action='store_true', help='Keep the generated bills instead of deleting them')
+
+    def handle(self, *args, **options):
+        try:
+            shop = Shop.objects.get(id=options['shop_id'])
+        except Shop.DoesNotExist:
+            raise CommandError(f"Shop {options['shop_id']} not found")
+
+        def create_bill(_):
+            try:
+                for attempt in range(5):
+                    try:
+                        return Bill.objects.create(shop=shop, total=0, customer_name='stress test')
+                    except OperationalError:
+                        # SQLite reports "database is locked" when writers pile up
+                        if attempt == 4:
+                            raise
+            except IntegrityError as e:
+                # bill_number is unique, so a number handed out twice fails the insert
+                self.stderr.write(f'Duplicate bill number: {e}')
+                return DUPLICATE
+            except Exception as e:
+                self.stderr.write(f'Bill creation failed: {e}')
+                return None
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            results = list(pool.map(create_bill, range(options['bills'])))
+
+        bills = [bill for bill in results if isinstance(bill, Bill)]
+        numbers = [bill.bill_number for bill in bills]
+        duplicates = results.count(DUPLICATE) + len(numbers) - len(set(numbers))
+        failures = results.count(None)
+
+        if not options['keep']:
+            Bill.objects.filter(id__in=[bill.id for bill in bills]).delete()
+
+        self.stdout.write(f'Created {len(bills)} bills, {failures} failed, {duplicates} duplicate numbers')
+        if duplicates:
+            raise CommandError(f'{duplicates} bill numbers were issued more than once')
+        if failures:
+            raise CommandError(f'{failures} bills could not be created, so the check is incomplete')
+        self.stdout.write(self.style.SUCCESS('No bill number collisions'))
@@ -0,0 +1,89 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from products.models import Product
+from products.stock import apply_stock_updates
+from billing.cart import CartStore
+from billing.checkout import commit_bill
+from billing.models import Bill
+
+
+class Command(BaseCommand):
+    help = 'Have many tills race to sell the last units of one product and check that it is never oversold'
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_id', type=int)
+        parser.add_argument('--stock', type=int, default=10, help='Units to put on the shelf before the race')
+        parser.add_argument('--tills', type=int, default=40)
+        parser.add_argument('--workers', type=int, default=16)
+        parser.add_argument('--keep', action='store_true', help='Keep the generated bills instead of deleting them')
+
+    def handle(self, *args, **options):
+        try:
+            product = Product.objects.select_related('shop__owner').get(id=options['product_id'])
+        except Product.DoesNotExist:
+            raise CommandError(f"Product {options['product_id']} not found")
+
+        shop = product.shop
+        user = shop.owner
+        original_stock = product.stock
+        # Through the stock engine, so the journal still adds up to the product's stock
+        apply_stock_updates(shop, [{'product_id': product.id, 'stock': options['stock']}])
+
+        def retry(func):
+            for attempt in range(10):
+                try:
+                    return func()
+                except OperationalError:
+                    # SQLite reports "database is locked" when writers pile up
+                    if attempt == 9:
+                        raise
+                    time.sleep(0.02 * (attempt + 1))
+
+        def sell(till):
+            cart = CartStore(user, f'stress-{till}')
+            try:
+                retry(lambda: cart.set_line(product.id, 1, product.sale_price))
+                bill = retry(lambda: commit_bill(
+                    shop, [(product.id, 1)],
+                    customer_name='stress test', held_by=(cart.user, cart.till)
+                ))
+                retry(cart.clear)
+                return bill
+            except ValidationError:
+                # Out of stock: the expected outcome for the tills that lost the race
+                retry(cart.clear)
+                return None
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            results = list(pool.map(self._safe(sell), range(options['tills'])))
+
+        bills = [bill for bill in results if bill is not None]
+        product.refresh_from_db()
+        oversold = len(bills) - options['stock']
+
+        if not options['keep']:
+            Bill.objects.filter(id__in=[bill.id for bill in bills]).delete()
+        apply_stock_updates(shop, [{'product_id': product.id, 'stock': original_stock}])
+
+        self.stdout.write(
+            f'{len(bills)} of {options["tills"]} tills sold a unit of {options["stock"]}; '
+            f'stock left {product.stock}, still reserved {product.reserved}'
+        )
+        if oversold > 0 or product.stock < 0:
+            raise CommandError(f'Oversold by {oversold} units')
+        self.stdout.write(self.style.SUCCESS('Never oversold'))
+
+    def _safe(self, func):
+        def wrapper(arg):
+            try:
+                return func(arg)
+            except Exception as e:
+                self.stderr.write(f'Sale failed: {e}')
+                return None
+        return wrapper
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_shop_logo'),
+        ('billing', '0004_alter_billitem_quantity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('last_value', models.PositiveIntegerField(default=0)),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='users.shop')),
+            ],
+            options={
+                'unique_together': {('shop', 'day')},
+            },
+        ),
+    ]
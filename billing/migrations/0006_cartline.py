@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_alter_product_barcode_alter_product_cost_price_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('billing', '0005_billsequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('till', models.CharField(default='default', max_length=32)),
+                ('quantity', models.DecimalField(decimal_places=3, max_digits=10)),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='products.product')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'till', 'product')},
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0006_cartline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bill',
+            name='client_key',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='bill',
+            constraint=models.UniqueConstraint(condition=models.Q(('client_key__isnull', False)), fields=('shop', 'client_key'), name='unique_client_key_per_shop'),
+        ),
+    ]
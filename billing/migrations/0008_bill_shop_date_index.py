@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0007_bill_client_key'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(fields=['shop', 'date'], name='billing_bill_shop_date_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_fts_tables(apps, schema_editor):
+    from billing.fulltext import ensure_search_schema
+    ensure_search_schema(schema_editor.connection)
+
+
+def drop_fts_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for kind in ('bill', 'customer'):
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS billing_{kind}_fts_{suffix}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS billing_{kind}_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_shop_receipt_format'),
+        ('billing', '0008_bill_shop_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=10)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('gram', models.CharField(max_length=3)),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='users.shop')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['shop', 'kind', 'gram'], name='billing_trigram_lookup_idx'), models.Index(fields=['kind', 'object_id'], name='billing_trigram_object_idx')],
+            },
+        ),
+        migrations.RunPython(create_fts_tables, drop_fts_tables),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+from billing.phones import normalize_phone
+
+
+def fill_phone_normalized(apps, schema_editor):
+    Customer = apps.get_model('billing', 'Customer')
+    customers = list(Customer.objects.only('id', 'phone'))
+    for customer in customers:
+        customer.phone_normalized = normalize_phone(customer.phone)
+    Customer.objects.bulk_update(customers, ['phone_normalized'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0009_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bill',
+            name='customer',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bills', to='billing.customer'),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='phone_normalized',
+            field=models.CharField(blank=True, editable=False, max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['shop', 'phone_normalized'], name='billing_customer_phone_idx'),
+        ),
+        migrations.RunPython(fill_phone_normalized, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_customer_stats(apps, schema_editor):
+    Bill = apps.get_model('billing', 'Bill')
+    CustomerStats = apps.get_model('billing', 'CustomerStats')
+    rows = Bill.objects.filter(customer__isnull=False).values('customer_id', 'customer__shop_id').annotate(
+        bill_count=models.Count('id'),
+        total_spent=models.Sum('total'),
+        first_purchase=models.Min('date'),
+        last_purchase=models.Max('date'),
+        udhaar=models.Sum('total', filter=models.Q(payment_type='udhaar'))
+    ).order_by()
+    CustomerStats.objects.bulk_create([
+        CustomerStats(
+            customer_id=row['customer_id'],
+            shop_id=row['customer__shop_id'],
+            first_purchase=row['first_purchase'],
+            last_purchase=row['last_purchase'],
+            bill_count=row['bill_count'],
+            total_spent=row['total_spent'],
+            outstanding_udhaar=row['udhaar'] or 0
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_shop_receipt_format'),
+        ('billing', '0010_customer_phone_normalized'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerStats',
+            fields=[
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='billing.customer')),
+                ('first_purchase', models.DateTimeField(blank=True, null=True)),
+                ('last_purchase', models.DateTimeField(blank=True, null=True)),
+                ('bill_count', models.PositiveIntegerField(default=0)),
+                ('total_spent', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('outstanding_udhaar', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='users.shop')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['shop', 'last_purchase'], name='billing_custstats_recent_idx')],
+            },
+        ),
+        migrations.RunPython(fill_customer_stats, migrations.RunPython.noop),
+    ]
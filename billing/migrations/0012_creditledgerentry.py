@@ -0,0 +1,89 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def fill_credit_ledger(apps, schema_editor):
+    """Post every existing udhaar bill of a known customer as a credit sale, oldest first"""
+    Bill = apps.get_model('billing', 'Bill')
+    CreditLedgerEntry = apps.get_model('billing', 'CreditLedgerEntry')
+    CustomerStats = apps.get_model('billing', 'CustomerStats')
+    bills = Bill.objects.filter(payment_type='udhaar', customer__isnull=False).exclude(total=0).order_by('customer_id', 'date', 'id')
+
+    balances = {}
+    entries = []
+    for bill in bills.iterator(chunk_size=2000):
+        balance = balances.get(bill.customer_id, 0) + bill.total
+        balances[bill.customer_id] = balance
+        entries.append(CreditLedgerEntry(
+            shop_id=bill.shop_id,
+            customer_id=bill.customer_id,
+            kind='sale',
+            amount=bill.total,
+            balance_after=balance,
+            bill_id=bill.id,
+            note=bill.bill_number,
+            created_at=bill.date
+        ))
+        if len(entries) >= 2000:
+            CreditLedgerEntry.objects.bulk_create(entries)
+            entries = []
+    CreditLedgerEntry.objects.bulk_create(entries)
+
+    for customer_id, balance in balances.items():
+        CustomerStats.objects.filter(customer_id=customer_id).update(outstanding_udhaar=balance)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_shop_receipt_format'),
+        ('billing', '0011_customerstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CreditLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('sale', 'Credit Sale'), ('repayment', 'Repayment'), ('adjustment', 'Adjustment')], max_length=10)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('balance_after', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('note', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['-created_at', '-id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='customerstats',
+            index=models.Index(fields=['shop', 'outstanding_udhaar'], name='billing_custstats_udhaar_idx'),
+        ),
+        migrations.AddField(
+            model_name='creditledgerentry',
+            name='bill',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entry', to='billing.bill'),
+        ),
+        migrations.AddField(
+            model_name='creditledgerentry',
+            name='customer',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='billing.customer'),
+        ),
+        migrations.AddField(
+            model_name='creditledgerentry',
+            name='shop',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='users.shop'),
+        ),
+        migrations.AddIndex(
+            model_name='creditledgerentry',
+            index=models.Index(fields=['customer', 'created_at'], name='billing_ledger_customer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='creditledgerentry',
+            index=models.Index(fields=['shop', 'kind', 'created_at'], name='billing_ledger_kind_idx'),
+        ),
+        migrations.RunPython(fill_credit_ledger, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,10 @@
 from django.db import models
+from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
 from users.models import Shop
 from products.models import Product
 from django.utils import timezone
+from .phones import normalize_phone
 
 class Bill(models.Model):
     PAYMENT_CHOICES = [
@@ -20,32 +22,45 @@ class Bill(models.Model):
     total = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
     customer_name = models.CharField(max_length=100, blank=True)
     customer_phone = models.CharField(max_length=15, blank=True)
+    customer = models.ForeignKey('Customer', on_delete=models.SET_NULL, null=True, blank=True, related_name='bills')
     payment_type = models.CharField(max_length=10, choices=PAYMENT_CHOICES, default='cash')
     shop = models.ForeignKey(Shop, on_delete=models.CASCADE)
+    client_key = models.CharField(max_length=64, blank=True, null=True)
     
     class Meta:
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['shop', 'date'], name='billing_bill_shop_date_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['shop', 'client_key'],
+                condition=models.Q(client_key__isnull=False),
+                name='unique_client_key_per_shop'
+            )
+        ]
     
     def save(self, *args, **kwargs):
         if not self.bill_number:
-            today = timezone.now().strftime('%Y%m%d')
-            last_bill = Bill.objects.filter(
-                shop=self.shop,
-                bill_number__startswith=f"{self.shop.id}{today}"
-            ).order_by('-bill_number').first()
-            
-            if last_bill:
-                last_num = int(last_bill.bill_number[-3:])
-                new_num = str(last_num + 1).zfill(3)
-            else:
-                new_num = '001'
-            
-            self.bill_number = f"{self.shop.id}{today}{new_num}"
+            from .sequences import allocate_bill_number
+            self.bill_number = allocate_bill_number(self.shop)
         super().save(*args, **kwargs)
     
     def __str__(self):
         return f"Bill #{self.bill_number} - {self.shop.name}"
 
+class BillSequence(models.Model):
+    """Per-shop daily counter that bill numbers are allocated from"""
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE)
+    day = models.DateField()
+    last_value = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['shop', 'day']
+    
+    def __str__(self):
+        return f"{self.shop.name} - {self.day} - {self.last_value}"
+
 class BillItem(models.Model):
     bill = models.ForeignKey(Bill, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
@@ -65,8 +80,113 @@ class Customer(models.Model):
     phone = models.CharField(max_length=15, blank=True)
     email = models.EmailField(blank=True)
     address = models.TextField(blank=True)
+    phone_normalized = models.CharField(max_length=20, blank=True, editable=False)
     shop = models.ForeignKey(Shop, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['shop', 'phone_normalized'], name='billing_customer_phone_idx'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        self.phone_normalized = normalize_phone(self.phone)
+        super().save(*args, **kwargs)
+    
+    def __str__(self):
+        return self.name
+
+class CustomerStats(models.Model):
+    """Lifetime totals of one customer, kept up to date as bills are committed"""
+    customer = models.OneToOneField(Customer, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE)
+    first_purchase = models.DateTimeField(null=True, blank=True)
+    last_purchase = models.DateTimeField(null=True, blank=True)
+    bill_count = models.PositiveIntegerField(default=0)
+    total_spent = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    outstanding_udhaar = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['shop', 'last_purchase'], name='billing_custstats_recent_idx'),
+            models.Index(fields=['shop', 'outstanding_udhaar'], name='billing_custstats_udhaar_idx'),
+        ]
+    
+    @property
+    def avg_bill(self):
+        return self.total_spent / self.bill_count if self.bill_count else 0
+    
+    def __str__(self):
+        return f"{self.customer.name}: {self.bill_count} bills, Rs. {self.total_spent}"
+
+class CreditLedgerEntry(models.Model):
+    """Append-only udhaar ledger line; positive amounts add to what the customer owes"""
+    KIND_CHOICES = [
+        ('sale', 'Credit Sale'),
+        ('repayment', 'Repayment'),
+        ('adjustment', 'Adjustment'),
+    ]
+    
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE)
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='ledger_entries')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    balance_after = models.DecimalField(max_digits=14, decimal_places=2)
+    bill = models.OneToOneField(Bill, on_delete=models.SET_NULL, null=True, blank=True, related_name='ledger_entry')
+    note = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['customer', 'created_at'], name='billing_ledger_customer_idx'),
+            models.Index(fields=['shop', 'kind', 'created_at'], name='billing_ledger_kind_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.customer.name}: {self.get_kind_display()} Rs. {self.amount}"
+
+class CartLine(models.Model):
+    """One product line of the open cart at a cashier's till"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    till = models.CharField(max_length=32, default='default')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.DecimalField(max_digits=10, decimal_places=3)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['user', 'till', 'product']
+    
+    def __str__(self):
+        return f"{self.user.username}@{self.till}: {self.product_id} x {self.quantity}"
+
+class StockReservation(models.Model):
+    """Whole units of a product held for one cart line until ``expires_at``"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    till = models.CharField(max_length=32, default='default')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        unique_together = ['user', 'till', 'product']
+    
+    def __str__(self):
+        return f"{self.user.username}@{self.till}: {self.product_id} x {self.quantity}"
+
+class SearchTrigram(models.Model):
+    """Trigram postings for bill/customer search on databases without SQLite FTS5"""
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10)
+    object_id = models.PositiveBigIntegerField()
+    gram = models.CharField(max_length=3)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['shop', 'kind', 'gram'], name='billing_trigram_lookup_idx'),
+            models.Index(fields=['kind', 'object_id'], name='billing_trigram_object_idx'),
+        ]
+    
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return f"{self.kind} {self.object_id}: {self.gram}"
@@ -0,0 +1,44 @@
+"""
+Phone number normalization used to match bills to customers
+"""
+from django.conf import settings
+
+
+def normalize_phone(phone):
+    """
+    Canonical national form of ``phone``: digits only, with a trunk ``0``.
+
+    ``+92 300 1234567``, ``0092-300-1234567``, ``0300 1234567`` and
+    ``3001234567`` all become ``03001234567``.
+    """
+    digits = ''.join(ch for ch in (phone or '') if ch.isdigit())
+    if not digits:
+        return ''
+
+    country_code = getattr(settings, 'PHONE_COUNTRY_CODE', '92')
+    if digits.startswith('00' + country_code):
+        digits = digits[2 + len(country_code):]
+    elif digits.startswith(country_code) and len(digits) > 10:
+        digits = digits[len(country_code):]
+
+    if not digits.startswith('0'):
+        digits = '0' + digits
+    return digits
+
+
+def find_customer(shop, phone):
+    """The shop's customer with this phone in any formatting, or ``None``"""
+    from .models import Customer
+
+    normalized = normalize_phone(phone)
+    if not normalized:
+        return None
+    return Customer.objects.filter(shop=shop, phone_normalized=normalized).order_by('id').first()
+
+
+def international_phone(phone):
+    """``phone`` as country code plus national number, the form wa.me links expect"""
+    normalized = normalize_phone(phone)
+    if not normalized:
+        return ''
+    return getattr(settings, 'PHONE_COUNTRY_CODE', '92') + normalized[1:]
@@ -0,0 +1,97 @@
+"""
+Server-side bill pricing
+
+Bill totals are computed here from the line items instead of being taken
+from the till. A shop's rules (its tax rate and whether shelf prices already
+include tax) are compiled once into a ``PricingRules`` object and cached, so
+pricing a bill is a single pass of ``Decimal`` arithmetic over its lines.
+"""
+import threading
+from collections import namedtuple
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from django.core.exceptions import ValidationError
+
+CENT = Decimal('0.01')
+ZERO = Decimal('0.00')
+
+BillTotals = namedtuple('BillTotals', ['line_totals', 'subtotal', 'discount', 'tax', 'total'])
+
+
+def money(value):
+    """Round an amount to paisa the way receipts show it"""
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+class PricingRules:
+    """
+    Compiled pricing rules of one shop.
+
+    Tax is charged on the subtotal after the discount. With
+    ``prices_include_tax`` the shelf prices already contain it, so the tax is
+    only split out of the total for the receipt.
+    """
+
+    def __init__(self, tax_rate=0, prices_include_tax=False):
+        self.tax_percent = Decimal(str(tax_rate))
+        self.rate = self.tax_percent / 100
+        self.prices_include_tax = prices_include_tax
+        # Share of a tax-inclusive amount that is tax
+        self.included_share = self.rate / (1 + self.rate)
+
+    def price(self, lines, discount=0):
+        """
+        Totals of a bill with ``lines`` of ``(quantity, unit_price)``.
+
+        Raises ``ValidationError`` if the discount is negative or larger than
+        the subtotal.
+        """
+        try:
+            discount = money(Decimal(str(discount or 0)))
+        except InvalidOperation:
+            raise ValidationError('Invalid discount')
+
+        line_totals = [money(quantity * unit_price) for quantity, unit_price in lines]
+        subtotal = sum(line_totals, ZERO)
+        if discount < 0 or discount > subtotal:
+            raise ValidationError('Discount must be between zero and the subtotal')
+
+        taxable = subtotal - discount
+        if self.prices_include_tax:
+            tax = money(taxable * self.included_share)
+            total = taxable
+        else:
+            tax = money(taxable * self.rate)
+            total = taxable + tax
+        return BillTotals(line_totals, subtotal, discount, tax, total)
+
+
+def tax_label(subtotal, discount, tax, total):
+    """How a receipt labels the tax of a priced bill: added on top, or already in the prices"""
+    return 'Incl. Tax:' if tax > 0 and total == subtotal - discount else 'Tax:'
+
+
+_rules = {}
+_rules_lock = threading.Lock()
+
+
+def rules_for_shop(shop):
+    """
+    The shop's compiled rules.
+
+    The cache is keyed on the rule settings themselves, so a shop that
+    changes its tax rate gets new rules on its next request without any
+    invalidation.
+    """
+    key = (shop.id, shop.tax_rate, shop.prices_include_tax)
+    rules = _rules.get(key)
+    if rules is None:
+        rules = PricingRules(shop.tax_rate, shop.prices_include_tax)
+        with _rules_lock:
+            for stale in [k for k in _rules if k[0] == shop.id]:
+                del _rules[stale]
+            _rules[key] = rules
+    return rules
+
+
+def price_bill(shop, lines, discount=0):
+    return rules_for_shop(shop).price(lines, discount)
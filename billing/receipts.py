@@ -0,0 +1,271 @@
+"""
+Receipt rendering with a persistent cache of rendered PDFs
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.db import close_old_connections
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import letter
+from .models import BillItem
+from .pricing import tax_label
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the receipt layout changes so cached PDFs are rendered again
+RECEIPT_TEMPLATE_VERSION = 2
+
+
+def _receipt_fields(bill, items):
+    return {
+        'shop_name': bill.shop.name,
+        'shop_address': bill.shop.address or '',
+        'bill_number': bill.bill_number,
+        'date': bill.date.strftime('%d %b %Y, %H:%M'),
+        'payment': bill.get_payment_type_display(),
+        'customer_name': bill.customer_name,
+        'customer_phone': bill.customer_phone,
+        'items': items,
+        'subtotal': bill.subtotal,
+        'tax': bill.tax,
+        'discount': bill.discount,
+        'total': bill.total,
+        'tax_label': tax_label(bill.subtotal, bill.discount, bill.tax, bill.total),
+    }
+
+
+def receipt_data(bill):
+    """Everything a receipt shows, as plain values; reads the items in one query"""
+    items = bill.items.order_by('id').values_list('product__name', 'quantity', 'unit_price', 'total_price')
+    return _receipt_fields(bill, list(items))
+
+
+def receipt_data_many(bills):
+    """``receipt_data`` for a list of bills, reading all of their items in one query"""
+    items = {bill.id: [] for bill in bills}
+    rows = BillItem.objects.filter(bill_id__in=items.keys()).order_by('id').values_list(
+        'bill_id', 'product__name', 'quantity', 'unit_price', 'total_price'
+    )
+    for bill_id, *item in rows:
+        items[bill_id].append(tuple(item))
+    return [_receipt_fields(bill, items[bill.id]) for bill in bills]
+
+
+def render_pdf(data):
+    """Draw a letter-size PDF receipt from ``receipt_data`` and return its bytes"""
+    buffer = BytesIO()
+    p = canvas.Canvas(buffer, pagesize=letter)
+    width, height = letter
+
+    # Header
+    p.setFont("Helvetica-Bold", 20)
+    p.drawString(width/2 - 100, height-50, data['shop_name'])
+    p.setFont("Helvetica", 12)
+    p.drawString(width/2 - 50, height-70, data['shop_address'])
+
+    # Bill info
+    p.setFont("Helvetica-Bold", 14)
+    p.drawString(50, height-120, f"Bill #{data['bill_number']}")
+    p.setFont("Helvetica", 10)
+    p.drawString(50, height-140, f"Date: {data['date']}")
+    p.drawString(50, height-155, f"Payment: {data['payment']}")
+
+    if data['customer_name']:
+        p.drawString(300, height-140, f"Customer: {data['customer_name']}")
+    if data['customer_phone']:
+        p.drawString(300, height-155, f"Phone: {data['customer_phone']}")
+
+    # Items table
+    y = height - 200
+    p.setFont("Helvetica-Bold", 10)
+    p.drawString(50, y, "Item")
+    p.drawString(300, y, "Qty")
+    p.drawString(350, y, "Price")
+    p.drawString(450, y, "Total")
+
+    y -= 20
+    p.setFont("Helvetica", 9)
+
+    for name, quantity, unit_price, total_price in data['items']:
+        p.drawString(50, y, name[:30])
+        p.drawString(300, y, str(quantity))
+        p.drawString(350, y, f"Rs. {unit_price}")
+        p.drawString(450, y, f"Rs. {total_price}")
+        y -= 15
+
+    # Totals
+    y -= 20
+    p.setFont("Helvetica-Bold", 10)
+    p.drawString(350, y, f"Subtotal: Rs. {data['subtotal']}")
+    y -= 15
+    # Same order as the pricing engine applies them: discount first, then tax
+    if data['discount'] > 0:
+        p.drawString(350, y, f"Discount: Rs. {data['discount']}")
+        y -= 15
+    if data['tax'] > 0:
+        p.drawString(350, y, f"{data['tax_label']} Rs. {data['tax']}")
+        y -= 15
+    p.setFont("Helvetica-Bold", 12)
+    p.drawString(350, y, f"Total: Rs. {data['total']}")
+
+    # Footer
+    p.setFont("Helvetica", 8)
+    p.drawString(width/2 - 80, 50, "Thank you for your business!")
+    p.drawString(width/2 - 60, 35, "Powered by ShopCloud")
+
+    p.showPage()
+    p.save()
+    return buffer.getvalue()
+
+
+class ThermalLayout:
+    """
+    Fixed-width receipt layout for a roll of ``width`` characters.
+
+    Every format string is built once when the layout is created, so rendering
+    a bill is only string formatting and joins.
+    """
+
+    def __init__(self, width):
+        self.width = width
+        self.rule = '-' * width
+        self.center = f'{{:^{width}.{width}}}'
+        self.name = f'{{:.{width}}}'
+        amount_width = 12
+        self.item = f'{{:<{width - amount_width}.{width - amount_width}}}{{:>{amount_width}}}'
+        self.total = f'{{:>{width - amount_width}}}{{:>{amount_width}}}'
+        self.footer = [self.rule] + [
+            self.center.format(line).rstrip() for line in ('Thank you for your business!', 'Powered by ShopCloud')
+        ]
+
+    def header_lines(self, data):
+        lines = [self.center.format(data['shop_name']).rstrip()]
+        if data['shop_address']:
+            lines.append(self.center.format(data['shop_address']).rstrip())
+        return lines
+
+    def body_lines(self, data):
+        lines = [
+            self.rule,
+            self.name.format(f"Bill #{data['bill_number']}"),
+            self.name.format(f"Date: {data['date']}"),
+            self.name.format(f"Payment: {data['payment']}"),
+        ]
+        if data['customer_name']:
+            lines.append(self.name.format(f"Customer: {data['customer_name']}"))
+        if data['customer_phone']:
+            lines.append(self.name.format(f"Phone: {data['customer_phone']}"))
+        lines.append(self.rule)
+
+        for name, quantity, unit_price, total_price in data['items']:
+            lines.append(self.name.format(name))
+            lines.append(self.item.format(f"  {format(quantity.normalize(), 'f')} x {unit_price}", f"{total_price}"))
+
+        lines.append(self.rule)
+        lines.append(self.total.format('Subtotal:', f"{data['subtotal']}"))
+        if data['discount'] > 0:
+            lines.append(self.total.format('Discount:', f"-{data['discount']}"))
+        if data['tax'] > 0:
+            lines.append(self.total.format(data['tax_label'], f"{data['tax']}"))
+        return lines
+
+    def total_line(self, data):
+        return self.total.format('TOTAL Rs.', f"{data['total']}")
+
+    def footer_lines(self):
+        return self.footer
+
+
+# Character columns of Font A on common roll widths
+THERMAL_LAYOUTS = {
+    'thermal58': ThermalLayout(32),
+    'thermal80': ThermalLayout(48),
+}
+
+# ESC/POS control sequences
+ESC_INIT = b'\x1b@'
+ESC_ALIGN_LEFT = b'\x1ba\x00'
+ESC_BOLD_ON = b'\x1bE\x01'
+ESC_BOLD_OFF = b'\x1bE\x00'
+ESC_DOUBLE_HEIGHT = b'\x1b!\x10'
+ESC_NORMAL_SIZE = b'\x1b!\x00'
+ESC_FEED_AND_CUT = b'\x1bd\x04\x1dV\x01'
+
+
+def render_text(data, layout):
+    """Plain fixed-width receipt for ``layout``"""
+    lines = layout.header_lines(data) + layout.body_lines(data)
+    lines.append(layout.total_line(data))
+    lines.extend(layout.footer_lines())
+    return '\n'.join(lines) + '\n'
+
+
+def _encode(lines):
+    # Printers without an Urdu code page print '?' for characters they lack
+    return '\n'.join(lines).encode('cp437', 'replace') + b'\n'
+
+
+def render_escpos(data, layout):
+    """ESC/POS byte stream for ``layout``, ready to send to the printer as is"""
+    return b''.join((
+        ESC_INIT,
+        ESC_ALIGN_LEFT,
+        ESC_BOLD_ON, _encode(layout.header_lines(data)), ESC_BOLD_OFF,
+        _encode(layout.body_lines(data)),
+        ESC_BOLD_ON, ESC_DOUBLE_HEIGHT, _encode([layout.total_line(data)]), ESC_NORMAL_SIZE, ESC_BOLD_OFF,
+        _encode(layout.footer_lines()),
+        ESC_FEED_AND_CUT,
+    ))
+
+
+def receipt_path(bill):
+    return f'receipts/{bill.shop_id}/{bill.id}-v{RECEIPT_TEMPLATE_VERSION}.pdf'
+
+
+def receipt_etag(bill):
+    """Strong ETag; a committed bill never changes, so id and layout version identify the bytes"""
+    return f'"receipt-{bill.id}-v{RECEIPT_TEMPLATE_VERSION}"'
+
+
+def get_receipt_pdf(bill):
+    """Cached PDF for ``bill``, rendering and storing it on first use"""
+    path = receipt_path(bill)
+    storage = storages['private']
+    if storage.exists(path):
+        with storage.open(path, 'rb') as cached:
+            return cached.read()
+
+    pdf = render_pdf(receipt_data(bill))
+    try:
+        if not storage.exists(path):
+            storage.save(path, ContentFile(pdf))
+    except OSError as e:
+        # A read-only or full volume only costs us the cache
+        logger.warning(f"Could not cache receipt for bill {bill.id}: {e}")
+    return pdf
+
+
+_render_pool = None
+
+
+def _render_in_background(bill):
+    try:
+        get_receipt_pdf(bill)
+    except Exception as e:
+        logger.error(f"Error pre-rendering receipt for bill {bill.id}: {e}")
+    finally:
+        close_old_connections()
+
+
+def prerender_receipt(bill):
+    """Queue a new bill's receipt for rendering when ``RECEIPT_EAGER_RENDER`` is on"""
+    global _render_pool
+    if not getattr(settings, 'RECEIPT_EAGER_RENDER', False):
+        return
+    if _render_pool is None:
+        # One worker keeps rendering off the checkout path without competing with it
+        _render_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='receipts')
+    _render_pool.submit(_render_in_background, bill)
@@ -0,0 +1,125 @@
+"""
+Short-lived stock reservations for open POS carts
+
+Adding a product to a cart moves whole units from the product's available
+stock into ``Product.reserved`` with one conditional UPDATE, so two tills can
+never both hold the last unit. Checkout turns the cart's reservations into
+the stock decrement; carts that are abandoned give their units back once
+their reservations pass ``CART_RESERVATION_TTL``.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from products.models import Product
+from .models import StockReservation
+
+
+def _expiry():
+    return timezone.now() + timedelta(seconds=getattr(settings, 'CART_RESERVATION_TTL', 15 * 60))
+
+
+def _take(product_id, units):
+    """Move ``units`` from available to reserved, only if that many are free"""
+    return Product.objects.filter(id=product_id, stock__gte=F('reserved') + units).update(reserved=F('reserved') + units)
+
+
+def unreserve(held):
+    """Hand reserved units back, ``held`` being ``{product_id: units}``"""
+    if not held:
+        return
+    Product.objects.filter(id__in=held.keys()).update(reserved=unreserve_expression(held))
+
+
+def unreserve_expression(held):
+    """``reserved`` minus the units in ``held``, for use in a larger product UPDATE"""
+    return Greatest(
+        Case(*[
+            When(id=product_id, then=F('reserved') - Value(units))
+            for product_id, units in held.items()
+        ], default=F('reserved')),
+        Value(0)
+    )
+
+
+def reserve(user, till, product_id, units):
+    """
+    Hold ``units`` of the product for this till's cart line, replacing what the
+    line held before, and extend all of the till's reservations.
+
+    Raises ``ValidationError`` if the extra units are not available.
+    """
+    product_id = int(product_id)
+    with transaction.atomic():
+        reservation = StockReservation.objects.select_for_update().filter(
+            user=user, till=till, product_id=product_id
+        ).first()
+        held = reservation.quantity if reservation else 0
+
+        delta = units - held
+        if delta > 0 and not _take(product_id, delta):
+            # Abandoned carts may still be holding units past their expiry
+            release_expired(product_ids=[product_id], exclude=reservation.pk if reservation else None)
+            if not _take(product_id, delta):
+                raise ValidationError('Insufficient stock')
+        elif delta < 0:
+            unreserve({product_id: -delta})
+
+        if units <= 0:
+            if reservation:
+                reservation.delete()
+        elif reservation:
+            StockReservation.objects.filter(pk=reservation.pk).update(quantity=units)
+        else:
+            StockReservation.objects.create(
+                user=user, till=till, product_id=product_id, quantity=units, expires_at=_expiry()
+            )
+
+        # Any activity at the till keeps its whole cart reserved
+        StockReservation.objects.filter(user=user, till=till).update(expires_at=_expiry())
+
+
+def take_reservations(user, till, product_ids=None):
+    """
+    Remove the till's reservations and return them as ``{product_id: units}``.
+
+    The units are still counted in ``Product.reserved``; the caller hands them
+    back with ``unreserve`` or as part of its own stock UPDATE, in the same
+    transaction.
+    """
+    reservations = StockReservation.objects.filter(user=user, till=till)
+    if product_ids is not None:
+        reservations = reservations.filter(product_id__in=product_ids)
+
+    with transaction.atomic():
+        rows = list(reservations.select_for_update().values_list('id', 'product_id', 'quantity'))
+        StockReservation.objects.filter(id__in=[row[0] for row in rows]).delete()
+    return {product_id: quantity for _, product_id, quantity in rows}
+
+
+def release(user, till, product_ids=None):
+    """Give back the units held by the till's cart, or by some of its lines"""
+    with transaction.atomic():
+        unreserve(take_reservations(user, till, product_ids))
+
+
+def release_expired(product_ids=None, exclude=None):
+    """Release reservations past their expiry; returns how many were released"""
+    now = timezone.now()
+    expired = StockReservation.objects.filter(expires_at__lte=now)
+    if product_ids is not None:
+        expired = expired.filter(product_id__in=product_ids)
+    if exclude is not None:
+        expired = expired.exclude(pk=exclude)
+
+    released = 0
+    for pk, product_id, quantity in expired.values_list('id', 'product_id', 'quantity').iterator():
+        with transaction.atomic():
+            # Only the process that deletes the row gives its units back
+            if StockReservation.objects.filter(pk=pk, expires_at__lte=now).delete()[0]:
+                unreserve({product_id: quantity})
+                released += 1
+    return released
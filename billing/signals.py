@@ -0,0 +1,30 @@
+from django.db import connections
+from django.db.models.signals import post_save, post_delete, post_migrate
+from django.dispatch import receiver
+from .fulltext import ensure_search_schema, index_object, unindex_object
+from .models import Bill, Customer
+
+
+def create_search_schema(sender, using, **kwargs):
+    """Recreate FTS5 triggers that a table rebuild in a migration dropped"""
+    ensure_search_schema(connections[using])
+
+
+@receiver(post_save, sender=Bill)
+def index_saved_bill(sender, instance, **kwargs):
+    index_object('bill', instance)
+
+
+@receiver(post_delete, sender=Bill)
+def unindex_deleted_bill(sender, instance, **kwargs):
+    unindex_object('bill', instance.id)
+
+
+@receiver(post_save, sender=Customer)
+def index_saved_customer(sender, instance, **kwargs):
+    index_object('customer', instance)
+
+
+@receiver(post_delete, sender=Customer)
+def unindex_deleted_customer(sender, instance, **kwargs):
+    unindex_object('customer', instance.id)
@@ -0,0 +1,171 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from unittest import skipUnless
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import OperationalError, connection
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from api.views import create_bill_api
+from products.models import Product
+from users.models import Shop
+from .checkout import commit_bill
+from .models import Bill, StockReservation
+from .reservations import reserve
+from .sequences import _blocks, allocate_bill_number, format_bill_number, reserve_block
+
+
+class BillingTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='cashier', password='pw')
+        self.shop = Shop.objects.create(owner=self.user, name='Test shop', address='-', whatsapp='0')
+        self.product = Product.objects.create(shop=self.shop, name='Tea', sale_price=Decimal('50.00'), stock=100)
+        self.client.force_login(self.user)
+
+
+class BillsListTests(BillingTestCase):
+    def setUp(self):
+        super().setUp()
+        for _ in range(3):
+            commit_bill(self.shop, [(self.product.id, 2)])
+
+    def _page_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('billing:bills_list'))
+        self.assertEqual(response.status_code, 200)
+        page = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and 'FROM "billing_bill"' in query['sql'] and 'LIMIT' in query['sql']
+        ]
+        self.assertEqual(len(page), 1)
+        return response, page[0]
+
+    def test_item_counts_come_from_one_query_for_the_page(self):
+        response, sql = self._page_query()
+        self.assertNotIn('GROUP BY', sql)
+        self.assertEqual([bill.item_count for bill in response.context['bills']], [1, 1, 1])
+
+    @skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+    def test_page_walks_the_shop_date_index(self):
+        _, sql = self._page_query()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('billing_bill_shop_date_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class CreateBillApiTests(BillingTestCase):
+    def _create(self, items):
+        # The API app is not routed, so call the view directly
+        request = RequestFactory().post('/api/bills/create/', json.dumps({'items': items}), content_type='application/json')
+        request.user = self.user
+        response = create_bill_api(request)
+        return response, json.loads(response.content)
+
+    def test_lines_are_priced_from_the_product(self):
+        response, data = self._create([{'product_id': self.product.id, 'quantity': 2, 'unit_price': '0'}])
+        self.assertEqual(response.status_code, 201)
+        bill = Bill.objects.get(pk=data['data']['bill_id'])
+        self.assertEqual(bill.items.get().unit_price, Decimal('50.00'))
+        self.assertEqual(bill.subtotal, Decimal('100.00'))
+        self.assertGreaterEqual(bill.total, Decimal('100.00'))
+
+    def test_another_shops_product_is_rejected(self):
+        owner = User.objects.create_user(username='other', password='pw')
+        shop = Shop.objects.create(owner=owner, name='Other shop', address='-', whatsapp='0')
+        product = Product.objects.create(shop=shop, name='Coffee', sale_price=Decimal('80.00'), stock=10)
+        response, _ = self._create([{'product_id': product.id, 'quantity': 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Bill.objects.exists())
+
+
+class CheckoutReservationTests(BillingTestCase):
+    def setUp(self):
+        super().setUp()
+        Product.objects.filter(pk=self.product.pk).update(stock=1)
+        # Another till holds the last unit
+        reserve(self.user, 'till-2', self.product.id, 1)
+
+    def test_unexpired_reservation_blocks_the_last_unit(self):
+        with self.assertRaises(ValidationError):
+            commit_bill(self.shop, [(self.product.id, 1)])
+
+    def test_expired_reservation_is_released_for_checkout(self):
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(hours=2))
+        commit_bill(self.shop, [(self.product.id, 1)])
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.reserved), (0, 0))
+        self.assertFalse(StockReservation.objects.exists())
+
+
+class ReservedCartCheckoutTests(BillingTestCase):
+    """Lines covered by the till's own reservations skip the stock check"""
+
+    def setUp(self):
+        super().setUp()
+        reserve(self.user, 'till-1', self.product.id, 2)
+
+    def _commit(self, quantity):
+        return commit_bill(self.shop, [(self.product.id, quantity)], held_by=(self.user, 'till-1'))
+
+    def test_quantity_is_normalized_to_the_unit(self):
+        bill = self._commit('1.5')
+        self.assertEqual(bill.items.get().quantity, Decimal('1'))
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.reserved), (99, 0))
+
+    def test_invalid_quantity_is_a_validation_error(self):
+        for quantity in ('abc', None, 'nan', 'inf'):
+            with self.subTest(quantity=quantity), self.assertRaises(ValidationError):
+                self._commit(quantity)
+
+    def test_invalid_product_id_is_a_validation_error(self):
+        with self.assertRaises(ValidationError):
+            commit_bill(self.shop, [('abc', 1)], held_by=(self.user, 'till-1'))
+        self.assertFalse(Bill.objects.exists())
+
+
+class BillNumberConcurrencyTests(TransactionTestCase):
+    """Numbers taken from many threads at once, each on its own connection"""
+
+    def setUp(self):
+        owner = User.objects.create_user(username='owner', password='pw')
+        self.shop = Shop.objects.create(owner=owner, name='Test shop', address='-', whatsapp='0')
+        self.day = timezone.now().date()
+        _blocks.clear()
+
+    def _run(self, func, calls=80, workers=8):
+        def call(_):
+            try:
+                for attempt in range(50):
+                    try:
+                        return func()
+                    except OperationalError:
+                        # SQLite reports a locked database when writers pile up
+                        time.sleep(0.01 * (attempt + 1))
+                raise AssertionError('Database stayed locked')
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(call, range(calls)))
+
+    def test_allocated_numbers_are_unique_and_consecutive(self):
+        numbers = self._run(lambda: allocate_bill_number(self.shop, self.day))
+        self.assertEqual(sorted(numbers), [format_bill_number(self.shop.id, self.day, value) for value in range(1, 81)])
+
+    @override_settings(BILL_NUMBER_BLOCK_SIZE=5)
+    def test_allocated_numbers_from_blocks_are_unique(self):
+        numbers = self._run(lambda: allocate_bill_number(self.shop, self.day))
+        self.assertEqual(len(set(numbers)), len(numbers))
+
+    def test_reserved_blocks_do_not_overlap(self):
+        blocks = self._run(lambda: reserve_block(self.shop.id, self.day, 3))
+        values = [value for first, last in blocks for value in range(first, last + 1)]
+        self.assertEqual(sorted(values), list(range(1, 241)))
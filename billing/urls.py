@@ -6,14 +6,20 @@ app_name = 'billing'
 urlpatterns = [
     path('pos/', views.pos_interface, name='pos'),
     path('search-products/', views.search_products, name='search_products'),
+    path('catalog/', views.pos_catalog, name='pos_catalog'),
+    path('catalog/delta/', views.pos_catalog_delta, name='pos_catalog_delta'),
+    path('scan/', views.scan_barcode, name='scan_barcode'),
     path('add-to-cart/', views.add_to_cart, name='add_to_cart'),
     path('update-cart/', views.update_cart, name='update_cart'),
     path('remove-from-cart/', views.remove_from_cart, name='remove_from_cart'),
     path('clear-cart/', views.clear_cart, name='clear_cart'),
     path('create-bill/', views.create_bill, name='create_bill'),
+    path('sync/', views.sync_bills, name='sync_bills'),
     path('bill/<int:bill_id>/', views.bill_detail, name='bill_detail'),
     path('bill/<int:bill_id>/pdf/', views.bill_pdf, name='bill_pdf'),
+    path('bill/<int:bill_id>/receipt/', views.bill_receipt, name='bill_receipt'),
     path('bills/', views.bills_list, name='bills_list'),
+    path('bills/export/', views.export_receipts, name='export_receipts'),
     path('history/', views.bill_history, name='bill_history'),
     path('search-customers/', views.search_customers, name='search_customers'),
 ]
\ No newline at end of file
@@ -1,21 +1,39 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.contrib import messages
-from django.db.models import Q
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Sum
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_date
 from .models import Bill, BillItem, Customer
+from .cart import CartStore
+from .checkout import FRACTIONAL_UNITS, commit_bill, commit_bill_batch, normalize_quantity
+from .exports import receipt_archive
+from .fulltext import filter_by_text, search_customer_ids
+from .phones import find_customer
+from .receipts import THERMAL_LAYOUTS, get_receipt_pdf, receipt_data, receipt_etag, render_escpos, render_text
+from products.catalog import catalog_delta, catalog_snapshot, current_catalog_version
 from products.models import Product, Category
+from products.search_index import find_by_barcode, search_product_ids
 from shopcloud.language_utils import get_user_language, get_template_name
+from shopcloud.pagination import keyset_paginate
 import json
+from datetime import datetime, timedelta, timezone as dt_timezone
 from decimal import Decimal, InvalidOperation
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.units import inch
+
+# Largest number of offline bills accepted in one sync request
+SYNC_BATCH_LIMIT = 500
+
+# Rows per page of the bill listings
+BILLS_PER_PAGE = 50
+
+# Browser cache lifetime for downloaded receipts
+RECEIPT_MAX_AGE = 24 * 60 * 60
 
 @login_required
 def pos_interface(request):
-    products = Product.objects.filter(shop=request.user.shop, stock__gt=0)[:20]
     categories = Category.objects.filter(shop=request.user.shop)
     
     # Check language preference
@@ -25,78 +43,144 @@ def pos_interface(request):
     else:
         template_name = 'billing/pos_new.html'
     
+    # Products are not rendered here: the till loads the catalog from pos_catalog
     return render(request, template_name, {
-        'products': products,
         'categories': categories
     })
 
+def _product_json(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'price': float(product.sale_price),
+        'stock': product.stock,
+        'barcode': product.barcode or '',
+        'image': product.image.url if product.image else None,
+        'unit': product.unit
+    }
+
 @login_required
 def search_products(request):
     query = request.GET.get('q', '').strip()
     if len(query) < 1:
         return JsonResponse({'products': []})
     
-    products = Product.objects.filter(
-        Q(name__icontains=query) | Q(barcode__icontains=query),
-        shop=request.user.shop,
-        is_active=True
-    ).order_by('-stock', 'name')[:10]
-    
-    product_list = []
-    for product in products:
-        product_list.append({
-            'id': product.id,
-            'name': product.name,
-            'price': float(product.sale_price),
-            'stock': product.stock,
-            'barcode': product.barcode or '',
-            'image': product.image.url if product.image else None,
-            'unit': product.unit
-        })
+    # Ranked matches from the in-memory catalog index; stock and price are read fresh
+    ids = search_product_ids(request.user.shop, query, limit=10)
+    position = {product_id: i for i, product_id in enumerate(ids)}
+    products = sorted(
+        Product.objects.filter(id__in=ids, shop=request.user.shop, is_active=True),
+        key=lambda product: (product.stock <= 0, position[product.id])
+    )
+    
+    product_list = [_product_json(product) for product in products]
     
     return JsonResponse({'products': product_list})
 
+@login_required
+def pos_catalog(request):
+    """Full active catalog for a till to search locally, tagged with its catalog version"""
+    shop = request.user.shop
+    
+    # The version tells whether the till's copy is still current; stock sold
+    # meanwhile reaches it through the stock_since of its next delta
+    etag = f'"catalog-{shop.id}-{current_catalog_version(shop.id)}"'
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        not_modified['ETag'] = etag
+        return not_modified
+    
+    response = JsonResponse(catalog_snapshot(shop))
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+@login_required
+def pos_catalog_delta(request):
+    """Products written since the till's catalog version, and stock sold since its last read"""
+    try:
+        since = int(request.GET.get('since', ''))
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid catalog version'})
+    
+    stock_since = None
+    if request.GET.get('stock_since'):
+        try:
+            stock_since = datetime.fromtimestamp(float(request.GET['stock_since']), tz=dt_timezone.utc)
+        except (ValueError, OverflowError, OSError):
+            return JsonResponse({'success': False, 'error': 'Invalid stock sync time'})
+    
+    return JsonResponse(catalog_delta(request.user.shop, since, stock_since))
+
+def _add_product_to_cart(cart, product, quantity):
+    """Add ``quantity`` of ``product`` to the cart, capped at available stock"""
+    quantity = normalize_quantity(quantity, product.unit)
+    
+    if product.stock < quantity:
+        raise ValidationError('Insufficient stock')
+    
+    line = cart.get(product.id)
+    if line:
+        quantity += line[0]
+    
+    # Check total quantity doesn't exceed stock
+    if quantity > product.stock:
+        quantity = product.stock
+    
+    cart.set_line(product.id, quantity, line[1] if line else product.sale_price)
+
 @login_required
 def add_to_cart(request):
     if request.method == 'POST':
         data = json.loads(request.body)
         product_id = data.get('product_id')
-        quantity = int(data.get('quantity', 1))
         
         try:
             product = Product.objects.get(id=product_id, shop=request.user.shop)
+            cart = CartStore.for_request(request)
+            _add_product_to_cart(cart, product, data.get('quantity', 1))
             
-            if product.stock < quantity:
-                return JsonResponse({'success': False, 'error': 'Insufficient stock'})
-            
-            # Get or create cart in session
-            cart = request.session.get('cart', {})
-            
-            if str(product_id) in cart:
-                cart[str(product_id)]['quantity'] += quantity
-            else:
-                cart[str(product_id)] = {
-                    'name': product.name,
-                    'price': float(product.sale_price),
-                    'quantity': quantity,
-                    'stock': product.stock,
-                    'unit': product.unit
-                }
-            
-            # Check total quantity doesn't exceed stock
-            if cart[str(product_id)]['quantity'] > product.stock:
-                cart[str(product_id)]['quantity'] = product.stock
-            
-            request.session['cart'] = cart
-            request.session.modified = True
-            
-            return JsonResponse({'success': True, 'cart': cart})
+            return JsonResponse({'success': True, 'cart': cart.as_dict()})
             
         except Product.DoesNotExist:
             return JsonResponse({'success': False, 'error': 'Product not found'})
+        except ValidationError as e:
+            return JsonResponse({'success': False, 'error': ' '.join(e.messages)})
+        except (ValueError, TypeError):
+            return JsonResponse({'success': False, 'error': 'Invalid quantity format'})
     
     return JsonResponse({'success': False})
 
+@login_required
+def scan_barcode(request):
+    """Resolve a scanned barcode to one product and optionally add it to the cart"""
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+        except json.JSONDecodeError:
+            return JsonResponse({'success': False, 'error': 'Invalid JSON data'})
+    else:
+        data = request.GET
+    
+    product = find_by_barcode(request.user.shop, data.get('barcode'))
+    if product is None:
+        return JsonResponse({'success': False, 'found': False, 'error': 'Product not found'})
+    
+    response = {'success': True, 'found': True, 'product': _product_json(product)}
+    
+    if request.method == 'POST' and data.get('add'):
+        default_quantity = 0.5 if product.unit in FRACTIONAL_UNITS else 1
+        cart = CartStore.for_request(request)
+        try:
+            _add_product_to_cart(cart, product, data.get('quantity') or default_quantity)
+        except ValidationError as e:
+            return JsonResponse({'success': False, 'found': True, 'product': response['product'], 'error': ' '.join(e.messages)})
+        except (ValueError, TypeError):
+            return JsonResponse({'success': False, 'found': True, 'error': 'Invalid quantity format'})
+        response['cart'] = cart.as_dict()
+    
+    return JsonResponse(response)
+
 @login_required
 def update_cart(request):
     if request.method == 'POST':
@@ -104,18 +188,19 @@ def update_cart(request):
         product_id = str(data.get('product_id'))
         quantity = data.get('quantity', 1)
         
-        cart = request.session.get('cart', {})
+        cart = CartStore.for_request(request)
+        line = cart.get(product_id) if product_id.isdigit() else None
         
-        if product_id in cart:
+        if line:
             if quantity <= 0:
-                del cart[product_id]
+                cart.remove_line(product_id)
             else:
                 # Check stock and validate quantity based on unit
                 try:
                     product = Product.objects.get(id=product_id, shop=request.user.shop)
                     
                     # Validate quantity based on unit type
-                    if product.unit in ['kg', 'liter']:
+                    if product.unit in FRACTIONAL_UNITS:
                         quantity = float(quantity)
                         if quantity <= 0:
                             return JsonResponse({'success': False, 'error': 'Invalid quantity'})
@@ -127,18 +212,16 @@ def update_cart(request):
                     if quantity > product.stock:
                         quantity = product.stock
                     
-                    cart[product_id]['quantity'] = quantity
-                    cart[product_id]['unit'] = product.unit  # Ensure unit is updated
+                    cart.set_line(product_id, quantity, line[1])
                     
                 except Product.DoesNotExist:
-                    del cart[product_id]
+                    cart.remove_line(product_id)
+                except ValidationError as e:
+                    return JsonResponse({'success': False, 'error': ' '.join(e.messages), 'cart': cart.as_dict()})
                 except ValueError:
                     return JsonResponse({'success': False, 'error': 'Invalid quantity format'})
         
-        request.session['cart'] = cart
-        request.session.modified = True
-        
-        return JsonResponse({'success': True, 'cart': cart})
+        return JsonResponse({'success': True, 'cart': cart.as_dict()})
     
     return JsonResponse({'success': False})
 
@@ -148,23 +231,19 @@ def remove_from_cart(request):
         data = json.loads(request.body)
         product_id = str(data.get('product_id'))
         
-        cart = request.session.get('cart', {})
-        
-        if product_id in cart:
-            del cart[product_id]
+        cart = CartStore.for_request(request)
         
-        request.session['cart'] = cart
-        request.session.modified = True
+        if product_id.isdigit():
+            cart.remove_line(product_id)
         
-        return JsonResponse({'success': True, 'cart': cart})
+        return JsonResponse({'success': True, 'cart': cart.as_dict()})
     
     return JsonResponse({'success': False})
 
 @login_required
 def clear_cart(request):
     if request.method == 'POST':
-        request.session['cart'] = {}
-        request.session.modified = True
+        CartStore.for_request(request).clear()
         return JsonResponse({'success': True})
     
     return JsonResponse({'success': False})
@@ -177,9 +256,10 @@ def create_bill(request):
         except json.JSONDecodeError:
             return JsonResponse({'success': False, 'error': 'Invalid JSON data'})
         
-        cart = request.session.get('cart', {})
+        cart = CartStore.for_request(request)
+        cart_lines = cart.lines()
         
-        if not cart:
+        if not cart_lines:
             return JsonResponse({'success': False, 'error': 'Cart is empty'})
         
         try:
@@ -189,14 +269,11 @@ def create_bill(request):
             if payment_type not in valid_payment_types:
                 payment_type = 'cash'
             
-            # Validate amounts
+            # Subtotal, tax and total are priced on the server; only the discount is the cashier's
             try:
-                subtotal = Decimal(str(data.get('subtotal', 0)))
-                tax = Decimal(str(data.get('tax', 0)))
                 discount = Decimal(str(data.get('discount', 0)))
-                total = Decimal(str(data.get('total', 0)))
                 
-                if subtotal < 0 or tax < 0 or discount < 0 or total < 0:
+                if discount < 0:
                     return JsonResponse({'success': False, 'error': 'Invalid amount values'})
             except (ValueError, InvalidOperation):
                 return JsonResponse({'success': False, 'error': 'Invalid amount format'})
@@ -206,87 +283,51 @@ def create_bill(request):
             customer_name = data.get('customer_name', '').strip()[:100]
             customer_email = data.get('customer_email', '').strip()
             
+            customer = None
             if customer_phone and customer_name:
-                # Try to find existing customer
-                customer, created = Customer.objects.get_or_create(
-                    phone=customer_phone,
-                    shop=request.user.shop,
-                    defaults={
-                        'name': customer_name,
-                        'email': customer_email
-                    }
-                )
+                # Match on the normalized number so +92/0 variants find the same customer
+                customer = find_customer(request.user.shop, customer_phone)
+                if customer is None:
+                    customer = Customer.objects.create(
+                        phone=customer_phone,
+                        shop=request.user.shop,
+                        name=customer_name,
+                        email=customer_email
+                    )
                 # Update if exists but data changed
-                if not created and (customer.name != customer_name or customer.email != customer_email):
+                elif customer.name != customer_name or customer.email != customer_email:
                     customer.name = customer_name
                     customer.email = customer_email
                     customer.save()
             
-            # Create bill
-            bill = Bill.objects.create(
-                shop=request.user.shop,
+            # Create bill, bill items and stock updates in one transaction
+            lines = [(product_id, quantity) for product_id, (quantity, _) in cart_lines.items()]
+            bill = commit_bill(
+                request.user.shop,
+                lines,
                 customer_name=customer_name,
                 customer_phone=customer_phone,
+                customer=customer,
                 payment_type=payment_type,
-                subtotal=subtotal,
-                tax=tax,
                 discount=discount,
-                total=total
+                held_by=(cart.user, cart.till)
             )
             
-            # Create bill items and update stock
-            for product_id, item in cart.items():
-                try:
-                    product = Product.objects.get(id=product_id, shop=request.user.shop)
-                except Product.DoesNotExist:
-                    return JsonResponse({'success': False, 'error': f'Product {product_id} not found'})
-                
-                # Handle quantity based on unit type
-                if product.unit in ['kg', 'liter']:
-                    quantity = float(item.get('quantity', 0))
-                else:
-                    quantity = int(item.get('quantity', 0))
-                
-                if quantity <= 0:
-                    continue
-                
-                if product.stock < quantity:
-                    return JsonResponse({'success': False, 'error': f'Insufficient stock for {product.name}'})
-                
-                try:
-                    unit_price = Decimal(str(item.get('price', 0)))
-                    quantity_decimal = Decimal(str(quantity))
-                    if unit_price < 0:
-                        return JsonResponse({'success': False, 'error': 'Invalid product price'})
-                except (ValueError, InvalidOperation):
-                    return JsonResponse({'success': False, 'error': 'Invalid price format'})
-                
-                BillItem.objects.create(
-                    bill=bill,
-                    product=product,
-                    quantity=quantity_decimal,
-                    unit_price=unit_price,
-                    total_price=unit_price * quantity_decimal
-                )
-                
-                # Update stock
-                product.stock -= quantity
-                if product.stock < 0:
-                    product.stock = 0
-                product.save()
-            
-            # Clear cart
-            request.session['cart'] = {}
-            request.session.modified = True
+            # Clear the billed lines; any added meanwhile from another request stay
+            cart.clear(product_ids=list(cart_lines))
             
             return JsonResponse({
                 'success': True, 
                 'bill_id': bill.id,
-                'bill_number': bill.bill_number
+                'bill_number': bill.bill_number,
+                'subtotal': float(bill.subtotal),
+                'tax': float(bill.tax),
+                'discount': float(bill.discount),
+                'total': float(bill.total)
             })
             
-        except Product.DoesNotExist as e:
-            return JsonResponse({'success': False, 'error': 'Product not found'})
+        except ValidationError as e:
+            return JsonResponse({'success': False, 'error': ' '.join(e.messages)})
         except ValueError as e:
             import traceback
             print(f"ValueError: {str(e)}")
@@ -300,134 +341,169 @@ def create_bill(request):
     
     return JsonResponse({'success': False, 'error': 'Invalid request method'})
 
+@login_required
+def sync_bills(request):
+    """Upload bills a till recorded while it was offline"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Invalid request method'})
+    
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Invalid JSON data'})
+    
+    bills = data.get('bills') if isinstance(data, dict) else None
+    if not isinstance(bills, list) or not all(isinstance(bill, dict) for bill in bills):
+        return JsonResponse({'success': False, 'error': 'bills must be a list of bill objects'})
+    if len(bills) > SYNC_BATCH_LIMIT:
+        return JsonResponse({'success': False, 'error': f'At most {SYNC_BATCH_LIMIT} bills per upload'})
+    
+    results = commit_bill_batch(request.user.shop, bills)
+    return JsonResponse({'success': True, 'results': results})
+
 @login_required
 def bill_detail(request, bill_id):
     bill = get_object_or_404(Bill, id=bill_id, shop=request.user.shop)
     return render(request, 'billing/bill_detail.html', {'bill': bill})
 
-@login_required
-def bills_list(request):
-    search = request.GET.get('search', '')
-    payment_type = request.GET.get('payment_type', '')
-    from_date = request.GET.get('from_date', '')
-    to_date = request.GET.get('to_date', '')
-    bills = Bill.objects.filter(shop=request.user.shop)
+def _day_start(value):
+    """Aware midnight at the start of a ``YYYY-MM-DD`` filter value, or ``None``"""
+    try:
+        day = parse_date(value or '')
+    except ValueError:
+        return None
+    if day is None:
+        return None
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+def _filter_bills(shop, search='', payment_type='', from_date='', to_date=''):
+    """The shop's bills narrowed by the filters of the bill listings"""
+    bills = Bill.objects.filter(shop=shop)
     
     if search:
-        bills = bills.filter(
-            Q(bill_number__icontains=search) |
-            Q(customer_name__icontains=search) |
-            Q(customer_phone__icontains=search)
-        )
+        bills = filter_by_text(bills, 'bill', shop, search)
     
     if payment_type:
         bills = bills.filter(payment_type=payment_type)
     
-    if from_date:
-        bills = bills.filter(date__date__gte=from_date)
+    # Plain datetime bounds keep the (shop, date) index usable, unlike date__date
+    start = _day_start(from_date)
+    if start:
+        bills = bills.filter(date__gte=start)
     
-    if to_date:
-        bills = bills.filter(date__date__lte=to_date)
+    end = _day_start(to_date)
+    if end:
+        bills = bills.filter(date__lt=end + timedelta(days=1))
     
-    bills = bills.order_by('-date')[:100]
+    return bills
+
+def _bills_list_filters(request):
+    return _filter_bills(
+        request.user.shop,
+        search=request.GET.get('search', ''),
+        payment_type=request.GET.get('payment_type', ''),
+        from_date=request.GET.get('from_date', ''),
+        to_date=request.GET.get('to_date', '')
+    )
+
+def _attach_item_counts(bills):
+    """Set ``item_count`` on ``bills`` from one grouped query over just their items"""
+    counts = dict(
+        BillItem.objects.filter(bill_id__in=[bill.id for bill in bills]).values('bill_id').annotate(
+            count=Count('id')
+        ).order_by().values_list('bill_id', 'count')
+    )
+    for bill in bills:
+        bill.item_count = counts.get(bill.id, 0)
+
+@login_required
+def bills_list(request):
+    search = request.GET.get('search', '')
+    from_date = request.GET.get('from_date', '')
+    to_date = request.GET.get('to_date', '')
+    bills = _bills_list_filters(request)
     
-    # Calculate stats
-    total_amount = sum(bill.total for bill in bills)
+    # Stats cover the whole filter, not just the page on screen
+    stats = bills.aggregate(total_bills=Count('id'), total_amount=Sum('total'))
+    # Paginate the bare rows so every page walks the (shop, date) index;
+    # a join and GROUP BY here would sort the shop's whole history each time
+    page = keyset_paginate(request, bills, per_page=BILLS_PER_PAGE)
+    _attach_item_counts(page)
     
     language = get_user_language(request)
     template_name = get_template_name('billing/bills_list.html', language)
     return render(request, template_name, {
-        'bills': bills, 
+        'bills': page,
+        'page': page,
         'search': search,
         'from_date': from_date,
         'to_date': to_date,
-        'total_amount': total_amount
+        'total_bills': stats['total_bills'],
+        'total_amount': stats['total_amount'] or 0
     })
 
+@login_required
+def export_receipts(request):
+    """All receipts matching the bills list filters as one ZIP download"""
+    response = StreamingHttpResponse(receipt_archive(_bills_list_filters(request)), content_type='application/zip')
+    from_date = request.GET.get('from_date') or 'start'
+    to_date = request.GET.get('to_date') or timezone.now().strftime('%Y-%m-%d')
+    response['Content-Disposition'] = f'attachment; filename="receipts_{from_date}_{to_date}.zip"'
+    return response
+
 @login_required
 def bill_pdf(request, bill_id):
-    bill = get_object_or_404(Bill, id=bill_id, shop=request.user.shop)
+    bill = get_object_or_404(Bill.objects.select_related('shop'), id=bill_id, shop=request.user.shop)
     
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="bill_{bill.bill_number}.pdf"'
-    
-    p = canvas.Canvas(response, pagesize=letter)
-    width, height = letter
-    
-    # Header
-    p.setFont("Helvetica-Bold", 20)
-    p.drawString(width/2 - 100, height-50, bill.shop.name)
-    p.setFont("Helvetica", 12)
-    p.drawString(width/2 - 50, height-70, bill.shop.address or '')
-    
-    # Bill info
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(50, height-120, f"Bill #{bill.bill_number}")
-    p.setFont("Helvetica", 10)
-    p.drawString(50, height-140, f"Date: {bill.date.strftime('%d %b %Y, %H:%M')}")
-    p.drawString(50, height-155, f"Payment: {bill.get_payment_type_display()}")
-    
-    if bill.customer_name:
-        p.drawString(300, height-140, f"Customer: {bill.customer_name}")
-    if bill.customer_phone:
-        p.drawString(300, height-155, f"Phone: {bill.customer_phone}")
-    
-    # Items table
-    y = height - 200
-    p.setFont("Helvetica-Bold", 10)
-    p.drawString(50, y, "Item")
-    p.drawString(300, y, "Qty")
-    p.drawString(350, y, "Price")
-    p.drawString(450, y, "Total")
-    
-    y -= 20
-    p.setFont("Helvetica", 9)
-    
-    for item in bill.items.all():
-        p.drawString(50, y, item.product.name[:30])
-        p.drawString(300, y, str(item.quantity))
-        p.drawString(350, y, f"Rs. {item.unit_price}")
-        p.drawString(450, y, f"Rs. {item.total_price}")
-        y -= 15
-    
-    # Totals
-    y -= 20
-    p.setFont("Helvetica-Bold", 10)
-    p.drawString(350, y, f"Subtotal: Rs. {bill.subtotal}")
-    y -= 15
-    if bill.tax > 0:
-        p.drawString(350, y, f"Tax: Rs. {bill.tax}")
-        y -= 15
-    if bill.discount > 0:
-        p.drawString(350, y, f"Discount: Rs. {bill.discount}")
-        y -= 15
-    p.setFont("Helvetica-Bold", 12)
-    p.drawString(350, y, f"Total: Rs. {bill.total}")
-    
-    # Footer
-    p.setFont("Helvetica", 8)
-    p.drawString(width/2 - 80, 50, "Thank you for your business!")
-    p.drawString(width/2 - 60, 35, "Powered by ShopCloud")
-    
-    p.showPage()
-    p.save()
+    # Receipts never change once the bill is committed, so reprints are served
+    # from the render cache and repeat downloads can be answered with a 304
+    etag = receipt_etag(bill)
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        not_modified['ETag'] = etag
+        return not_modified
     
+    response = HttpResponse(get_receipt_pdf(bill), content_type='application/pdf')
+    response['Content-Disposition'] = f'attachment; filename="bill_{bill.bill_number}.pdf"'
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=RECEIPT_MAX_AGE)
+    return response
+
+@login_required
+def bill_receipt(request, bill_id):
+    """Receipt in the shop's configured format; thermal shops get text or ?output=escpos bytes"""
+    bill = get_object_or_404(Bill.objects.select_related('shop'), id=bill_id, shop=request.user.shop)
+    layout = THERMAL_LAYOUTS.get(bill.shop.receipt_format)
+    if layout is None:
+        return bill_pdf(request, bill_id)
+    
+    data = receipt_data(bill)
+    if request.GET.get('output') == 'escpos':
+        response = HttpResponse(render_escpos(data, layout), content_type='application/octet-stream')
+        response['Content-Disposition'] = f'attachment; filename="bill_{bill.bill_number}.bin"'
+    else:
+        response = HttpResponse(render_text(data, layout), content_type='text/plain; charset=utf-8')
+    patch_cache_control(response, private=True, max_age=RECEIPT_MAX_AGE)
     return response
 
 @login_required
 def bill_history(request):
     search = request.GET.get('search', '')
-    bills = Bill.objects.filter(shop=request.user.shop)
-    
-    if search:
-        bills = bills.filter(
-            Q(bill_number__icontains=search) |
-            Q(customer_name__icontains=search) |
-            Q(customer_phone__icontains=search)
-        )
-    
-    bills = bills.order_by('-date')[:50]
-    return render(request, 'billing/bill_history.html', {'bills': bills, 'search': search})
+    date_from = request.GET.get('date_from', '')
+    date_to = request.GET.get('date_to', '')
+    bills = _filter_bills(request.user.shop, search=search, from_date=date_from, to_date=date_to)
+    
+    stats = bills.aggregate(total_bills=Count('id'), total_amount=Sum('total'))
+    page = keyset_paginate(request, bills, per_page=BILLS_PER_PAGE)
+    return render(request, 'billing/bill_history.html', {
+        'bills': page,
+        'page': page,
+        'search': search,
+        'date_from': date_from,
+        'date_to': date_to,
+        'total_bills': stats['total_bills'],
+        'total_amount': stats['total_amount'] or 0
+    })
 
 @login_required
 def search_customers(request):
@@ -435,13 +511,11 @@ def search_customers(request):
     if len(query) < 2:
         return JsonResponse({'customers': []})
     
-    customers = Customer.objects.filter(
-        Q(name__icontains=query) | Q(phone__icontains=query),
-        shop=request.user.shop
-    )[:10]
+    ids = search_customer_ids(request.user.shop, query, limit=10)
+    customers = Customer.objects.in_bulk(ids)
     
     customer_list = []
-    for customer in customers:
+    for customer in (customers[customer_id] for customer_id in ids if customer_id in customers):
         customer_list.append({
             'id': customer.id,
             'name': customer.name,
@@ -9,4 +9,6 @@ urlpatterns = [
     path('add/', views.add_customer, name='add'),
     path('add/ur/', views.add_customer_ur, name='add_ur'),
     path('<int:customer_id>/', views.customer_detail, name='detail'),
+    path('<int:customer_id>/ledger/', views.customer_ledger, name='ledger'),
+    path('udhaar/', views.udhaar_receivables, name='udhaar'),
 ]
\ No newline at end of file
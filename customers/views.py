@@ -1,46 +1,80 @@
+from decimal import Decimal, InvalidOperation
+from urllib.parse import quote
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.db.models import Sum, Count
+from django.core.paginator import Paginator
+from django.db.models import DecimalField, ExpressionWrapper, F, Value
+from django.db.models.functions import Coalesce, NullIf
 from django.contrib import messages
-from billing.models import Customer, Bill
+from django.core.exceptions import ValidationError
+from billing.credit import aging_report, post_entry, reminder_list
+from billing.models import CreditLedgerEntry, Customer, CustomerStats
+from billing.fulltext import filter_by_text
+from billing.phones import find_customer, international_phone
 from shopcloud.language_utils import get_user_language, get_template_name
+from shopcloud.pagination import keyset_paginate
 
-@login_required
-def customers_list(request):
+# Columns the customer list can be sorted by; a leading "-" sorts descending
+CUSTOMER_SORT_FIELDS = ['name', 'created_at', 'total_bills', 'total_spent', 'last_visit', 'avg_bill']
+
+CUSTOMERS_PER_PAGE = 50
+
+LEDGER_ENTRIES_PER_PAGE = 50
+
+def _customer_list_context(request):
+    """Customers of the shop with their lifetime stats, filtered, sorted and paginated"""
     shop = request.user.shop
-    customers = Customer.objects.filter(shop=shop).order_by('-created_at')
+    search = request.GET.get('search', '')
+    sort = request.GET.get('sort', '-created_at')
+    if sort.lstrip('-') not in CUSTOMER_SORT_FIELDS:
+        sort = '-created_at'
     
-    # Add bill stats manually
-    for customer in customers:
-        customer_bills = Bill.objects.filter(
-            shop=shop,
-            customer_phone=customer.phone
+    # Stats come from the maintained CustomerStats rows, so the page never touches bills
+    customers = filter_by_text(Customer.objects.filter(shop=shop), 'customer', shop, search).annotate(
+        total_bills=Coalesce(F('stats__bill_count'), Value(0)),
+        total_spent=Coalesce(F('stats__total_spent'), Value(0), output_field=DecimalField()),
+        last_visit=F('stats__last_purchase'),
+        avg_bill=ExpressionWrapper(
+            F('stats__total_spent') / NullIf(F('stats__bill_count'), Value(0)), output_field=DecimalField()
         )
-        customer.total_bills = customer_bills.count()
-        customer.total_spent = customer_bills.aggregate(Sum('total'))['total__sum'] or 0
+    )
     
-    language = get_user_language(request)
-    template_name = get_template_name('customers/list.html', language)
+    field = sort.lstrip('-')
+    ordering = F(field).desc(nulls_last=True) if sort.startswith('-') else F(field).asc(nulls_last=True)
+    customers = customers.order_by(ordering, '-id')
     
-    context = {
-        'customers': customers,
+    page_obj = Paginator(customers, CUSTOMERS_PER_PAGE).get_page(request.GET.get('page'))
+    params = request.GET.copy()
+    params.pop('page', None)
+    return {
+        'customers': page_obj,
+        'page_obj': page_obj,
+        'search': search,
+        'sort': sort,
+        'query_string': params.urlencode(),
     }
-    return render(request, template_name, context)
+
+@login_required
+def customers_list(request):
+    language = get_user_language(request)
+    template_name = get_template_name('customers/list.html', language)
+    return render(request, template_name, _customer_list_context(request))
 
 @login_required
 def customer_detail(request, customer_id):
     shop = request.user.shop
     customer = get_object_or_404(Customer, id=customer_id, shop=shop)
     
-    bills = Bill.objects.filter(
-        shop=shop,
-        customer_phone=customer.phone
-    ).order_by('-date')
+    bills = customer.bills.order_by('-date')
     
+    totals = CustomerStats.objects.filter(customer=customer).first() or CustomerStats(customer=customer, shop=shop)
     stats = {
-        'total_bills': bills.count(),
-        'total_spent': bills.aggregate(Sum('total'))['total__sum'] or 0,
-        'avg_bill': bills.aggregate(Sum('total'))['total__sum'] / bills.count() if bills.count() > 0 else 0
+        'total_bills': totals.bill_count,
+        'total_spent': totals.total_spent,
+        'avg_bill': totals.avg_bill,
+        'first_purchase': totals.first_purchase,
+        'last_purchase': totals.last_purchase,
+        'outstanding_udhaar': totals.outstanding_udhaar,
     }
     
     context = {
@@ -60,10 +94,7 @@ def add_customer(request):
         
         if name and phone:
             # Check if customer already exists
-            existing = Customer.objects.filter(
-                shop=request.user.shop,
-                phone=phone
-            ).first()
+            existing = find_customer(request.user.shop, phone)
             
             if not existing:
                 customer = Customer.objects.create(
@@ -98,23 +129,59 @@ def add_customer(request):
     return render(request, template_name)
 
 @login_required
-def customers_list_ur(request):
+def udhaar_receivables(request):
+    """Who owes the shop what, aged 0-30 / 31-60 / 60+ days, with the reminder list"""
     shop = request.user.shop
-    customers = Customer.objects.filter(shop=shop).order_by('-created_at')
+    rows, totals = aging_report(shop)
     
-    # Add bill stats manually
-    for customer in customers:
-        customer_bills = Bill.objects.filter(
-            shop=shop,
-            customer_phone=customer.phone
-        )
-        customer.total_bills = customer_bills.count()
-        customer.total_spent = customer_bills.aggregate(Sum('total'))['total__sum'] or 0
+    reminders = reminder_list(shop)
+    for reminder in reminders:
+        customer = reminder['customer']
+        message = f"Assalam o Alaikum {customer.name}, your udhaar balance at {shop.name} is Rs. {reminder['balance']:.0f}."
+        phone = international_phone(customer.phone)
+        reminder['whatsapp_url'] = f'https://wa.me/{phone}?text={quote(message)}' if phone else ''
     
     context = {
-        'customers': customers,
+        'rows': rows,
+        'totals': totals,
+        'reminders': reminders,
     }
-    return render(request, 'customers/list_ur.html', context)
+    language = get_user_language(request)
+    return render(request, get_template_name('customers/udhaar.html', language), context)
+
+@login_required
+def customer_ledger(request, customer_id):
+    """Udhaar history of one customer; POST records a repayment or an adjustment"""
+    shop = request.user.shop
+    customer = get_object_or_404(Customer, id=customer_id, shop=shop)
+    
+    if request.method == 'POST':
+        kind = request.POST.get('kind')
+        try:
+            amount = Decimal(request.POST.get('amount', ''))
+            if kind not in ('repayment', 'adjustment') or not amount.is_finite():
+                raise InvalidOperation
+            post_entry(customer, kind, amount, note=request.POST.get('note', '').strip())
+            messages.success(request, 'Ledger entry recorded!')
+        except InvalidOperation:
+            messages.error(request, 'Enter a valid amount!')
+        except ValidationError as e:
+            messages.error(request, ' '.join(e.messages))
+        return redirect('customers:ledger', customer_id=customer.id)
+    
+    stats = CustomerStats.objects.filter(customer=customer).first()
+    entries = CreditLedgerEntry.objects.filter(customer=customer).select_related('bill')
+    context = {
+        'customer': customer,
+        'balance': stats.outstanding_udhaar if stats else 0,
+        'entries': keyset_paginate(request, entries, LEDGER_ENTRIES_PER_PAGE, field='created_at'),
+    }
+    language = get_user_language(request)
+    return render(request, get_template_name('customers/ledger.html', language), context)
+
+@login_required
+def customers_list_ur(request):
+    return render(request, 'customers/list_ur.html', _customer_list_context(request))
 
 @login_required
 def add_customer_ur(request):
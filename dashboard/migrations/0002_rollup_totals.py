@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='categorysalesreport',
+            name='quantity_sold',
+            field=models.DecimalField(decimal_places=3, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='salesanalytics',
+            name='total_cost',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AlterField(
+            model_name='productsalesreport',
+            name='quantity_sold',
+            field=models.DecimalField(decimal_places=3, default=0, max_digits=12),
+        ),
+    ]
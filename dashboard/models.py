@@ -8,6 +8,7 @@ class SalesAnalytics(models.Model):
     total_sales = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     total_bills = models.IntegerField(default=0)
     total_profit = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total_cost = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     shop = models.ForeignKey(Shop, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     
@@ -21,7 +22,7 @@ class SalesAnalytics(models.Model):
 class ProductSalesReport(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     date = models.DateField()
-    quantity_sold = models.IntegerField(default=0)
+    quantity_sold = models.DecimalField(max_digits=12, decimal_places=3, default=0)
     total_revenue = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     total_profit = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     shop = models.ForeignKey(Shop, on_delete=models.CASCADE)
@@ -39,6 +40,7 @@ class CategorySalesReport(models.Model):
     total_revenue = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     total_profit = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     items_sold = models.IntegerField(default=0)
+    quantity_sold = models.DecimalField(max_digits=12, decimal_places=3, default=0)
     shop = models.ForeignKey(Shop, on_delete=models.CASCADE)
     
     class Meta:
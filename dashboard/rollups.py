@@ -0,0 +1,143 @@
+"""
+Daily sales rollups fed from the event outbox
+
+``SalesAnalytics``, ``ProductSalesReport`` and ``CategorySalesReport`` hold
+one row per shop and day (and product or category). The ``dashboard.sales``
+consumer adds each committed bill to them, so dashboard reports read a
+handful of rollup rows instead of every bill and item in the range. The
+consumer runs from the ``process_events`` command, not from page views, so
+reports trail the tills by up to one cron interval.
+"""
+from collections import defaultdict
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, IntegerField, Sum, Count
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.functions import Cast, TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from billing.models import Bill, BillItem
+from events.consumers import consumer
+from events.models import OutboxEvent
+from products.models import Product
+from .models import CategorySalesReport, ProductSalesReport, SalesAnalytics
+
+CONSUMER = 'dashboard.sales'
+
+
+def _zero():
+    return defaultdict(Decimal)
+
+
+def _add(model, key_fields, totals):
+    """Add ``totals`` to the rollup rows with ``key_fields``, creating missing rows"""
+    for key, values in totals.items():
+        lookup = dict(zip(key_fields, key))
+        if not model.objects.filter(**lookup).update(**{field: F(field) + value for field, value in values.items()}):
+            model.objects.create(**lookup, **values)
+
+
+def _bills_as_of(position):
+    """Bills committed by outbox event ``position``: all but those whose event comes later"""
+    later = OutboxEvent.objects.filter(kind='bill.committed', id__gt=position).values(
+        bill_id=Cast(KeyTextTransform('bill', 'payload'), IntegerField())
+    )
+    return Bill.objects.exclude(id__in=later)
+
+
+def rebuild_sales_rollups(position):
+    """Recompute every rollup row from the bills as of event ``position``; used when the consumer starts"""
+    bills = _bills_as_of(position)
+    cost = ExpressionWrapper(F('quantity') * F('product__cost_price'), output_field=DecimalField())
+    items = BillItem.objects.filter(bill__in=bills).annotate(day=TruncDate('bill__date'))
+
+    daily_items = {
+        (row['bill__shop_id'], row['day']): row
+        for row in items.values('bill__shop_id', 'day').annotate(
+            revenue=Sum('total_price'), cost=Sum(cost)
+        ).order_by()
+    }
+    with transaction.atomic():
+        SalesAnalytics.objects.all().delete()
+        ProductSalesReport.objects.all().delete()
+        CategorySalesReport.objects.all().delete()
+
+        rows = []
+        for row in bills.annotate(day=TruncDate('date')).values('shop_id', 'day').annotate(
+            sales=Sum('total'), bills=Count('id')
+        ).order_by():
+            item_totals = daily_items.get((row['shop_id'], row['day']), {})
+            revenue, total_cost = item_totals.get('revenue') or 0, item_totals.get('cost') or 0
+            rows.append(SalesAnalytics(
+                shop_id=row['shop_id'], date=row['day'], total_sales=row['sales'], total_bills=row['bills'],
+                total_profit=revenue - total_cost, total_cost=total_cost
+            ))
+        SalesAnalytics.objects.bulk_create(rows, batch_size=1000)
+
+        ProductSalesReport.objects.bulk_create([
+            ProductSalesReport(
+                shop_id=row['bill__shop_id'], date=row['day'], product_id=row['product_id'],
+                quantity_sold=row['units'], total_revenue=row['revenue'], total_profit=row['revenue'] - (row['cost'] or 0)
+            )
+            for row in items.values('bill__shop_id', 'day', 'product_id').annotate(
+                units=Sum('quantity'), revenue=Sum('total_price'), cost=Sum(cost)
+            ).order_by().iterator()
+        ], batch_size=1000)
+
+        CategorySalesReport.objects.bulk_create([
+            CategorySalesReport(
+                shop_id=row['bill__shop_id'], date=row['day'], category_id=row['product__category_id'],
+                items_sold=row['lines'], quantity_sold=row['units'], total_revenue=row['revenue'],
+                total_profit=row['revenue'] - (row['cost'] or 0)
+            )
+            for row in items.filter(product__category__isnull=False).values(
+                'bill__shop_id', 'day', 'product__category_id'
+            ).annotate(
+                lines=Count('id'), units=Sum('quantity'), revenue=Sum('total_price'), cost=Sum(cost)
+            ).order_by().iterator()
+        ], batch_size=1000)
+
+
+@consumer(CONSUMER, kinds=['bill.committed'], rebuild=rebuild_sales_rollups)
+def apply_committed_bills(events):
+    """Fold a batch of ``bill.committed`` events into the rollups with one write per touched row"""
+    product_ids = {line[0] for event in events for line in event.payload['items']}
+    products = {
+        product_id: (cost_price, category_id)
+        for product_id, cost_price, category_id in Product.objects.filter(id__in=product_ids).values_list(
+            'id', 'cost_price', 'category_id'
+        )
+    }
+
+    daily = defaultdict(_zero)
+    by_product = defaultdict(_zero)
+    by_category = defaultdict(_zero)
+    for event in events:
+        shop_id, payload = event.shop_id, event.payload
+        day = timezone.localtime(parse_datetime(payload['date'])).date()
+        daily[shop_id, day]['total_sales'] += Decimal(payload['total'])
+        daily[shop_id, day]['total_bills'] += 1
+
+        for product_id, quantity, total_price in payload['items']:
+            quantity, total_price = Decimal(quantity), Decimal(total_price)
+            # Priced at today's cost like the reports always were; deleted products count as free
+            cost_price, category_id = products.get(product_id, (Decimal(0), None))
+            cost = cost_price * quantity
+            daily[shop_id, day]['total_cost'] += cost
+            daily[shop_id, day]['total_profit'] += total_price - cost
+
+            if product_id in products:
+                row = by_product[shop_id, day, product_id]
+                row['quantity_sold'] += quantity
+                row['total_revenue'] += total_price
+                row['total_profit'] += total_price - cost
+            if category_id is not None:
+                row = by_category[shop_id, day, category_id]
+                row['items_sold'] += 1
+                row['quantity_sold'] += quantity
+                row['total_revenue'] += total_price
+                row['total_profit'] += total_price - cost
+
+    _add(SalesAnalytics, ('shop_id', 'date'), daily)
+    _add(ProductSalesReport, ('shop_id', 'date', 'product_id'), by_product)
+    _add(CategorySalesReport, ('shop_id', 'date', 'category_id'), by_category)
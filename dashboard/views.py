@@ -10,7 +10,7 @@ from shopcloud.language_utils import get_user_language, get_template_name
 from .utils import (
     get_sales_report, get_top_products, get_category_sales,
     get_daily_sales_chart_data, get_payment_method_stats,
-    get_hourly_sales_pattern, calculate_daily_analytics
+    get_hourly_sales_pattern
 )
 import json
 from django.core.serializers.json import DjangoJSONEncoder
@@ -27,10 +27,7 @@ def main_dashboard(request):
     shop = request.user.shop
     today = timezone.now().date()
     
-    # Calculate today's analytics
-    calculate_daily_analytics(shop, today)
-    
-    # Get today's summary
+    # Get today's summary; the rollups it reads are kept current by process_events
     today_report = get_sales_report(shop, today, today)
     
     # Get this week's data
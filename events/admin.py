@@ -0,0 +1,16 @@
+from django.contrib import admin
+from .models import ConsumerCursor, OutboxEvent
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'shop', 'created_at']
+    list_filter = ['kind', 'shop']
+
+    # Consumers rely on the outbox being append-only
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(ConsumerCursor)
+class ConsumerCursorAdmin(admin.ModelAdmin):
+    list_display = ['name', 'position', 'updated_at']
+    readonly_fields = ['updated_at']
@@ -0,0 +1,154 @@
+"""
+Incremental consumers of the event outbox
+
+A consumer is a function that takes a list of events and folds them into
+its own state. ``process`` hands it the events after its cursor in
+batches, and moves the cursor in the same transaction as the consumer's
+writes, so every event is applied exactly once however often processing
+is interrupted. A missing id holds the cursor until its transaction has
+committed or rolled back, however long that takes. A new consumer starts
+by rebuilding its state from the tables once, as of the newest event, and
+then follows the outbox from there.
+"""
+from collections import namedtuple
+from datetime import timedelta
+from django.db import IntegrityError, transaction
+from django.db.models import Min
+from django.utils import timezone
+from .models import ConsumerCursor, OutboxEvent
+
+Consumer = namedtuple('Consumer', ['name', 'handler', 'kinds', 'rebuild'])
+
+# Kind of the marker left under the id of a rolled back event; never handed to consumers
+GAP = 'outbox.gap'
+
+# Ids below the newest event a new consumer checks for events still committing
+START_GAP_WINDOW = 1000
+
+_consumers = {}
+
+
+def consumer(name, kinds=None, rebuild=None):
+    """
+    Register the decorated ``handler(events)`` as consumer ``name``.
+
+    ``kinds`` limits the events it is handed; ``rebuild(position)`` runs
+    when the consumer has no cursor yet and recomputes its state from
+    scratch, leaving out the changes of events after ``position``: the
+    handler is fed those.
+    """
+    def register(handler):
+        _consumers[name] = Consumer(name, handler, set(kinds) if kinds else None, rebuild)
+        return handler
+    return register
+
+
+def registered_consumers():
+    return dict(_consumers)
+
+
+def _close_gap(event_id):
+    """
+    Wait until the id of a missing event is settled: its event committed or a
+    gap marker stands in for a rolled back one.
+
+    Ids are handed out when a transaction inserts its event but become
+    visible when it commits. Inserting a marker under the id waits on the
+    primary key for as long as the transaction that took it is open, then
+    fails if the event committed and succeeds if it was rolled back.
+    """
+    try:
+        with transaction.atomic():
+            OutboxEvent.objects.create(id=event_id, kind=GAP, payload={})
+    except IntegrityError:
+        # The event committed meanwhile
+        pass
+
+
+def _settled(events, position):
+    """
+    The leading run of ``events`` that can be processed without skipping any.
+
+    The run ends at the first missing id; every missing id before the next
+    event is closed first, so reading the batch again gets past it.
+    """
+    expected = position + 1
+    for index, event in enumerate(events):
+        if event.id != expected:
+            for missing in range(expected, event.id):
+                _close_gap(missing)
+            return events[:index]
+        expected = event.id + 1
+    return events
+
+
+def _start_position():
+    """
+    Id of the newest event, once every missing id among the
+    ``START_GAP_WINDOW`` before it is closed: only transactions still open
+    when an event committed can commit a lower id later, and they took
+    their ids shortly before it
+    """
+    latest = OutboxEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    present = set(OutboxEvent.objects.filter(id__gt=latest - START_GAP_WINDOW).values_list('id', flat=True))
+    # Ids below the oldest event left were pruned, not skipped
+    for missing in range(min(present, default=latest), latest):
+        if missing not in present:
+            _close_gap(missing)
+    return latest
+
+
+def _cursor(consumer):
+    """The consumer's cursor, locked; a new consumer is rebuilt as of the newest event and starts there"""
+    cursor = ConsumerCursor.objects.select_for_update().filter(name=consumer.name).first()
+    if cursor is not None:
+        return cursor
+    position = _start_position()
+    try:
+        with transaction.atomic():
+            cursor = ConsumerCursor.objects.create(name=consumer.name, position=position)
+    except IntegrityError:
+        # Another process started the consumer first
+        return ConsumerCursor.objects.select_for_update().get(name=consumer.name)
+    if consumer.rebuild is not None:
+        # Changes committed meanwhile have later events, which the rebuild
+        # leaves out, so each change is counted once however long it takes
+        consumer.rebuild(position)
+    return cursor
+
+
+def process(name, batch_size=500):
+    """Feed consumer ``name`` everything after its cursor; returns the number of events consumed"""
+    consumer = _consumers[name]
+    processed = 0
+    while True:
+        with transaction.atomic():
+            cursor = _cursor(consumer)
+            fetched = list(OutboxEvent.objects.filter(id__gt=cursor.position).order_by('id')[:batch_size])
+            events = _settled(fetched, cursor.position)
+            if events:
+                wanted = [
+                    event for event in events
+                    if event.kind != GAP and (consumer.kinds is None or event.kind in consumer.kinds)
+                ]
+                if wanted:
+                    consumer.handler(wanted)
+                ConsumerCursor.objects.filter(name=name).update(position=events[-1].id)
+                processed += len(events)
+
+        # A batch cut short at a gap is read again now that the gap is closed
+        if len(fetched) < batch_size and len(events) == len(fetched):
+            return processed
+
+
+def prune_events(older_than_days):
+    """Delete events every registered consumer is past and that are older than ``older_than_days``"""
+    # Consumers without a cursor yet rebuild from the tables when they start,
+    # so they need none of the existing events
+    consumed = ConsumerCursor.objects.filter(name__in=_consumers.keys()).aggregate(
+        position=Min('position')
+    )['position']
+    if consumed is None:
+        return 0
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    return OutboxEvent.objects.filter(id__lte=consumed, created_at__lt=cutoff).delete()[0]
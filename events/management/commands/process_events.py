@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from events.consumers import process, prune_events, registered_consumers
+from events.models import ConsumerCursor
+
+
+class Command(BaseCommand):
+    help = "Feed new outbox events to their consumers, e.g. the dashboard sales rollups; run every minute from cron"
+
+    def add_arguments(self, parser):
+        parser.add_argument('consumers', nargs='*', help='Consumers to run; all registered consumers by default')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Drop the consumers\' cursors so they rebuild their state from the tables first'
+        )
+        parser.add_argument(
+            '--prune', action='store_true',
+            help='Then delete events every consumer is past and older than OUTBOX_RETENTION_DAYS'
+        )
+
+    def handle(self, *args, **options):
+        consumers = registered_consumers()
+        names = options['consumers'] or sorted(consumers)
+        unknown = set(names) - set(consumers)
+        if unknown:
+            raise CommandError(f"Unknown consumers: {', '.join(sorted(unknown))}")
+
+        if options['rebuild']:
+            ConsumerCursor.objects.filter(name__in=names).delete()
+
+        for name in names:
+            processed = process(name, batch_size=options['batch_size'])
+            position = ConsumerCursor.objects.get(name=name).position
+            self.stdout.write(f'{name}: {processed} events, now at #{position}')
+
+        if options['prune']:
+            pruned = prune_events(settings.OUTBOX_RETENTION_DAYS)
+            self.stdout.write(f'Pruned {pruned} events')
+
+        self.stdout.write(self.style.SUCCESS('Done'))
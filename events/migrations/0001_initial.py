@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('users', '0004_shop_tax_rules'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsumerCursor',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('position', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('bill.committed', 'Bill Committed'), ('stock.adjusted', 'Stock Adjusted'), ('price.changed', 'Price Changed')], max_length=30)),
+                ('payload', models.JSONField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='users.shop')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_shop_tax_rules'),
+        ('events', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='outboxevent',
+            name='kind',
+            field=models.CharField(choices=[('bill.committed', 'Bill Committed'), ('stock.adjusted', 'Stock Adjusted'), ('price.changed', 'Price Changed'), ('outbox.gap', 'Rolled Back Gap')], max_length=30),
+        ),
+        migrations.AlterField(
+            model_name='outboxevent',
+            name='shop',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='users.shop'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import models
+from django.utils import timezone
+from users.models import Shop
+
+class OutboxEvent(models.Model):
+    """
+    A change committed in the same transaction as the event itself.
+
+    Events are appended in id order and never updated; consumers read them
+    forward from their ``ConsumerCursor``.
+    """
+    KIND_CHOICES = [
+        ('bill.committed', 'Bill Committed'),
+        ('stock.adjusted', 'Stock Adjusted'),
+        ('price.changed', 'Price Changed'),
+        ('outbox.gap', 'Rolled Back Gap'),
+    ]
+    
+    # Empty only for the gap markers consumers leave under rolled back ids
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, null=True, blank=True)
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    payload = models.JSONField()
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        ordering = ['id']
+    
+    def __str__(self):
+        return f"#{self.id} {self.kind} ({self.shop_id})"
+
+class ConsumerCursor(models.Model):
+    """Id of the last outbox event a consumer has processed"""
+    name = models.CharField(max_length=50, primary_key=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name} @ {self.position}"
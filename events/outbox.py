@@ -0,0 +1,62 @@
+"""
+Transactional outbox
+
+Writers append an ``OutboxEvent`` inside the transaction that makes the
+change, so an event exists exactly when its change committed. Downstream
+work (rollups, caches, feature stores) reads the outbox forward from its
+own cursor instead of re-scanning bills and products; see ``consumers``.
+"""
+from .models import OutboxEvent
+
+
+def emit(shop_id, kind, payload):
+    """Append an event; call inside the transaction that writes the change"""
+    return OutboxEvent.objects.create(shop_id=shop_id, kind=kind, payload=payload)
+
+
+def emit_bill_committed(bill, items):
+    """One event per bill with its lines as compact ``[product_id, quantity, total_price]`` rows"""
+    return emit(bill.shop_id, 'bill.committed', {
+        'bill': bill.id,
+        'date': bill.date.isoformat(),
+        'payment_type': bill.payment_type,
+        'customer': bill.customer_id,
+        'total': str(bill.total),
+        'items': [[item.product_id, str(item.quantity), str(item.total_price)] for item in items],
+    })
+
+
+def stock_adjusted_event(shop_id, product_id, stock, previous):
+    """Unsaved ``stock.adjusted`` event for a stock level edited from ``previous`` to ``stock``"""
+    return OutboxEvent(shop_id=shop_id, kind='stock.adjusted', payload={
+        'product': product_id,
+        'stock': stock,
+        'change': stock - previous,
+    })
+
+
+def product_change_events(product, loaded):
+    """
+    Unsaved events for a product write: ``stock.adjusted`` when the stock was
+    edited and ``price.changed`` when either price was. ``loaded`` holds the
+    values the product was read with, empty for a new product.
+    """
+    events = []
+    stock = loaded.get('stock', 0)
+    if product.stock != stock:
+        events.append(stock_adjusted_event(product.shop_id, product.id, product.stock, stock))
+
+    prices = (loaded.get('sale_price'), loaded.get('cost_price'))
+    if (product.sale_price, product.cost_price) != prices:
+        events.append(OutboxEvent(shop_id=product.shop_id, kind='price.changed', payload={
+            'product': product.id,
+            'sale_price': str(product.sale_price),
+            'cost_price': str(product.cost_price),
+            'previous': [str(price) for price in prices] if loaded else None,
+        }))
+    return events
+
+
+def emit_product_changes(product, loaded):
+    """Append the events of one product write; see ``product_change_events``"""
+    return OutboxEvent.objects.bulk_create(product_change_events(product, loaded))
@@ -0,0 +1,33 @@
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.db.models import Sum
+from django.test import TestCase
+from billing.checkout import commit_bill
+from dashboard.models import SalesAnalytics
+from dashboard.rollups import CONSUMER
+from products.models import Product
+from users.models import Shop
+from .consumers import GAP, process
+from .models import ConsumerCursor, OutboxEvent
+
+
+class ProcessTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user(username='owner', password='pw')
+        self.shop = Shop.objects.create(owner=owner, name='Test shop', address='-', whatsapp='0')
+        self.product = Product.objects.create(shop=self.shop, name='Tea', sale_price=Decimal('50.00'), stock=100)
+        process(CONSUMER)
+
+    def _sales(self):
+        return SalesAnalytics.objects.filter(shop=self.shop).aggregate(total=Sum('total_bills'))['total']
+
+    def test_missing_id_is_closed_with_a_marker_and_passed(self):
+        bills = [commit_bill(self.shop, [(self.product.id, 1)]) for _ in range(3)]
+        # An event whose transaction rolled back leaves its id unused
+        OutboxEvent.objects.filter(kind='bill.committed', payload__bill=bills[1].id).delete()
+
+        process(CONSUMER)
+        latest = OutboxEvent.objects.latest('id')
+        self.assertEqual(ConsumerCursor.objects.get(name=CONSUMER).position, latest.id)
+        self.assertEqual(OutboxEvent.objects.filter(kind=GAP).count(), 1)
+        self.assertEqual(self._sales(), 2)
@@ -0,0 +1,71 @@
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from jobs.runner import work
+
+
+def _run_threads(name, threads, once, poll_interval, stop):
+    """Run ``threads`` workers in this process until ``stop`` is set"""
+    workers = [
+        threading.Thread(target=work, args=(f'{name}:{i}', stop, once, poll_interval), daemon=True)
+        for i in range(threads)
+    ]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        while thread.is_alive():
+            thread.join(0.5)
+
+
+def _worker_process(name, threads, once, poll_interval):
+    """Run workers until SIGTERM or Ctrl-C; jobs being run are finished first"""
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    signal.signal(signal.SIGINT, lambda *args: stop.set())
+    _run_threads(name, threads, once, poll_interval, stop)
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (imports, exports); keep one running under a process supervisor'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=2, help='Worker threads per process')
+        parser.add_argument('--processes', type=int, default=1, help='Worker processes, each with --threads threads')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between checks of an empty queue')
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty, e.g. when run from cron')
+
+    def handle(self, *args, **options):
+        if options['threads'] < 1 or options['processes'] < 1:
+            raise CommandError('--threads and --processes must be at least 1')
+        name = f'{socket.gethostname()}:{os.getpid()}'
+        args = (options['threads'], options['once'], options['poll_interval'])
+
+        if options['processes'] == 1:
+            _worker_process(name, *args)
+            self.stdout.write(self.style.SUCCESS('Worker stopped'))
+            return
+
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else None)
+        children = [
+            context.Process(target=_worker_process, args=(f'{name}/{i}', *args))
+            for i in range(options['processes'])
+        ]
+        for child in children:
+            child.start()
+        def stop(*args):
+            # Pass the stop request on; children finish their running jobs first
+            for child in children:
+                if child.is_alive():
+                    child.terminate()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        for child in children:
+            child.join()
+        self.stdout.write(self.style.SUCCESS('Workers stopped'))
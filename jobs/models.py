@@ -0,0 +1,61 @@
+from django.db import models
+from django.contrib.auth.models import User
+from django.utils import timezone
+from users.models import Shop
+
+class Job(models.Model):
+    """A queued unit of background work, run by the ``run_jobs`` worker"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    ]
+    
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, null=True, blank=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    # Not picked up before this time; moved forward when a failed attempt is retried
+    run_after = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    cancel_requested = models.BooleanField(default=False)
+    progress_done = models.BigIntegerField(default=0)
+    progress_total = models.BigIntegerField(default=0)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='jobs_queue_idx'),
+            models.Index(fields=['shop', 'created_at'], name='jobs_shop_idx'),
+        ]
+    
+    def __str__(self):
+        return f"#{self.id} {self.kind} ({self.status})"
+    
+    @property
+    def percent(self):
+        if self.status == 'succeeded':
+            return 100
+        if not self.progress_total:
+            return 0
+        return min(100, round(self.progress_done * 100 / self.progress_total, 1))
+    
+    @property
+    def eta_seconds(self):
+        """Seconds left at the rate the job has made progress so far"""
+        if self.status != 'running' or not self.started_at or not self.progress_done or not self.progress_total:
+            return None
+        elapsed = (timezone.now() - self.started_at).total_seconds()
+        remaining = max(self.progress_total - self.progress_done, 0)
+        return round(elapsed / self.progress_done * remaining, 1)
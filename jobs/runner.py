@@ -0,0 +1,169 @@
+"""
+Database-backed background jobs
+
+Web requests ``enqueue`` a ``Job`` row and return straight away; the
+``run_jobs`` worker claims queued jobs with a conditional UPDATE, so any
+number of worker threads and processes can share the table without a
+broker. A handler reports progress as it goes, which also lets it notice a
+cancellation request. Failed attempts are retried with a growing delay up
+to the job's ``max_attempts``; jobs whose worker died are put back in the
+queue once their heartbeat is older than ``JOB_STALE_AFTER``.
+"""
+import logging
+import time
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler when its job was cancelled"""
+
+
+def job_handler(kind):
+    """Register the decorated ``handler(job, progress)`` to run jobs of ``kind``; its return value is the job result"""
+    def register(handler):
+        _handlers[kind] = handler
+        return handler
+    return register
+
+
+def enqueue(kind, payload=None, shop=None, user=None, max_attempts=3, run_after=None):
+    if kind not in _handlers:
+        raise ValueError(f'No handler for {kind} jobs')
+    return Job.objects.create(
+        kind=kind,
+        payload=payload or {},
+        shop=shop,
+        user=user,
+        max_attempts=max_attempts,
+        run_after=run_after or timezone.now()
+    )
+
+
+def cancel(job):
+    """
+    Cancel a job. A queued job is cancelled at once, a running one stops at
+    its next progress report. Returns ``False`` if the job had already finished.
+    """
+    now = timezone.now()
+    if Job.objects.filter(pk=job.pk, status='queued').update(status='cancelled', finished_at=now):
+        return True
+    return bool(Job.objects.filter(pk=job.pk, status='running').update(cancel_requested=True))
+
+
+class JobProgress:
+    """Handed to a handler to report ``done`` out of ``total`` units of work"""
+
+    def __init__(self, job):
+        self.job = job
+        self.interval = getattr(settings, 'JOB_PROGRESS_INTERVAL', 1)
+        self.written_at = 0
+
+    def update(self, done, total=None, force=False):
+        """
+        Record progress; written at most every ``JOB_PROGRESS_INTERVAL``
+        seconds. Raises ``JobCancelled`` if the job has been cancelled meanwhile.
+        """
+        self.job.progress_done = done
+        if total is not None:
+            self.job.progress_total = total
+        if not force and time.monotonic() - self.written_at < self.interval:
+            return
+        self.written_at = time.monotonic()
+        Job.objects.filter(pk=self.job.pk).update(
+            progress_done=self.job.progress_done,
+            progress_total=self.job.progress_total,
+            heartbeat_at=timezone.now()
+        )
+        if Job.objects.filter(pk=self.job.pk, cancel_requested=True).exists():
+            raise JobCancelled()
+
+
+def requeue_stale():
+    """Put running jobs whose worker stopped reporting back in the queue; returns how many"""
+    stale_after = timedelta(seconds=getattr(settings, 'JOB_STALE_AFTER', 300))
+    now = timezone.now()
+    stale = Job.objects.filter(status='running', heartbeat_at__lt=now - stale_after)
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status='failed', error='Worker stopped responding', finished_at=now
+    )
+    return failed + stale.update(status='queued', run_after=now, worker='')
+
+
+def claim(worker):
+    """Take the next due job for ``worker``, or ``None`` if the queue is empty"""
+    now = timezone.now()
+    candidates = list(
+        Job.objects.filter(status='queued', run_after__lte=now).order_by('run_after', 'id').values_list('id', flat=True)[:10]
+    )
+    for job_id in candidates:
+        # Only the worker whose UPDATE matches the queued row gets the job
+        if Job.objects.filter(id=job_id, status='queued').update(
+            status='running', worker=worker, attempts=F('attempts') + 1,
+            started_at=now, heartbeat_at=now, cancel_requested=False
+        ):
+            return Job.objects.select_related('shop', 'user').get(id=job_id)
+    return None
+
+
+def _finish(job, worker, **fields):
+    """Record the outcome, unless the job was meanwhile handed to another worker as stale"""
+    Job.objects.filter(pk=job.pk, status='running', worker=worker).update(finished_at=timezone.now(), **fields)
+
+
+def run(job, worker):
+    """Run a claimed job to one of its outcomes"""
+    handler = _handlers.get(job.kind)
+    if handler is None:
+        _finish(job, worker, status='failed', error=f'No handler for {job.kind} jobs')
+        return
+
+    progress = JobProgress(job)
+    try:
+        result = handler(job, progress)
+    except JobCancelled:
+        _finish(job, worker, status='cancelled', progress_done=job.progress_done)
+    except Exception:
+        error = traceback.format_exc()[-4000:]
+        logger.warning('Job %s (%s) failed on attempt %s', job.pk, job.kind, job.attempts)
+        if job.attempts < job.max_attempts:
+            delay = getattr(settings, 'JOB_RETRY_DELAY', 30) * 2 ** (job.attempts - 1)
+            Job.objects.filter(pk=job.pk, status='running', worker=worker).update(
+                status='queued', run_after=timezone.now() + timedelta(seconds=delay), error=error, worker=''
+            )
+        else:
+            _finish(job, worker, status='failed', error=error)
+    else:
+        _finish(
+            job, worker, status='succeeded', result=result, error='',
+            progress_done=job.progress_total or job.progress_done
+        )
+
+
+def work(worker, stop, once=False, poll_interval=1.0):
+    """
+    Claim and run jobs until ``stop`` (a ``threading.Event``) is set; with
+    ``once``, return as soon as the queue is empty instead of waiting.
+    """
+    try:
+        while not stop.is_set():
+            requeue_stale()
+            job = claim(worker)
+            if job is None:
+                if once:
+                    return
+                stop.wait(poll_interval)
+                continue
+            run(job, worker)
+    finally:
+        connection.close()
+
@@ -0,0 +1,11 @@
+from django.urls import path
+from . import views
+
+app_name = 'jobs'
+
+urlpatterns = [
+    path('', views.job_list, name='list'),
+    path('<int:job_id>/', views.job_status, name='status'),
+    path('<int:job_id>/cancel/', views.cancel_job, name='cancel'),
+    path('<int:job_id>/download/', views.download_result, name='download'),
+]
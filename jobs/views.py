@@ -0,0 +1,66 @@
+from django.contrib.auth.decorators import login_required
+from django.core.files.storage import storages
+from django.http import FileResponse, Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from .models import Job
+from .runner import cancel
+
+
+def job_dict(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': {
+            'done': job.progress_done,
+            'total': job.progress_total,
+            'percent': job.percent,
+        },
+        'eta_seconds': job.eta_seconds,
+        'attempts': job.attempts,
+        'cancel_requested': job.cancel_requested,
+        'result': job.result,
+        'error': job.error.strip().splitlines()[-1] if job.error else '',
+        'created_at': job.created_at,
+        'finished_at': job.finished_at,
+    }
+
+
+@login_required
+def job_status(request, job_id):
+    """Progress of a background job, polled by the page that started it"""
+    job = get_object_or_404(Job, id=job_id, shop=request.user.shop)
+    return JsonResponse({'success': True, 'job': job_dict(job)})
+
+
+@login_required
+def job_list(request):
+    """The shop's most recent jobs"""
+    jobs = Job.objects.filter(shop=request.user.shop)[:20]
+    return JsonResponse({'success': True, 'jobs': [job_dict(job) for job in jobs]})
+
+
+@login_required
+def cancel_job(request, job_id):
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'POST required'})
+    
+    job = get_object_or_404(Job, id=job_id, shop=request.user.shop)
+    if not cancel(job):
+        return JsonResponse({'success': False, 'error': 'Job has already finished'})
+    job.refresh_from_db()
+    return JsonResponse({'success': True, 'job': job_dict(job)})
+
+
+@login_required
+def download_result(request, job_id):
+    """File produced by a finished job, e.g. an export"""
+    job = get_object_or_404(Job, id=job_id, shop=request.user.shop, status='succeeded')
+    path = (job.result or {}).get('file')
+    if not path or not storages['private'].exists(path):
+        raise Http404('This job has no file')
+    return FileResponse(
+        storages['private'].open(path, 'rb'),
+        as_attachment=True,
+        filename=job.result.get('filename') or path.rsplit('/', 1)[-1]
+    )
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Category, Product
+from .models import Category, Product, StockMovement, StockSnapshot
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -13,3 +13,17 @@ class ProductAdmin(admin.ModelAdmin):
     list_filter = ['category', 'shop', 'is_active', 'created_at']
     search_fields = ['name', 'barcode']
     readonly_fields = ['barcode', 'created_at', 'updated_at']
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ['product', 'kind', 'change', 'bill', 'shop', 'created_at']
+    list_filter = ['kind', 'shop', 'created_at']
+    search_fields = ['product__name', 'product__barcode']
+    raw_id_fields = ['product', 'bill']
+
+@admin.register(StockSnapshot)
+class StockSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['product', 'stock', 'shop', 'taken_at']
+    list_filter = ['shop', 'taken_at']
+    search_fields = ['product__name', 'product__barcode']
+    raw_id_fields = ['product']
@@ -0,0 +1,123 @@
+"""
+Versioned catalog snapshots and deltas for POS tills
+
+Every product write bumps the shop's ``CatalogVersion`` in the same
+transaction and stamps the product with the new value; deletes leave a
+``CatalogTombstone``. A till downloads the whole active catalog once, keeps
+the version it came with and from then on asks only for what changed since.
+
+Sales do not bump the version: all tills of a shop would queue on its
+counter row for the length of every checkout. Instead each delta also
+carries the current stock of the products with stock movements since the
+till's previous read, found through the stock journal.
+"""
+from datetime import timedelta
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import CatalogTombstone, CatalogVersion, Product, StockMovement
+
+# Column order of the compact product rows
+CATALOG_FIELDS = ['id', 'name', 'barcode', 'price', 'unit', 'stock']
+
+# Seconds of stock movements sent again with every delta, covering
+# checkouts that were still committing when the previous one was read
+STOCK_SYNC_OVERLAP = 30
+
+
+def bump_catalog_version(shop_id):
+    """
+    Take the next catalog version of the shop.
+
+    Call inside the transaction that writes the product: the counter row stays
+    locked until it commits, so versions become visible in the order they
+    were handed out.
+    """
+    with transaction.atomic():
+        counter = CatalogVersion.objects.filter(shop_id=shop_id)
+        if not counter.update(version=F('version') + 1):
+            try:
+                with transaction.atomic():
+                    CatalogVersion.objects.create(shop_id=shop_id, version=1)
+            except IntegrityError:
+                # Another write created the counter first
+                counter.update(version=F('version') + 1)
+        return counter.values_list('version', flat=True).get()
+
+
+def current_catalog_version(shop_id):
+    return CatalogVersion.objects.filter(shop_id=shop_id).values_list('version', flat=True).first() or 0
+
+
+def _rows(products):
+    return [
+        [product_id, name, barcode or '', float(price), unit, stock]
+        for product_id, name, barcode, price, unit, stock in products.values_list(
+            'id', 'name', 'barcode', 'sale_price', 'unit', 'stock'
+        ).iterator(chunk_size=2000)
+    ]
+
+
+def _stock_rows(shop, since):
+    """``[product_id, stock]`` of the shop's active products whose stock moved since ``since``"""
+    moved = StockMovement.objects.filter(
+        shop=shop, created_at__gte=since - timedelta(seconds=STOCK_SYNC_OVERLAP)
+    ).values('product_id')
+    return [
+        [product_id, stock]
+        for product_id, stock in Product.objects.filter(id__in=moved, is_active=True).order_by('id').values_list('id', 'stock')
+    ]
+
+
+def catalog_snapshot(shop):
+    """
+    The shop's whole active catalog as compact rows, with the version it is
+    current for and ``stock_as_of``, the time to pass to the next delta
+    """
+    # Read the version and time first: anything written after them is resent by the next delta
+    version = current_catalog_version(shop.id)
+    stock_as_of = timezone.now()
+    return {
+        'version': version,
+        'stock_as_of': stock_as_of.timestamp(),
+        'fields': CATALOG_FIELDS,
+        'products': _rows(Product.objects.filter(shop=shop, is_active=True).order_by('id')),
+    }
+
+
+def catalog_delta(shop, since, stock_since=None):
+    """
+    Products written after version ``since``: changed active products and the
+    ids of products that were deleted or deactivated. With ``stock_since``,
+    the ``stock_as_of`` of the till's previous read, ``stock`` holds the
+    current stock of products sold or restocked since.
+
+    ``reset`` is set when ``since`` is ahead of the server, e.g. after a
+    restore, and the till should download a fresh snapshot instead.
+    """
+    version = current_catalog_version(shop.id)
+    stock_as_of = timezone.now()
+    if since > version:
+        return {'version': version, 'reset': True, 'fields': CATALOG_FIELDS, 'products': [], 'removed': [], 'stock': []}
+
+    changed = Product.objects.filter(shop=shop, catalog_version__gt=since)
+    removed = list(changed.filter(is_active=False).values_list('id', flat=True))
+    removed += CatalogTombstone.objects.filter(shop=shop, catalog_version__gt=since).values_list('product_id', flat=True)
+    return {
+        'version': version,
+        'reset': False,
+        'stock_as_of': stock_as_of.timestamp(),
+        'fields': CATALOG_FIELDS,
+        'products': _rows(changed.filter(is_active=True).order_by('id')),
+        'removed': removed,
+        'stock': _stock_rows(shop, stock_since) if stock_since is not None else [],
+    }
+
+
+def record_deleted_product(product):
+    """Leave a tombstone for a deleted product; runs inside the delete's transaction"""
+    CatalogTombstone.objects.create(
+        shop_id=product.shop_id,
+        product_id=product.id,
+        catalog_version=bump_catalog_version(product.shop_id)
+    )
@@ -0,0 +1,285 @@
+"""
+Streaming CSV product import
+
+The upload is decoded and parsed row by row, so a supplier catalog of any
+size is never held in memory. Valid rows are written in chunks, each in its
+own transaction: category names are resolved with one query and one bulk
+insert, products with one ``bulk_create`` and one ``bulk_update``, and
+stock changes are journalled with one more bulk insert. Rows whose
+barcode is already in the shop update that product, so re-importing a price
+list changes prices instead of adding duplicates. Invalid rows are skipped
+and reported with their line number.
+"""
+import csv
+import io
+import uuid
+from decimal import Decimal, InvalidOperation
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from shopcloud.streaming import EXPORT_CHUNK_SIZE
+from events.models import OutboxEvent
+from events.outbox import product_change_events
+from .catalog import bump_catalog_version, current_catalog_version
+from .ledger import stock_movement
+from .models import Category, Product, StockMovement
+from .search_index import loaded_index
+
+# Valid rows written per transaction
+IMPORT_CHUNK_SIZE = 1000
+
+# Rows per bulk UPDATE; its CASE expressions get slow to evaluate when much longer
+UPDATE_BATCH_SIZE = 200
+
+# Largest prices and counts the product columns hold
+MAX_MONEY = Decimal('99999999.99')
+MAX_COUNT = 2 ** 31 - 1
+
+# Column order of ``export_products``, also assumed for files without a header row
+COLUMNS = ['name', 'category', 'unit', 'cost_price', 'sale_price', 'stock', 'min_stock_alert', 'barcode', 'description']
+EXPORT_HEADER = ['Name', 'Category', 'Unit', 'Cost Price', 'Sale Price', 'Stock', 'Min Stock Alert', 'Barcode', 'Description']
+EXPORT_FIELDS = ['name', 'category__name', 'unit', 'cost_price', 'sale_price', 'stock', 'min_stock_alert', 'barcode', 'description']
+
+# Header spellings accepted for each column
+HEADERS = {
+    'name': 'name', 'product': 'name', 'product name': 'name',
+    'category': 'category',
+    'unit': 'unit',
+    'cost price': 'cost_price', 'cost': 'cost_price',
+    'sale price': 'sale_price', 'price': 'sale_price',
+    'stock': 'stock', 'quantity': 'stock',
+    'min stock alert': 'min_stock_alert', 'min stock': 'min_stock_alert',
+    'barcode': 'barcode',
+    'description': 'description',
+}
+
+# Product fields a row can change on an existing product
+UPDATE_FIELDS = ['name', 'category', 'unit', 'cost_price', 'sale_price', 'stock', 'min_stock_alert', 'description']
+
+
+def _columns(header):
+    """Map a header row to field names; ``None`` if the row is data, not a header"""
+    columns = [HEADERS.get(' '.join(cell.strip().lower().replace('_', ' ').split())) for cell in header]
+    if 'name' not in columns:
+        return None
+    return columns
+
+
+def _number(value, label):
+    """A finite ``Decimal`` from a cell; NaN and infinities are invalid"""
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        raise ValidationError(f'Invalid {label}')
+    if not number.is_finite():
+        raise ValidationError(f'Invalid {label}')
+    if number < 0:
+        raise ValidationError(f'{label.capitalize()} cannot be negative')
+    return number
+
+
+def _money(value, label):
+    amount = _number(value, label)
+    if amount > MAX_MONEY:
+        raise ValidationError(f'{label.capitalize()} is too large')
+    return amount.quantize(Decimal('0.01'))
+
+
+def _count(value, label):
+    count = _number(value, label)
+    if count > MAX_COUNT:
+        raise ValidationError(f'{label.capitalize()} is too large')
+    return int(count)
+
+
+def parse_row(columns, row):
+    """
+    Cleaned field values of one CSV row; only the columns the file has.
+
+    Raises ``ValidationError`` for a row that cannot be imported.
+    """
+    raw = {field: cell.strip() for field, cell in zip(columns, row) if field}
+    values = {}
+
+    values['name'] = raw.get('name', '')[:100]
+    if not values['name']:
+        raise ValidationError('Name is required')
+
+    if 'category' in raw:
+        values['category'] = raw['category'][:100]
+    if 'unit' in raw:
+        unit = raw['unit'].lower()
+        values['unit'] = unit if unit in dict(Product.UNIT_CHOICES) else 'piece'
+    if raw.get('cost_price'):
+        values['cost_price'] = _money(raw['cost_price'], 'cost price')
+    if raw.get('sale_price'):
+        values['sale_price'] = _money(raw['sale_price'], 'sale price')
+    if raw.get('stock'):
+        values['stock'] = _count(raw['stock'], 'stock')
+    if raw.get('min_stock_alert'):
+        values['min_stock_alert'] = _count(raw['min_stock_alert'], 'minimum stock alert')
+    if raw.get('barcode'):
+        values['barcode'] = raw['barcode'][:50]
+    if 'description' in raw:
+        values['description'] = raw['description']
+    return values
+
+
+class ProductImporter:
+    """
+    Import one CSV upload into a shop.
+
+    Results are collected on the importer: ``created`` and ``updated`` counts
+    and ``errors`` as ``(line, message)`` pairs. ``on_chunk`` is called after
+    every committed chunk; an exception it raises stops the import there.
+
+    To resume an interrupted import, rows up to ``start_line`` are skipped.
+    ``checkpoint(line)`` is called inside every chunk's transaction with the
+    last line the chunk covers, so a resume point saved there is committed
+    exactly when the chunk is.
+    """
+
+    def __init__(self, shop, chunk_size=IMPORT_CHUNK_SIZE, on_chunk=None, start_line=0, checkpoint=None):
+        self.shop = shop
+        self.chunk_size = chunk_size
+        self.on_chunk = on_chunk
+        self.start_line = start_line
+        self.checkpoint = checkpoint
+        self.categories = {}
+        self.created = 0
+        self.updated = 0
+        self.errors = []
+
+    def run(self, binary_file):
+        """Import from a binary file object, e.g. an ``UploadedFile``"""
+        text = io.TextIOWrapper(binary_file, encoding='utf-8-sig', errors='replace', newline='')
+        try:
+            self.run_rows(csv.reader(text))
+        finally:
+            # Leave the upload open for Django to clean up
+            text.detach()
+        return self
+
+    def run_rows(self, rows):
+        columns = None
+        chunk = []
+        for line, row in enumerate(rows, start=1):
+            if not any(cell.strip() for cell in row):
+                continue
+            if columns is None:
+                columns = _columns(row)
+                if columns is not None:
+                    continue
+                columns = COLUMNS
+            if line <= self.start_line:
+                continue
+            try:
+                chunk.append((line, parse_row(columns, row)))
+            except ValidationError as e:
+                self.errors.append((line, ' '.join(e.messages)))
+            if len(chunk) >= self.chunk_size:
+                self._write(chunk, line)
+                chunk = []
+        if chunk:
+            self._write(chunk, line)
+
+        index = loaded_index(self.shop.id)
+        if index is not None:
+            # Bulk writes skip the save signals that keep this process's index current
+            index.refresh(current_catalog_version(self.shop.id))
+        return self
+
+    def _resolve_categories(self, names):
+        """Category ids for ``names``: one query for the unknown ones, one insert for the missing ones"""
+        missing = {name for name in names if name and name not in self.categories}
+        if missing:
+            for category_id, name in Category.objects.filter(shop=self.shop, name__in=missing).order_by('-id').values_list('id', 'name'):
+                # The oldest category wins when a shop has the same name twice
+                self.categories[name] = category_id
+            new = [name for name in missing if name not in self.categories]
+            for category in Category.objects.bulk_create([
+                Category(shop=self.shop, name=name, description=f'Auto-created for {name}') for name in new
+            ]):
+                self.categories[category.name] = category.id
+
+    def _write(self, chunk, line):
+        try:
+            with transaction.atomic():
+                self._write_chunk(chunk)
+                if self.checkpoint is not None:
+                    self.checkpoint(line)
+        except IntegrityError as e:
+            # Nothing of the chunk was written; report its rows rather than abort the whole import
+            self.errors.extend((line, f'Not imported: {e}') for line, _ in chunk)
+            self.categories = {}
+        if self.on_chunk is not None:
+            self.on_chunk()
+
+    def _write_chunk(self, chunk):
+        self._resolve_categories({values.get('category') for _, values in chunk})
+
+        barcodes = {values['barcode'] for _, values in chunk if 'barcode' in values}
+        existing = {
+            product.barcode: product
+            # Locked, so the journaled changes are taken against the stock being overwritten
+            for product in Product.objects.select_for_update().filter(shop=self.shop, barcode__in=barcodes)
+        }
+        loaded = {product.id: dict(product._loaded) for product in existing.values()}
+
+        # One version for the whole chunk, so tills pick it up in one delta
+        version = bump_catalog_version(self.shop.id)
+        now = timezone.now()
+        new = {}
+        changed = {}
+        for line, values in chunk:
+            barcode = values.get('barcode') or str(uuid.uuid4())[:12].upper()
+            product = existing.get(barcode) or new.get(barcode)
+            if product is None:
+                if 'sale_price' not in values:
+                    self.errors.append((line, 'Sale price is required for a new product'))
+                    continue
+                product = Product(shop=self.shop, barcode=barcode, sale_price=values['sale_price'])
+                new[barcode] = product
+            elif product.pk:
+                changed[product.pk] = product
+
+            for field in UPDATE_FIELDS:
+                if field == 'category':
+                    if 'category' in values:
+                        product.category_id = self.categories.get(values['category'])
+                elif field in values:
+                    setattr(product, field, values[field])
+            product.is_active = True
+            product.catalog_version = version
+            product.updated_at = now
+
+        Product.objects.bulk_create(new.values())
+        if changed:
+            # Only the columns the file has, plus the ones every imported row gets
+            fields = [field for field in UPDATE_FIELDS if any(field in values for _, values in chunk)]
+            fields += ['is_active', 'catalog_version', 'updated_at']
+            Product.objects.bulk_update(changed.values(), fields, batch_size=UPDATE_BATCH_SIZE)
+
+        events = []
+        movements = []
+        for product in new.values():
+            events.extend(product_change_events(product, {}))
+            movements.append(stock_movement(product, 0, 'import'))
+        for product in changed.values():
+            events.extend(product_change_events(product, loaded[product.id]))
+            movements.append(stock_movement(product, loaded[product.id]['stock'], 'import'))
+        OutboxEvent.objects.bulk_create(events)
+        StockMovement.objects.bulk_create([movement for movement in movements if movement is not None])
+
+        self.created += len(new)
+        self.updated += len(changed)
+
+
+def import_products_csv(shop, binary_file, chunk_size=IMPORT_CHUNK_SIZE, on_chunk=None):
+    """Import a CSV upload into ``shop``; returns the finished ``ProductImporter``"""
+    return ProductImporter(shop, chunk_size, on_chunk).run(binary_file)
+
+
+def export_rows(products):
+    """``products`` as CSV rows in ``COLUMNS`` order, fetched in chunks with their category joined in"""
+    return products.values_list(*EXPORT_FIELDS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
@@ -0,0 +1,84 @@
+"""
+Background jobs for bulk product operations
+"""
+import csv
+import io
+import tempfile
+from django.core.files import File
+from django.core.files.storage import storages
+from jobs.models import Job
+from jobs.runner import job_handler
+from shopcloud.streaming import EXPORT_CHUNK_SIZE
+from .importer import EXPORT_HEADER, ProductImporter, export_rows
+from .models import Product
+
+# Product errors kept in a finished import job's result
+MAX_REPORTED_ERRORS = 1000
+
+
+def _import_totals(resumed, importer):
+    """Counts and errors of an import job so far, adding this attempt's to those of earlier ones"""
+    errors = resumed.get('errors', []) + [{'line': line, 'error': error} for line, error in importer.errors]
+    return {
+        'created': resumed.get('created', 0) + importer.created,
+        'updated': resumed.get('updated', 0) + importer.updated,
+        'error_count': resumed.get('error_count', 0) + len(importer.errors),
+        'errors': errors[:MAX_REPORTED_ERRORS],
+    }
+
+
+@job_handler('products.import')
+def import_products_job(job, progress):
+    """
+    Import a CSV upload stored by ``import_products``; progress is measured in bytes read.
+
+    Every committed chunk saves the line it ended on with the job, so a
+    retried attempt resumes after it instead of importing those rows again,
+    which would duplicate every row without a barcode.
+    """
+    path = job.payload['file']
+    resumed = job.payload.get('resume', {})
+    storage = storages['private']
+
+    def checkpoint(line):
+        payload = dict(job.payload, resume=dict(_import_totals(resumed, importer), line=line))
+        Job.objects.filter(pk=job.pk).update(payload=payload)
+
+    total = storage.size(path)
+    with storage.open(path, 'rb') as upload:
+        importer = ProductImporter(
+            job.shop, on_chunk=lambda: progress.update(upload.tell(), total),
+            start_line=resumed.get('line', 0), checkpoint=checkpoint
+        )
+        try:
+            importer.run(upload)
+        except (csv.Error, UnicodeError) as e:
+            # A malformed file fails the same way on every attempt, so finish with the error
+            storage.delete(path)
+            return dict(_import_totals(resumed, importer), error=f'Error importing products: {e}')
+    # Kept until here so a failed attempt can be retried
+    storage.delete(path)
+    progress.update(total, total, force=True)
+    return _import_totals(resumed, importer)
+
+
+@job_handler('products.export')
+def export_products_job(job, progress):
+    """Write the shop's active products to a CSV file for download"""
+    products = Product.objects.filter(shop=job.shop, is_active=True).order_by('id')
+    total = products.count()
+
+    # Spooled to disk as it is written, so a large catalog never sits in memory
+    with tempfile.TemporaryFile('w+b') as output:
+        text = io.TextIOWrapper(output, encoding='utf-8', newline='')
+        writer = csv.writer(text)
+        writer.writerow(EXPORT_HEADER)
+        for done, row in enumerate(export_rows(products), start=1):
+            writer.writerow(row)
+            if done % EXPORT_CHUNK_SIZE == 0:
+                progress.update(done, total)
+        text.flush()
+        output.seek(0)
+        path = storages['private'].save(f'jobs/exports/products-{job.shop_id}-{job.id}.csv', File(output))
+        text.detach()
+    return {'file': path, 'filename': 'products.csv', 'rows': total}
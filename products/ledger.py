@@ -0,0 +1,94 @@
+"""
+Stock movement journal and snapshots
+
+Every write that changes ``Product.stock`` appends a ``StockMovement`` in
+the same transaction: sales from checkout, receipts and adjustments from
+product edits and stock-takes, imports from catalog uploads. The journal
+explains how a product got to its current stock.
+
+``take_stock_snapshots`` periodically records the stock of every product
+that moved since the previous round, so the stock on any date is one
+snapshot plus the movements after it, however long the journal grows.
+Stock before the journal started is not known and reads as zero.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, IntegerField, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import Product, StockMovement, StockSnapshot
+
+# Products whose snapshot is written per query
+SNAPSHOT_BATCH_SIZE = 1000
+
+_BEGINNING = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def stock_movement(product, previous, kind, bill=None):
+    """Unsaved movement taking ``product`` from ``previous`` to its current stock, or ``None`` if it did not change"""
+    if product.stock == previous:
+        return None
+    return StockMovement(shop_id=product.shop_id, product_id=product.id, kind=kind, change=product.stock - previous, bill=bill)
+
+
+def _latest_snapshot(date=None):
+    """Subquery over the newest snapshot of the outer product, optionally at or before ``date``"""
+    snapshots = StockSnapshot.objects.filter(product=OuterRef('pk'))
+    if date is not None:
+        snapshots = snapshots.filter(taken_at__lte=date)
+    return snapshots.order_by('-taken_at')
+
+
+def take_stock_snapshots(until=None):
+    """
+    Snapshot the stock at ``until`` of every product that moved since the last round.
+
+    ``until`` defaults to ``STOCK_SNAPSHOT_DELAY`` seconds ago, so movements
+    of checkouts still committing are not missed. Returns the number of
+    snapshots written.
+    """
+    until = until or timezone.now() - timedelta(seconds=getattr(settings, 'STOCK_SNAPSHOT_DELAY', 60))
+    since = StockSnapshot.objects.aggregate(since=Max('taken_at'))['since'] or _BEGINNING
+    if until <= since:
+        return 0
+
+    # Every product that moved in an earlier round got a snapshot then, so
+    # its newest snapshot plus this round's movements is its stock at ``until``
+    moved = StockMovement.objects.filter(created_at__gte=since, created_at__lt=until).values('product').annotate(
+        change=Sum('change')
+    ).values_list('product', 'change')
+    changes = dict(moved)
+    product_ids = sorted(changes)
+
+    written = 0
+    with transaction.atomic():
+        for start in range(0, len(product_ids), SNAPSHOT_BATCH_SIZE):
+            batch = product_ids[start:start + SNAPSHOT_BATCH_SIZE]
+            products = Product.objects.filter(id__in=batch).annotate(
+                base=Coalesce(Subquery(_latest_snapshot().values('stock')[:1]), Value(0))
+            ).values_list('id', 'shop_id', 'base')
+            written += len(StockSnapshot.objects.bulk_create([
+                StockSnapshot(shop_id=shop_id, product_id=product_id, stock=base + changes[product_id], taken_at=until)
+                for product_id, shop_id, base in products
+            ]))
+    return written
+
+
+def stock_at(products, date):
+    """
+    ``{product_id: stock}`` at ``date`` for the ``products`` queryset.
+
+    Each product's stock is read from its newest snapshot at or before
+    ``date`` plus the movements between the two, in one query.
+    """
+    snapshot = _latest_snapshot(date)
+    tail = StockMovement.objects.filter(
+        product=OuterRef('pk'), created_at__gte=OuterRef('snapshot_at'), created_at__lte=date
+    ).order_by().values('product').annotate(total=Sum('change')).values('total')
+    return dict(products.annotate(
+        snapshot_at=Coalesce(Subquery(snapshot.values('taken_at')[:1]), Value(_BEGINNING)),
+        snapshot_stock=Coalesce(Subquery(snapshot.values('stock')[:1]), Value(0)),
+    ).annotate(
+        stock_then=Coalesce(Subquery(tail, output_field=IntegerField()), Value(0)) + F('snapshot_stock')
+    ).values_list('id', 'stock_then'))
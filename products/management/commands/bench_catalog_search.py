@@ -0,0 +1,68 @@
+import random
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from users.models import Shop
+from products.models import Product
+from products.search_index import CatalogIndex
+
+WORDS = ['basmati', 'rice', 'sugar', 'tea', 'milk', 'olpers', 'nestle', 'lipton', 'surf', 'excel',
+         'soap', 'lux', 'oil', 'dalda', 'flour', 'atta', 'daal', 'chana', 'masoor', 'biscuit',
+         'peek', 'freans', 'shampoo', 'sunsilk', 'ketchup', 'shan', 'masala', 'salt', 'eggs', 'bread']
+QUERIES = ['r', 'ri', 'ric', 'rice', 'basm', 'tea lip', 'surf ex', 'masala', 'peek fr', '0000123']
+
+
+class Command(BaseCommand):
+    help = 'Compare catalog index lookups against the icontains ORM search at several catalog sizes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,100000')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        self.stdout.write(f"{'products':>9} {'build ms':>9} {'orm ms':>9} {'index ms':>9} {'speedup':>8}")
+
+        for size in sizes:
+            # Everything is created inside a transaction that is rolled back afterwards
+            with transaction.atomic():
+                self._bench(size, options['repeat'])
+                transaction.set_rollback(True)
+
+    def _bench(self, size, repeat):
+        rng = random.Random(size)
+        user = User.objects.create(username=f'bench-catalog-{size}-{time.time_ns()}')
+        shop = Shop.objects.create(name='Benchmark', address='-', whatsapp='-', owner=user)
+        Product.objects.bulk_create([
+            Product(
+                name=' '.join(rng.sample(WORDS, 3)).title() + f' {i}',
+                barcode=f'{i:012d}',
+                sale_price=100,
+                shop=shop
+            )
+            for i in range(size)
+        ], batch_size=2000)
+
+        started = time.perf_counter()
+        index = CatalogIndex.build(shop.id)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        base = Product.objects.filter(shop=shop, is_active=True)
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for query in QUERIES:
+                list(base.filter(Q(name__icontains=query) | Q(barcode__icontains=query))
+                     .order_by('-stock', 'name').values_list('id', flat=True)[:10])
+        orm_ms = (time.perf_counter() - started) * 1000 / (repeat * len(QUERIES))
+
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for query in QUERIES:
+                index.search(query, limit=10)
+        index_ms = (time.perf_counter() - started) * 1000 / (repeat * len(QUERIES))
+
+        self.stdout.write(
+            f'{size:>9} {build_ms:>9.1f} {orm_ms:>9.3f} {index_ms:>9.3f} {orm_ms / index_ms:>7.1f}x'
+        )
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from products.ledger import stock_at, take_stock_snapshots
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        'Snapshot the stock of every product that moved since the last run, keeping stock-at-date '
+        'queries short; run it periodically, e.g. hourly from cron'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Also list products whose journal disagrees with their stock')
+        parser.add_argument('--shop', type=int, help='Limit --check to this shop id')
+
+    def handle(self, *args, **options):
+        written = take_stock_snapshots()
+        self.stdout.write(self.style.SUCCESS(f'{written} stock snapshots written'))
+        if options['check']:
+            self._check(options['shop'])
+
+    def _check(self, shop_id):
+        """Compare the stock the journal adds up to with the stock on the products"""
+        products = Product.objects.all()
+        if shop_id is not None:
+            products = products.filter(shop_id=shop_id)
+        # Sales committing meanwhile can show up as mismatches; check when the shop is quiet
+        journal = stock_at(products, timezone.now())
+        mismatched = [
+            (product_id, name, stock, journal[product_id])
+            for product_id, name, stock in products.values_list('id', 'name', 'stock').order_by('id')
+            if journal.get(product_id, stock) != stock
+        ]
+        for product_id, name, stock, expected in mismatched:
+            self.stdout.write(f'  #{product_id} {name}: stock {stock}, journal {expected}')
+        style = self.style.WARNING if mismatched else self.style.SUCCESS
+        self.stdout.write(style(f'{len(mismatched)} products disagree with their journal'))
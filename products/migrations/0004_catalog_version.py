@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_shop_receipt_format'),
+        ('products', '0003_alter_product_barcode_alter_product_cost_price_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_id', models.BigIntegerField()),
+                ('catalog_version', models.BigIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('shop', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='catalog_version', serialize=False, to='users.shop')),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='catalog_version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['shop', 'catalog_version'], name='products_catalog_version_idx'),
+        ),
+        migrations.AddField(
+            model_name='catalogtombstone',
+            name='shop',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='users.shop'),
+        ),
+        migrations.AddIndex(
+            model_name='catalogtombstone',
+            index=models.Index(fields=['shop', 'catalog_version'], name='products_tombstone_idx'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def open_stock_journal(apps, schema_editor):
+    """Start the journal from each product's current stock"""
+    Product = apps.get_model('products', 'Product')
+    StockSnapshot = apps.get_model('products', 'StockSnapshot')
+    now = django.utils.timezone.now()
+    batch = []
+    for product_id, shop_id, stock in Product.objects.values_list('id', 'shop_id', 'stock').iterator(chunk_size=2000):
+        batch.append(StockSnapshot(shop_id=shop_id, product_id=product_id, stock=stock, taken_at=now))
+        if len(batch) == 2000:
+            StockSnapshot.objects.bulk_create(batch)
+            batch = []
+    StockSnapshot.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0013_stockreservation'),
+        ('users', '0004_shop_tax_rules'),
+        ('products', '0005_product_reserved'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock', models.IntegerField()),
+                ('taken_at', models.DateTimeField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='products.product')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='users.shop')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('sale', 'Sale'), ('return', 'Return'), ('receipt', 'Receipt'), ('adjustment', 'Adjustment'), ('import', 'Import')], max_length=10)),
+                ('change', models.IntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('bill', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='billing.bill')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='products.product')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='users.shop')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='stocksnapshot',
+            constraint=models.UniqueConstraint(fields=('product', 'taken_at'), name='unique_stock_snapshot'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['product', 'created_at'], name='products_movement_product_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['shop', 'created_at'], name='products_movement_shop_idx'),
+        ),
+        migrations.RunPython(open_stock_journal, migrations.RunPython.noop),
+    ]
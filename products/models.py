@@ -1,8 +1,12 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 from users.models import Shop
 import uuid
 
+# Product columns whose changes are journaled or sent to the outbox
+TRACKED_FIELDS = ('stock', 'sale_price', 'cost_price')
+
 class Category(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
@@ -30,6 +34,8 @@ class Product(models.Model):
     cost_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, validators=[MinValueValidator(0)])
     sale_price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
     stock = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+    # Units held by open POS carts; only stock - reserved can be added to a cart
+    reserved = models.IntegerField(default=0, editable=False)
     min_stock_alert = models.IntegerField(default=5, validators=[MinValueValidator(0)])
     barcode = models.CharField(max_length=50, blank=True, null=True)
     image = models.ImageField(upload_to='products/', blank=True, null=True)
@@ -38,9 +44,14 @@ class Product(models.Model):
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Shop catalog version of the last write, for POS delta sync
+    catalog_version = models.BigIntegerField(default=0, editable=False)
     
     class Meta:
         unique_together = ['barcode', 'shop']
+        indexes = [
+            models.Index(fields=['shop', 'catalog_version'], name='products_catalog_version_idx'),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['barcode', 'shop'],
@@ -52,10 +63,56 @@ class Product(models.Model):
     def __str__(self):
         return f"{self.name} - {self.shop.name}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        product = super().from_db(db, field_names, values)
+        # Stock and prices as read, so a bulk write under lock can tell what it changed
+        loaded = dict(zip(field_names, values))
+        product._loaded = {field: loaded[field] for field in TRACKED_FIELDS if field in loaded}
+        return product
+    
+    def _locked_previous(self, update_fields):
+        """Stock and prices of the row as it is now, locked until the transaction ends"""
+        previous = Product.objects.select_for_update().filter(pk=self.pk).values(*TRACKED_FIELDS).first()
+        if previous is None:
+            return {}
+        # Fields this save leaves alone keep their stored value, whatever the instance holds
+        written = update_fields
+        if written is None and self.get_deferred_fields():
+            written = {field.attname for field in self._meta.concrete_fields} - self.get_deferred_fields()
+        for field in TRACKED_FIELDS:
+            if written is not None and field not in written:
+                if field in self.get_deferred_fields():
+                    setattr(self, field, previous[field])
+                else:
+                    previous[field] = getattr(self, field)
+        return previous
+    
     def save(self, *args, **kwargs):
+        from .catalog import bump_catalog_version
+        from .ledger import stock_movement
+        from events.outbox import emit_product_changes
+        
         if not self.barcode:
             self.barcode = str(uuid.uuid4())[:12].upper()
-        super().save(*args, **kwargs)
+        # Opening stock of a new product is received goods; later edits are corrections
+        kind = 'receipt' if self._state.adding else 'adjustment'
+        # The version and the row commit together, so a till that has seen a
+        # version has also seen every product write up to it
+        with transaction.atomic():
+            # Changes are taken against the locked row, not the values this
+            # instance was read with: those may be stale or never loaded
+            previous = {} if self._state.adding else self._locked_previous(kwargs.get('update_fields'))
+            self.catalog_version = bump_catalog_version(self.shop_id)
+            super().save(*args, **kwargs)
+            emit_product_changes(self, previous)
+            movement = stock_movement(self, previous.get('stock', 0), kind)
+            if movement is not None:
+                movement.save()
+    
+    @property
+    def available_stock(self):
+        return max(self.stock - self.reserved, 0)
     
     @property
     def is_low_stock(self):
@@ -65,4 +122,63 @@ class Product(models.Model):
     def profit_margin(self):
         if self.cost_price > 0:
             return ((self.sale_price - self.cost_price) / self.cost_price) * 100
-        return 0
\ No newline at end of file
+        return 0
+
+class CatalogVersion(models.Model):
+    """Per-shop counter bumped by every product write"""
+    shop = models.OneToOneField(Shop, on_delete=models.CASCADE, primary_key=True, related_name='catalog_version')
+    version = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.shop.name}: v{self.version}"
+
+class CatalogTombstone(models.Model):
+    """A deleted product, kept so delta sync can tell tills to drop it"""
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE)
+    product_id = models.BigIntegerField()
+    catalog_version = models.BigIntegerField()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['shop', 'catalog_version'], name='products_tombstone_idx'),
+        ]
+
+class StockMovement(models.Model):
+    """One change to a product's stock; the journal is only ever appended to"""
+    KIND_CHOICES = [
+        ('sale', 'Sale'),
+        ('return', 'Return'),
+        ('receipt', 'Receipt'),
+        ('adjustment', 'Adjustment'),
+        ('import', 'Import'),
+    ]
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_movements')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    change = models.IntegerField()
+    bill = models.ForeignKey('billing.Bill', on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_movements')
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'created_at'], name='products_movement_product_idx'),
+            models.Index(fields=['shop', 'created_at'], name='products_movement_shop_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.product_id}: {self.change:+d} ({self.kind})"
+
+class StockSnapshot(models.Model):
+    """Stock of a product at ``taken_at``; movements from then on are added to it"""
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_snapshots')
+    stock = models.IntegerField()
+    taken_at = models.DateTimeField()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'taken_at'], name='unique_stock_snapshot')
+        ]
+    
+    def __str__(self):
+        return f"{self.product_id}: {self.stock} at {self.taken_at}"
@@ -0,0 +1,244 @@
+"""
+In-process catalog search index for POS and product lookups
+"""
+import heapq
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from django.conf import settings
+from django.db.models import Q
+from .catalog import current_catalog_version
+from .models import CatalogTombstone, Product
+
+_TOKEN_SPLIT = re.compile(r'[\W_]+')
+
+# Above this many matches the id list gets too long for an IN clause, so
+# callers fall back to a plain ORM filter
+MAX_FILTER_IDS = 2000
+
+
+def normalize(text):
+    """Case-fold and collapse whitespace so lookups ignore formatting"""
+    return ' '.join((text or '').casefold().split())
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class CatalogIndex:
+    """
+    Search index over the active products of one shop.
+
+    Matches are returned in tiers: exact barcode, name prefix, word prefix
+    and, for queries of three or more characters, any other substring of the
+    name or barcode (the same matches ``icontains`` finds). The first three
+    tiers are answered by ``bisect`` over sorted arrays, so a typeahead
+    lookup with a limit usually stops after touching ``limit`` entries; the
+    substring tier intersects trigram postings and is only consulted when the
+    earlier tiers leave room.
+    """
+
+    def __init__(self, shop_id):
+        self.shop_id = shop_id
+        self.docs = {}
+        self.barcodes = {}
+        self.names = []
+        self.tokens = []
+        self.trigrams = defaultdict(set)
+        self._dirty = False
+        self.lock = threading.RLock()
+        self.checked_at = time.monotonic()
+        self.version = 0
+
+    @classmethod
+    def build(cls, shop_id):
+        index = cls(shop_id)
+        index.version = current_catalog_version(shop_id)
+        products = Product.objects.filter(shop_id=shop_id, is_active=True).values_list('id', 'name', 'barcode')
+        for product_id, name, barcode in products.iterator(chunk_size=2000):
+            index._add(product_id, name, barcode)
+        index._sort()
+        return index
+
+    def _words(self, name, barcode):
+        return {word for word in _TOKEN_SPLIT.split(name) if word} | ({barcode} if barcode else set())
+
+    def _add(self, product_id, name, barcode):
+        name = normalize(name)
+        barcode = normalize(barcode)
+        self.docs[product_id] = (name, barcode)
+        if barcode:
+            self.barcodes[barcode] = product_id
+        self.names.append((name, product_id))
+        self.tokens.extend((word, product_id) for word in self._words(name, barcode))
+        for gram in _trigrams(name) | _trigrams(barcode):
+            self.trigrams[gram].add(product_id)
+        self._dirty = True
+
+    def _sort(self):
+        if self._dirty:
+            self.names.sort()
+            self.tokens.sort()
+            self._dirty = False
+
+    @staticmethod
+    def _delete_sorted(entries, entry):
+        position = bisect_left(entries, entry)
+        if position < len(entries) and entries[position] == entry:
+            del entries[position]
+
+    def _discard(self, product_id):
+        doc = self.docs.pop(product_id, None)
+        if doc is None:
+            return
+        name, barcode = doc
+        self._sort()
+        if self.barcodes.get(barcode) == product_id:
+            del self.barcodes[barcode]
+        self._delete_sorted(self.names, (name, product_id))
+        for word in self._words(name, barcode):
+            self._delete_sorted(self.tokens, (word, product_id))
+        for gram in _trigrams(name) | _trigrams(barcode):
+            postings = self.trigrams.get(gram)
+            if postings is not None:
+                postings.discard(product_id)
+                if not postings:
+                    del self.trigrams[gram]
+
+    def update(self, product):
+        """Apply a saved product to the index"""
+        with self.lock:
+            self._discard(product.id)
+            if product.is_active:
+                self._add(product.id, product.name, product.barcode)
+
+    def remove(self, product_id):
+        with self.lock:
+            self._discard(product_id)
+
+    def refresh(self, version):
+        """Apply every product write between the index's version and ``version``"""
+        changed = Product.objects.filter(shop_id=self.shop_id, catalog_version__gt=self.version)
+        deleted = CatalogTombstone.objects.filter(shop_id=self.shop_id, catalog_version__gt=self.version)
+        with self.lock:
+            for product in changed.only('id', 'name', 'barcode', 'is_active').iterator(chunk_size=2000):
+                self.update(product)
+            for product_id in deleted.values_list('product_id', flat=True):
+                self._discard(product_id)
+            self.version = max(self.version, version)
+
+    @staticmethod
+    def _scan_prefix(entries, query):
+        position = bisect_left(entries, (query,))
+        while position < len(entries) and entries[position][0].startswith(query):
+            yield entries[position][1]
+            position += 1
+
+    def search(self, query, limit=None):
+        """Product ids matching ``query``, best matches first"""
+        query = normalize(query)
+        if not query:
+            return []
+
+        results = []
+        seen = set()
+
+        def take(product_ids):
+            for product_id in product_ids:
+                if limit and len(results) >= limit:
+                    return True
+                if product_id not in seen:
+                    seen.add(product_id)
+                    results.append(product_id)
+            return bool(limit) and len(results) >= limit
+
+        with self.lock:
+            self._sort()
+            exact = self.barcodes.get(query)
+            if take([exact] if exact is not None else []):
+                return results
+            if take(self._scan_prefix(self.names, query)):
+                return results
+            if take(self._scan_prefix(self.tokens, query)):
+                return results
+            if len(query) < 3:
+                return results
+
+            postings = sorted((self.trigrams.get(gram, ()) for gram in _trigrams(query)), key=len)
+            candidates = set(postings[0]).intersection(*postings[1:]) - seen
+            matches = [
+                (self.docs[product_id][0], product_id) for product_id in candidates
+                if query in self.docs[product_id][0] or query in self.docs[product_id][1]
+            ]
+            remaining = limit - len(results) if limit else None
+            matches = heapq.nsmallest(remaining, matches) if remaining else sorted(matches)
+            take(product_id for _, product_id in matches)
+        return results
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(shop_id):
+    """
+    Index for ``shop_id``, built on first use.
+
+    Writes made through ``Product.save()``/``delete()`` in this process are
+    applied by signal handlers. Writes from other processes are picked up by
+    checking the shop's catalog version every ``CATALOG_INDEX_TTL`` seconds
+    and applying only the products written since.
+    """
+    ttl = getattr(settings, 'CATALOG_INDEX_TTL', 30)
+    with _indexes_lock:
+        index = _indexes.get(shop_id)
+
+    if index is not None and time.monotonic() - index.checked_at > ttl:
+        version = current_catalog_version(shop_id)
+        if version < index.version:
+            # The counter went backwards, e.g. after a restore
+            index = None
+        else:
+            if version != index.version:
+                index.refresh(version)
+            index.checked_at = time.monotonic()
+
+    if index is None:
+        index = CatalogIndex.build(shop_id)
+        with _indexes_lock:
+            _indexes[shop_id] = index
+    return index
+
+
+def loaded_index(shop_id):
+    """Index for ``shop_id`` if this process has built one, without building it"""
+    with _indexes_lock:
+        return _indexes.get(shop_id)
+
+
+def search_product_ids(shop, query, limit=None):
+    return get_index(shop.id).search(query, limit)
+
+
+def filter_by_search(queryset, shop, query):
+    """Restrict a product queryset to ``query`` matches using the catalog index"""
+    ids = search_product_ids(shop, query)
+    if len(ids) > MAX_FILTER_IDS:
+        return queryset.filter(Q(name__icontains=query) | Q(barcode__icontains=query))
+    return queryset.filter(id__in=ids)
+
+
+def find_by_barcode(shop, barcode):
+    """
+    Active product with exactly this barcode, or ``None``.
+
+    One lookup on the ``unique_barcode_per_shop`` index; stock and price
+    come with it, so nothing is cached between scans.
+    """
+    barcode = (barcode or '').strip()
+    if not barcode:
+        return None
+    return Product.objects.filter(shop=shop, is_active=True, barcode=barcode).first()
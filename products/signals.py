@@ -0,0 +1,28 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .catalog import record_deleted_product
+from .models import Product
+from .search_index import loaded_index
+
+
+@receiver(post_save, sender=Product)
+def index_saved_product(sender, instance, **kwargs):
+    """Keep this process's catalog index in step with product edits"""
+    index = loaded_index(instance.shop_id)
+    if index is not None:
+        index.update(instance)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_deleted_product(sender, instance, **kwargs):
+    index = loaded_index(instance.shop_id)
+    if index is not None:
+        index.remove(instance.id)
+
+
+@receiver(post_delete, sender=Product)
+def tombstone_deleted_product(sender, instance, origin=None, **kwargs):
+    """Let POS tills drop deleted products on their next delta sync"""
+    # Deleting the whole shop takes its catalog with it; nothing to tell tills
+    if origin is None or getattr(origin, 'model', type(origin)) is Product:
+        record_deleted_product(instance)
@@ -0,0 +1,201 @@
+"""
+Set-based bulk stock updates
+
+Stock-takes and bulk edits arrive as rows naming a product by id or barcode
+with either a counted ``stock`` or a relative ``change``. The whole batch is
+validated in memory, the products are looked up and locked with one query
+per ``LOOKUP_BATCH_SIZE`` rows, and the new levels are written with one
+``CASE`` UPDATE per ``STOCK_UPDATE_BATCH_SIZE`` products and journalled
+with one bulk insert, all in one transaction. Invalid rows are skipped
+and reported with their row number.
+"""
+import csv
+import io
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+from events.models import OutboxEvent
+from events.outbox import stock_adjusted_event
+from .catalog import bump_catalog_version
+from .models import Product, StockMovement
+
+# Products looked up per query; keeps the IN list inside every backend's parameter limit
+LOOKUP_BATCH_SIZE = 2000
+
+# Products per UPDATE; its CASE expression gets slow to evaluate when much longer
+STOCK_UPDATE_BATCH_SIZE = 200
+
+# Movement kinds a bulk update can be recorded as
+UPDATE_KINDS = ('adjustment', 'receipt', 'return')
+
+# Header spellings accepted in a stock-take upload
+STOCK_TAKE_HEADERS = {
+    'barcode': 'barcode',
+    'id': 'product_id', 'product id': 'product_id',
+    'stock': 'stock', 'count': 'stock', 'counted': 'stock', 'quantity': 'stock',
+    'change': 'change', 'adjustment': 'change',
+}
+
+
+def _integer(value, label):
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        raise ValidationError(f'Invalid {label}')
+
+
+def parse_stock_update(row):
+    """
+    ``(key, mode, amount)`` of one update row, a dict with ``product_id`` or
+    ``barcode`` and either ``stock`` or ``change``. ``key`` is ``('id', id)``
+    or ``('barcode', barcode)`` and ``mode`` is ``'set'`` or ``'change'``.
+
+    Raises ``ValidationError`` for a row that cannot be applied.
+    """
+    if row.get('product_id') not in (None, ''):
+        key = ('id', _integer(row['product_id'], 'product id'))
+    elif str(row.get('barcode') or '').strip():
+        key = ('barcode', str(row['barcode']).strip())
+    else:
+        raise ValidationError('Product id or barcode is required')
+
+    if row.get('stock') not in (None, ''):
+        stock = _integer(row['stock'], 'stock')
+        if stock < 0:
+            raise ValidationError('Stock cannot be negative')
+        return key, 'set', stock
+    if row.get('change') not in (None, ''):
+        return key, 'change', _integer(row['change'], 'stock change')
+    raise ValidationError('Stock or change is required')
+
+
+def _describe(key):
+    return f'Product {key[1]}' if key[0] == 'id' else f'Barcode {key[1]}'
+
+
+class StockUpdateResult:
+    """``updated`` and ``unchanged`` product counts and ``errors`` as ``(row, message)`` pairs"""
+
+    def __init__(self):
+        self.updated = 0
+        self.unchanged = 0
+        self.errors = []
+
+
+def _lookup(shop, keys):
+    """Lock the shop's products named by ``keys``; ``{key: (product_id, stock)}``"""
+    ids = [value for kind, value in keys if kind == 'id']
+    barcodes = [value for kind, value in keys if kind == 'barcode']
+    found = {}
+    for start in range(0, max(len(ids), len(barcodes)), LOOKUP_BATCH_SIZE):
+        products = Product.objects.select_for_update().filter(shop=shop).filter(
+            Q(id__in=ids[start:start + LOOKUP_BATCH_SIZE]) | Q(barcode__in=barcodes[start:start + LOOKUP_BATCH_SIZE])
+        )
+        for product_id, barcode, stock in products.values_list('id', 'barcode', 'stock'):
+            found[('id', product_id)] = (product_id, stock)
+            if barcode:
+                found[('barcode', barcode)] = (product_id, stock)
+    return found
+
+
+def apply_stock_updates(shop, rows, kind='adjustment'):
+    """
+    Apply update rows (see ``parse_stock_update``) to ``shop``'s products.
+
+    Rows are applied in order, so a count followed by a change adds to the
+    count. A change that would take stock below zero is rejected. The
+    changes are journalled as stock movements of ``kind``, one of
+    ``UPDATE_KINDS``. Returns a ``StockUpdateResult``; row numbers count
+    from 1, or come from a row's ``line`` when it has one.
+    """
+    if kind not in UPDATE_KINDS:
+        raise ValidationError(f'Invalid movement kind {kind}')
+    result = StockUpdateResult()
+    parsed = []
+    for number, row in enumerate(rows, start=1):
+        number = row.get('line', number)
+        try:
+            parsed.append((number, *parse_stock_update(row)))
+        except ValidationError as e:
+            result.errors.append((number, ' '.join(e.messages)))
+    if not parsed:
+        return result
+
+    with transaction.atomic():
+        found = _lookup(shop, {key for _, key, _, _ in parsed})
+
+        loaded = {}
+        stock = {}
+        for number, key, mode, amount in parsed:
+            if key not in found:
+                result.errors.append((number, f'{_describe(key)} not found'))
+                continue
+            product_id, current = found[key]
+            loaded.setdefault(product_id, current)
+            level = stock.get(product_id, current)
+            if mode == 'change':
+                if level + amount < 0:
+                    result.errors.append((number, f'{_describe(key)} has only {level} in stock'))
+                    continue
+                level += amount
+            else:
+                level = amount
+            stock[product_id] = level
+
+        changed = {product_id: level for product_id, level in stock.items() if level != loaded[product_id]}
+        result.unchanged = len(stock) - len(changed)
+        result.errors.sort()
+        if not changed:
+            return result
+
+        # One version for the whole batch, so tills pick it up in one delta
+        version = bump_catalog_version(shop.id)
+        product_ids = sorted(changed)
+        for start in range(0, len(product_ids), STOCK_UPDATE_BATCH_SIZE):
+            batch = product_ids[start:start + STOCK_UPDATE_BATCH_SIZE]
+            Product.objects.filter(id__in=batch).update(
+                stock=Case(
+                    *[When(id=product_id, then=Value(changed[product_id])) for product_id in batch],
+                    output_field=IntegerField()
+                ),
+                catalog_version=version
+            )
+
+        OutboxEvent.objects.bulk_create([
+            stock_adjusted_event(shop.id, product_id, level, loaded[product_id])
+            for product_id, level in changed.items()
+        ])
+        StockMovement.objects.bulk_create([
+            StockMovement(shop=shop, product_id=product_id, kind=kind, change=level - loaded[product_id])
+            for product_id, level in changed.items()
+        ])
+        result.updated = len(changed)
+    result.errors.sort()
+    return result
+
+
+def stock_take_rows(binary_file):
+    """
+    Update rows of a stock-take CSV upload, numbered by file line.
+
+    Columns are named by a header row (barcode or product id, and counted
+    stock or a change); files without one are read as barcode, stock.
+    """
+    text = io.TextIOWrapper(binary_file, encoding='utf-8-sig', errors='replace', newline='')
+    try:
+        columns = None
+        for line, row in enumerate(csv.reader(text), start=1):
+            if not any(cell.strip() for cell in row):
+                continue
+            if columns is None:
+                header = [STOCK_TAKE_HEADERS.get(' '.join(cell.strip().lower().replace('_', ' ').split())) for cell in row]
+                if any(header):
+                    columns = header
+                    continue
+                columns = ['barcode', 'stock']
+            values = {field: cell for field, cell in zip(columns, row) if field}
+            values['line'] = line
+            yield values
+    finally:
+        # Leave the upload open for Django to clean up
+        text.detach()
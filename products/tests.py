@@ -0,0 +1,130 @@
+import io
+import tempfile
+from decimal import Decimal
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.test import SimpleTestCase, TestCase, override_settings
+from jobs.models import Job
+from jobs.runner import enqueue
+from users.models import Shop
+from .importer import COLUMNS, IMPORT_CHUNK_SIZE, import_products_csv, parse_row
+from .jobs import import_products_job
+from .models import Product, StockMovement
+
+
+def _row(**values):
+    return [str(values.get(field, '')) for field in COLUMNS]
+
+
+class ParseRowTests(SimpleTestCase):
+    def test_non_finite_and_out_of_range_values_are_rejected(self):
+        for field in ('cost_price', 'sale_price', 'stock', 'min_stock_alert'):
+            for value in ('NaN', 'sNaN', 'Infinity', '-Infinity', '1e30', '99999999999'):
+                with self.subTest(field=field, value=value), self.assertRaises(ValidationError):
+                    parse_row(COLUMNS, _row(name='Tea', **{field: value}))
+
+    def test_largest_values_are_accepted(self):
+        values = parse_row(COLUMNS, _row(name='Tea', sale_price='99999999.99', stock=str(2 ** 31 - 1)))
+        self.assertEqual((values['sale_price'], values['stock']), (Decimal('99999999.99'), 2 ** 31 - 1))
+
+
+class ImportProductsTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user(username='owner', password='pw')
+        self.shop = Shop.objects.create(owner=owner, name='Test shop', address='-', whatsapp='0')
+
+    def test_bad_cells_are_reported_and_the_rest_imported(self):
+        upload = (
+            'name,sale_price,stock,barcode\n'
+            'Tea,NaN,1,A1\n'
+            'Milk,Infinity,1,A2\n'
+            'Sugar,1e30,1,A3\n'
+            'Rice,10,99999999999999999999,A4\n'
+            'Salt,10,Infinity,A5\n'
+            'Flour,12.50,3,A6\n'
+        )
+        result = import_products_csv(self.shop, io.BytesIO(upload.encode()))
+        self.assertEqual([line for line, _ in result.errors], [2, 3, 4, 5, 6])
+        self.assertEqual(result.created, 1)
+        self.assertEqual(list(Product.objects.values_list('name', 'sale_price', 'stock')), [('Flour', Decimal('12.50'), 3)])
+
+
+class ProductSaveJournalTests(TestCase):
+    """The stock journal follows ``Product.stock`` whatever the saved instance was read with"""
+
+    def setUp(self):
+        owner = User.objects.create_user(username='owner', password='pw')
+        self.shop = Shop.objects.create(owner=owner, name='Test shop', address='-', whatsapp='0')
+        self.product = Product.objects.create(shop=self.shop, name='Tea', sale_price=Decimal('50.00'), stock=10)
+
+    def _assert_journal_matches_stock(self):
+        self.product.refresh_from_db()
+        journal = sum(StockMovement.objects.filter(product=self.product).values_list('change', flat=True))
+        self.assertEqual(journal, self.product.stock)
+
+    def test_stale_instance(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        fresh = Product.objects.get(pk=self.product.pk)
+        fresh.stock = 4
+        fresh.save()
+        stale.stock = 7
+        stale.save()
+        self.assertEqual(list(StockMovement.objects.filter(kind='adjustment').values_list('change', flat=True)), [-6, 3])
+        self._assert_journal_matches_stock()
+
+    def test_deferred_stock(self):
+        product = Product.objects.defer('stock').get(pk=self.product.pk)
+        product.name = 'Green tea'
+        product.save()
+        self.assertFalse(StockMovement.objects.filter(kind='adjustment').exists())
+        self._assert_journal_matches_stock()
+
+    def test_fields_left_out_of_the_update(self):
+        product = Product.objects.get(pk=self.product.pk)
+        product.stock = 3
+        product.sale_price = Decimal('60.00')
+        product.save(update_fields=['sale_price'])
+        self.assertFalse(StockMovement.objects.filter(kind='adjustment').exists())
+        self._assert_journal_matches_stock()
+
+
+class _Progress:
+    """Job progress that fails the attempt at its ``fail_at``-th report"""
+
+    def __init__(self, fail_at=None):
+        self.calls = 0
+        self.fail_at = fail_at
+
+    def update(self, done, total=None, force=False):
+        self.calls += 1
+        if self.calls == self.fail_at:
+            raise RuntimeError('Worker died')
+
+
+@override_settings(STORAGES=dict(settings.STORAGES, private={
+    'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    'OPTIONS': {'location': tempfile.mkdtemp()},
+}))
+class ImportProductsJobTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user(username='owner', password='pw')
+        self.shop = Shop.objects.create(owner=owner, name='Test shop', address='-', whatsapp='0')
+
+    def test_retry_resumes_after_the_committed_chunks(self):
+        rows = IMPORT_CHUNK_SIZE * 2 + 10
+        upload = 'name,sale_price\n' + ''.join(f'Item {i},10\n' for i in range(rows))
+        path = storages['private'].save('jobs/imports/test.csv', ContentFile(upload.encode()))
+        job = enqueue('products.import', {'file': path}, shop=self.shop)
+
+        with self.assertRaises(RuntimeError):
+            import_products_job(job, _Progress(fail_at=1))
+        self.assertEqual(Product.objects.count(), IMPORT_CHUNK_SIZE)
+
+        job = Job.objects.get(pk=job.pk)
+        result = import_products_job(job, _Progress())
+        self.assertEqual(Product.objects.count(), rows)
+        self.assertEqual(Product.objects.values('name').distinct().count(), rows)
+        self.assertEqual((result['created'], result['error_count']), (rows, 0))
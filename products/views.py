@@ -2,8 +2,16 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db.models import Q
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse
+from django.conf import settings
+from django.core.files.storage import storages
+from jobs.runner import enqueue
+from jobs.views import job_dict
 from .models import Product, Category
+from shopcloud.streaming import csv_response
+from .importer import EXPORT_HEADER, export_rows, import_products_csv
+from .search_index import filter_by_search
+from .stock import UPDATE_KINDS, apply_stock_updates, stock_take_rows
 from django.db import models
 from decimal import Decimal, InvalidOperation
 from shopcloud.language_utils import get_user_language, get_template_name
@@ -21,9 +29,7 @@ def product_list(request):
     stock_filter = request.GET.get('stock')
     
     if search:
-        products = products.filter(
-            Q(name__icontains=search) | Q(barcode__icontains=search)
-        )
+        products = filter_by_search(products, request.user.shop, search)
     
     if category_filter:
         products = products.filter(category_id=category_filter)
@@ -347,69 +353,57 @@ def delete_category(request, category_id):
 # Bulk Operations
 @login_required
 def export_products(request):
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="products.csv"'
-    
-    writer = csv.writer(response)
-    writer.writerow(['Name', 'Category', 'Unit', 'Cost Price', 'Sale Price', 'Stock', 'Min Stock Alert', 'Barcode', 'Description'])
-    
-    products = Product.objects.filter(shop=request.user.shop, is_active=True)
-    for product in products:
-        writer.writerow([
-            product.name,
-            product.category.name if product.category else '',
-            product.unit,
-            product.cost_price,
-            product.sale_price,
-            product.stock,
-            product.min_stock_alert,
-            product.barcode,
-            product.description
-        ])
+    """Download the product list as CSV; a POST prepares the file in a background job instead"""
+    if request.method == 'POST':
+        job = enqueue('products.export', shop=request.user.shop, user=request.user)
+        return JsonResponse({'success': True, 'job': job_dict(job)})
     
-    return response
+    products = Product.objects.filter(shop=request.user.shop, is_active=True).order_by('id')
+    return csv_response('products.csv', EXPORT_HEADER, export_rows(products))
 
 @login_required
 def import_products(request):
+    """
+    Import products from a CSV upload; rows with a known barcode update that product.
+    
+    Small files are imported right away. Larger ones are stored and imported
+    by the job worker, and the response carries the job to poll.
+    """
     if request.method == 'POST' and request.FILES.get('csv_file'):
         csv_file = request.FILES['csv_file']
+        wants_json = 'application/json' in request.headers.get('Accept', '')
+        
+        if csv_file.size > settings.PRODUCT_IMPORT_INLINE_BYTES:
+            path = storages['private'].save(f'jobs/imports/{uuid.uuid4().hex}.csv', csv_file)
+            job = enqueue('products.import', {'file': path, 'filename': csv_file.name}, shop=request.user.shop, user=request.user)
+            if wants_json:
+                return JsonResponse({'success': True, 'job': job_dict(job)})
+            messages.info(request, f'Import of {csv_file.name} started in the background (job #{job.id}).')
+            return redirect('products:list')
         
         try:
-            decoded_file = csv_file.read().decode('utf-8')
-            csv_data = csv.reader(decoded_file.splitlines())
-            
-            # Skip header row
-            next(csv_data)
-            
-            imported_count = 0
-            for row in csv_data:
-                if len(row) >= 6:  # Minimum required fields
-                    name, category_name, unit, cost_price, sale_price, stock = row[:6]
-                    
-                    # Get or create category
-                    category = None
-                    if category_name:
-                        category, created = Category.objects.get_or_create(
-                            name=category_name,
-                            shop=request.user.shop,
-                            defaults={'description': f'Auto-created for {category_name}'}
-                        )
-                    
-                    # Create product
-                    Product.objects.create(
-                        name=name,
-                        category=category,
-                        unit=unit if unit in dict(Product.UNIT_CHOICES) else 'piece',
-                        cost_price=float(cost_price) if cost_price else 0,
-                        sale_price=float(sale_price),
-                        stock=int(stock) if stock else 0,
-                        shop=request.user.shop
-                    )
-                    imported_count += 1
-            
-            messages.success(request, f'{imported_count} products imported successfully!')
-        except Exception as e:
-            messages.error(request, f'Error importing products: {str(e)}')
+            result = import_products_csv(request.user.shop, csv_file.file)
+        except (csv.Error, UnicodeError) as e:
+            # Chunks before the malformed line are already imported
+            if wants_json:
+                return JsonResponse({'success': False, 'error': f'Error importing products: {e}'})
+            messages.error(request, f'Error importing products: {e}')
+            return redirect('products:list')
+        errors = [{'line': line, 'error': error} for line, error in result.errors]
+        
+        if wants_json:
+            return JsonResponse({
+                'success': True,
+                'created': result.created,
+                'updated': result.updated,
+                'errors': errors
+            })
+        
+        messages.success(request, f'{result.created} products imported, {result.updated} updated!')
+        if errors:
+            shown = '; '.join(f"Row {error['line']}: {error['error']}" for error in errors[:10])
+            more = f' and {len(errors) - 10} more' if len(errors) > 10 else ''
+            messages.warning(request, f'{len(errors)} rows skipped. {shown}{more}')
     
     return redirect('products:list')
 
@@ -451,23 +445,38 @@ def low_stock_alert(request):
 
 @login_required
 def bulk_update_stock(request):
+    """
+    Set or adjust the stock of many products at once.
+    
+    ``updates`` are ``<product id>:<stock>`` pairs; a signed value such as
+    ``12:+5`` or ``12:-2`` adjusts the stock instead of setting it. A
+    stock-take can be uploaded as ``csv_file`` with barcodes and counts.
+    ``kind`` records the changes as an adjustment, receipt or return.
+    """
     if request.method == 'POST':
-        updates = request.POST.getlist('updates')
-        updated_count = 0
+        kind = request.POST.get('kind') or 'adjustment'
+        if kind not in UPDATE_KINDS:
+            return JsonResponse({'success': False, 'error': 'Invalid stock movement kind'})
         
-        for update in updates:
+        if request.FILES.get('csv_file'):
             try:
-                product_id, new_stock = update.split(':')
-                product = Product.objects.get(id=product_id, shop=request.user.shop)
-                product.stock = int(new_stock)
-                product.save()
-                updated_count += 1
-            except (ValueError, Product.DoesNotExist):
-                continue
+                result = apply_stock_updates(request.user.shop, stock_take_rows(request.FILES['csv_file'].file), kind)
+            except (csv.Error, UnicodeError) as e:
+                # The file is read in full before anything is written
+                return JsonResponse({'success': False, 'error': f'Error reading stock-take file: {e}'})
+        else:
+            rows = []
+            for update in request.POST.getlist('updates'):
+                product_id, _, value = update.partition(':')
+                value = value.strip()
+                rows.append({'product_id': product_id, 'change' if value[:1] in '+-' and value else 'stock': value})
+            result = apply_stock_updates(request.user.shop, rows, kind)
         
         return JsonResponse({
             'success': True,
-            'updated_count': updated_count
+            'updated_count': result.updated,
+            'unchanged_count': result.unchanged,
+            'errors': [{'row': row, 'error': error} for row, error in result.errors]
         })
     
     return JsonResponse({'success': False})
\ No newline at end of file
@@ -9,9 +9,11 @@ from django.utils import timezone
 from users.models import Shop
 from products.models import Product, Category
 from billing.models import Bill, BillItem
+from shopcloud.streaming import EXPORT_CHUNK_SIZE, csv_response
 import json
 import csv
 from io import StringIO
+from decimal import Decimal, InvalidOperation
 
 @login_required
 def shop_settings(request):
@@ -48,7 +50,7 @@ def change_password(request):
 
 @login_required
 def preferences(request):
-    shop = get_object_or_404(Shop, user=request.user)
+    shop = get_object_or_404(Shop, owner=request.user)
     
     if request.method == 'POST':
         # Save user preferences
@@ -56,10 +58,25 @@ def preferences(request):
         tax_rate = request.POST.get('tax_rate', '0')
         low_stock_alert = request.POST.get('low_stock_alert', '10')
         
+        # Receipt format and tax rules are shop settings because every till uses them
+        receipt_format = request.POST.get('receipt_format', shop.receipt_format)
+        if receipt_format in dict(Shop.RECEIPT_FORMAT_CHOICES):
+            shop.receipt_format = receipt_format
+        try:
+            rate = Decimal(tax_rate or '0')
+            if not 0 <= rate <= 100:
+                raise InvalidOperation
+            shop.tax_rate = rate
+        except InvalidOperation:
+            messages.error(request, 'Tax rate must be between 0 and 100!')
+            return redirect('settings:preferences')
+        shop.prices_include_tax = request.POST.get('prices_include_tax') == 'on'
+        shop.save(update_fields=['receipt_format', 'tax_rate', 'prices_include_tax'])
+        
         # Store preferences in session
         request.session['preferences'] = {
             'currency': currency,
-            'tax_rate': float(tax_rate),
+            'tax_rate': float(shop.tax_rate),
             'low_stock_alert': int(low_stock_alert),
         }
         
@@ -117,7 +134,7 @@ def payment_options(request):
 
 @login_required
 def data_backup(request):
-    shop = get_object_or_404(Shop, user=request.user)
+    shop = get_object_or_404(Shop, owner=request.user)
     
     context = {
         'shop': shop,
@@ -129,70 +146,81 @@ def data_backup(request):
 
 @login_required
 def export_data(request):
-    shop = get_object_or_404(Shop, user=request.user)
+    shop = get_object_or_404(Shop, owner=request.user)
     export_type = request.GET.get('type', 'all')
     
     if export_type == 'products':
         return export_products_csv(shop)
     elif export_type == 'bills':
         return export_bills_csv(shop)
+    elif export_type == 'bill_items':
+        return export_bill_items_csv(shop)
     elif export_type == 'all':
         return export_all_data_json(shop)
     
     return JsonResponse({'error': 'Invalid export type'})
 
+def _export_filename(kind, shop, extension='csv'):
+    return f'{kind}_{shop.name}_{timezone.now().strftime("%Y%m%d")}.{extension}'
+
+def _local_time(date):
+    return timezone.localtime(date).strftime('%Y-%m-%d %H:%M')
+
 def export_products_csv(shop):
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="products_{shop.name}_{timezone.now().strftime("%Y%m%d")}.csv"'
-    
-    writer = csv.writer(response)
-    writer.writerow(['Name', 'Category', 'Cost Price', 'Sale Price', 'Stock', 'Barcode', 'Unit'])
-    
-    products = Product.objects.filter(shop=shop)
-    for product in products:
-        writer.writerow([
-            product.name,
-            product.category.name if product.category else '',
-            product.cost_price,
-            product.sale_price,
-            product.stock,
-            product.barcode or '',
-            product.unit
-        ])
-    
-    return response
+    products = Product.objects.filter(shop=shop).order_by('id').values_list(
+        'name', 'category__name', 'cost_price', 'sale_price', 'stock', 'barcode', 'unit'
+    )
+    return csv_response(
+        _export_filename('products', shop),
+        ['Name', 'Category', 'Cost Price', 'Sale Price', 'Stock', 'Barcode', 'Unit'],
+        products.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
 
 def export_bills_csv(shop):
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="bills_{shop.name}_{timezone.now().strftime("%Y%m%d")}.csv"'
-    
-    writer = csv.writer(response)
-    writer.writerow(['Bill Number', 'Date', 'Customer Name', 'Subtotal', 'Tax', 'Total', 'Payment Method'])
-    
-    bills = Bill.objects.filter(shop=shop).order_by('-date')
-    for bill in bills:
-        writer.writerow([
-            bill.bill_number,
-            bill.date.strftime('%Y-%m-%d %H:%M'),
-            bill.customer_name or 'Walk-in Customer',
-            bill.subtotal,
-            bill.tax,
-            bill.total,
-            bill.payment_method
-        ])
-    
-    return response
+    payment_types = dict(Bill.PAYMENT_CHOICES)
+    bills = Bill.objects.filter(shop=shop).order_by('-date', '-id').values_list(
+        'bill_number', 'date', 'customer_name', 'subtotal', 'tax', 'total', 'payment_type'
+    )
+    rows = (
+        [number, _local_time(date), customer or 'Walk-in Customer', subtotal, tax, total, payment_types.get(payment, payment)]
+        for number, date, customer, subtotal, tax, total, payment in bills.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    return csv_response(
+        _export_filename('bills', shop),
+        ['Bill Number', 'Date', 'Customer Name', 'Subtotal', 'Tax', 'Total', 'Payment Method'],
+        rows
+    )
+
+def export_bill_items_csv(shop):
+    """Every line of every bill with its product and category, read in one joined query"""
+    payment_types = dict(Bill.PAYMENT_CHOICES)
+    items = BillItem.objects.filter(bill__shop=shop).order_by('-bill__date', '-bill_id', 'id').values_list(
+        'bill__bill_number', 'bill__date', 'bill__customer_name', 'product__name', 'product__category__name',
+        'product__barcode', 'quantity', 'unit_price', 'total_price', 'bill__payment_type'
+    )
+    rows = (
+        [number, _local_time(date), customer or 'Walk-in Customer', product, category, barcode,
+         quantity, unit_price, total_price, payment_types.get(payment, payment)]
+        for number, date, customer, product, category, barcode, quantity, unit_price, total_price, payment
+        in items.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    return csv_response(
+        _export_filename('bill_items', shop),
+        ['Bill Number', 'Date', 'Customer Name', 'Product', 'Category', 'Barcode',
+         'Quantity', 'Unit Price', 'Line Total', 'Payment Method'],
+        rows
+    )
 
 def export_all_data_json(shop):
     response = HttpResponse(content_type='application/json')
-    response['Content-Disposition'] = f'attachment; filename="backup_{shop.name}_{timezone.now().strftime("%Y%m%d")}.json"'
+    response['Content-Disposition'] = f'attachment; filename="{_export_filename("backup", shop, "json")}"'
     
     # Collect all data
     data = {
         'shop': {
             'name': shop.name,
             'address': shop.address,
-            'whatsapp_number': shop.whatsapp_number,
+            'whatsapp_number': shop.whatsapp,
             'email': shop.email,
         },
         'categories': list(Category.objects.filter(shop=shop).values()),
@@ -202,17 +230,6 @@ def export_all_data_json(shop):
         'export_date': timezone.now().isoformat(),
     }
     
-    # Convert Decimal to string for JSON serialization
-    def decimal_to_str(obj):
-        if hasattr(obj, '__iter__') and not isinstance(obj, (str, bytes)):
-            return [decimal_to_str(item) for item in obj]
-        elif isinstance(obj, dict):
-            return {key: decimal_to_str(value) for key, value in obj.items()}
-        elif hasattr(obj, '__dict__'):
-            return str(obj)
-        return obj
-    
-    data = decimal_to_str(data)
-    
+    # Decimals and dates are written as strings
     json.dump(data, response, indent=2, default=str)
     return response
\ No newline at end of file
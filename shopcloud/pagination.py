@@ -0,0 +1,79 @@
+"""
+Keyset (cursor) pagination for long, newest-first listings
+"""
+import base64
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(date, pk):
+    return base64.urlsafe_b64encode(f'{date.isoformat()}|{pk}'.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """``(date, pk)`` from a cursor, or ``None`` if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        date, pk = raw.split('|')
+        date = parse_datetime(date)
+        return (date, int(pk)) if date is not None else None
+    except (ValueError, TypeError):
+        return None
+
+
+class KeysetPage:
+    """One page of rows plus the query strings that lead to its neighbours"""
+
+    def __init__(self, rows, params, has_next, has_previous, field='date'):
+        self.rows = rows
+        self.field = field
+        self.has_next = has_next and bool(rows)
+        self.has_previous = has_previous and bool(rows)
+        self.next_query = self._query(params, 'after', rows[-1]) if self.has_next else ''
+        self.previous_query = self._query(params, 'before', rows[0]) if self.has_previous else ''
+
+    def _query(self, params, key, row):
+        params = params.copy()
+        params.pop('after', None)
+        params.pop('before', None)
+        params[key] = encode_cursor(getattr(row, self.field), row.pk)
+        return params.urlencode()
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __bool__(self):
+        return bool(self.rows)
+
+
+def keyset_paginate(request, queryset, per_page=50, field='date'):
+    """
+    Page through ``queryset`` newest first on ``(field, id)``.
+
+    The position is carried in an ``after`` or ``before`` cursor instead of
+    an offset, so every page is an index range scan of ``per_page + 1`` rows
+    however far back it is.
+    """
+    after = decode_cursor(request.GET.get('after', ''))
+    before = decode_cursor(request.GET.get('before', ''))
+
+    if before is not None:
+        date, pk = before
+        rows = list(
+            queryset.filter(Q(**{f'{field}__gt': date}) | Q(**{field: date, 'pk__gt': pk})).order_by(field, 'id')[:per_page + 1]
+        )
+        has_previous = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        return KeysetPage(rows, request.GET, has_next=True, has_previous=has_previous, field=field)
+
+    if after is not None:
+        date, pk = after
+        queryset = queryset.filter(Q(**{f'{field}__lt': date}) | Q(**{field: date, 'pk__lt': pk}))
+
+    rows = list(queryset.order_by(f'-{field}', '-id')[:per_page + 1])
+    return KeysetPage(
+        rows[:per_page], request.GET, has_next=len(rows) > per_page, has_previous=after is not None, field=field
+    )
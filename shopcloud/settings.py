@@ -49,6 +49,8 @@ INSTALLED_APPS = [
     'ai_insights',
     'reports',
     'settings',
+    'events',
+    'jobs',
 ]
 
 MIDDLEWARE = [
@@ -135,5 +137,56 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Receipts, exports and pending imports hold customer and catalog data, so they
+# are kept outside MEDIA_ROOT and only handed out by views that check the shop
+PRIVATE_STORAGE_ROOT = config('PRIVATE_STORAGE_ROOT', default=str(BASE_DIR / 'private'))
+
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    'private': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {'location': PRIVATE_STORAGE_ROOT},
+    },
+}
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Billing
+# Bill numbers reserved per process at a time; values above 1 avoid a counter
+# write per bill but numbers from different tills are no longer chronological
+BILL_NUMBER_BLOCK_SIZE = config('BILL_NUMBER_BLOCK_SIZE', default=1, cast=int)
+
+# Seconds a cart line keeps its stock reserved without any activity at the till
+CART_RESERVATION_TTL = config('CART_RESERVATION_TTL', default=15 * 60, cast=int)
+
+# Products
+# Seconds between checks that a process's catalog search index still matches the database
+CATALOG_INDEX_TTL = 30
+
+# Render each receipt PDF in the background right after checkout instead of on first download
+RECEIPT_EAGER_RENDER = config('RECEIPT_EAGER_RENDER', default=False, cast=bool)
+
+# Worker processes used to render receipts for ZIP exports; defaults to one per CPU
+RECEIPT_EXPORT_WORKERS = config('RECEIPT_EXPORT_WORKERS', default=0, cast=int) or None
+
+# Seconds stock snapshots stay behind the present, so movements of checkouts still committing are included
+STOCK_SNAPSHOT_DELAY = 60
+
+# Events
+# Days consumed outbox events are kept before process_events --prune deletes them
+OUTBOX_RETENTION_DAYS = config('OUTBOX_RETENTION_DAYS', default=30, cast=int)
+
+# Jobs
+# Seconds between progress writes of a running background job
+JOB_PROGRESS_INTERVAL = 1
+
+# Seconds without progress after which a running job's worker is presumed dead and the job is retried
+JOB_STALE_AFTER = config('JOB_STALE_AFTER', default=300, cast=int)
+
+# Seconds before the first retry of a failed job; doubled for every further attempt
+JOB_RETRY_DELAY = config('JOB_RETRY_DELAY', default=30, cast=int)
+
+# Product CSV uploads up to this size are imported within the request instead of by the job worker
+PRODUCT_IMPORT_INLINE_BYTES = config('PRODUCT_IMPORT_INLINE_BYTES', default=256 * 1024, cast=int)
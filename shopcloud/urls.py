@@ -33,6 +33,7 @@ urlpatterns = [
     path('ai-insights/', include('ai_insights.urls')),
     path('reports/', include('reports.urls')),
     path('settings/', include('settings.urls')),
+    path('jobs/', include('jobs.urls')),
 ]
 
 if settings.DEBUG:
@@ -0,0 +1,151 @@
+// Offline bill queue for the POS
+//
+// When the till loses its connection, bills are stored in localStorage with a
+// client-generated key and uploaded in batches to /billing/sync/ once the
+// connection is back. The server ignores keys it has already seen, so an
+// interrupted upload can simply be retried.
+
+const OfflineBillQueue = (function() {
+    const STORAGE_KEY = 'shopcloud_offline_bills';
+    const FAILED_KEY = 'shopcloud_failed_bills';
+    const STALE_CART_KEY = 'shopcloud_server_cart_stale';
+    const BATCH_SIZE = 100;
+    let flushing = false;
+
+    function read(key) {
+        try {
+            return JSON.parse(localStorage.getItem(key)) || [];
+        } catch (e) {
+            return [];
+        }
+    }
+
+    function write(key, bills) {
+        localStorage.setItem(key, JSON.stringify(bills));
+    }
+
+    function newKey() {
+        if (window.crypto && crypto.randomUUID) {
+            return crypto.randomUUID();
+        }
+        return 'b' + Date.now().toString(36) + Math.random().toString(36).slice(2, 12);
+    }
+
+    function csrfToken() {
+        const input = document.querySelector('[name=csrfmiddlewaretoken]');
+        return input ? input.value : '';
+    }
+
+    function isNetworkError(error) {
+        // fetch() only rejects when the request never reached the server
+        return !navigator.onLine || error instanceof TypeError;
+    }
+
+    function enqueue(bill) {
+        const queued = Object.assign({}, bill, {
+            client_key: bill.client_key || newKey(),
+            created_at: bill.created_at || new Date().toISOString()
+        });
+        const bills = read(STORAGE_KEY);
+        bills.push(queued);
+        write(STORAGE_KEY, bills);
+        // The server still holds the cart this bill was rung up from
+        localStorage.setItem(STALE_CART_KEY, '1');
+        notify();
+        return queued;
+    }
+
+    function pending() {
+        return read(STORAGE_KEY).length;
+    }
+
+    function failed() {
+        return read(FAILED_KEY);
+    }
+
+    function notify() {
+        document.dispatchEvent(new CustomEvent('offlinequeue:change', {
+            detail: { pending: pending(), failed: failed().length }
+        }));
+    }
+
+    function uploadBatch(batch) {
+        return fetch('/billing/sync/', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': csrfToken()
+            },
+            body: JSON.stringify({ bills: batch })
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success) {
+                throw new Error(data.error || 'Sync failed');
+            }
+            const done = {};
+            const failedBills = read(FAILED_KEY);
+            data.results.forEach(result => {
+                done[result.client_key] = true;
+                if (result.status === 'error') {
+                    const bill = batch.find(b => b.client_key === result.client_key);
+                    failedBills.push(Object.assign({}, bill, { error: result.error }));
+                }
+            });
+            write(FAILED_KEY, failedBills);
+            write(STORAGE_KEY, read(STORAGE_KEY).filter(b => !done[b.client_key]));
+            return data.results;
+        });
+    }
+
+    function clearStaleServerCart() {
+        if (!localStorage.getItem(STALE_CART_KEY)) {
+            return Promise.resolve();
+        }
+        return fetch('/billing/clear-cart/', {
+            method: 'POST',
+            headers: { 'X-CSRFToken': csrfToken() }
+        }).then(() => localStorage.removeItem(STALE_CART_KEY));
+    }
+
+    function flush() {
+        if (flushing || !navigator.onLine) {
+            return Promise.resolve([]);
+        }
+        const bills = read(STORAGE_KEY);
+        if (bills.length === 0) {
+            return clearStaleServerCart().then(() => []).catch(() => []);
+        }
+
+        flushing = true;
+        let results = [];
+        // The cart the till had when it went offline still holds stock its offline bills sold
+        let chain = clearStaleServerCart();
+        for (let i = 0; i < bills.length; i += BATCH_SIZE) {
+            const batch = bills.slice(i, i + BATCH_SIZE);
+            chain = chain.then(() => uploadBatch(batch)).then(r => { results = results.concat(r); });
+        }
+        return chain
+            .then(() => results)
+            .catch(error => {
+                console.error('Offline bill sync error:', error);
+                return results;
+            })
+            .finally(() => {
+                flushing = false;
+                notify();
+            });
+    }
+
+    window.addEventListener('online', flush);
+    document.addEventListener('DOMContentLoaded', flush);
+    setInterval(flush, 60000);
+
+    return {
+        enqueue: enqueue,
+        flush: flush,
+        pending: pending,
+        failed: failed,
+        isNetworkError: isNetworkError
+    };
+})();
@@ -0,0 +1,143 @@
+// Local product catalog for the POS
+//
+// The till downloads the shop's whole active catalog once from
+// /billing/catalog/, keeps it in memory (and in localStorage between page
+// loads) and from then on only asks /billing/catalog/delta/ for products
+// written since its catalog version, plus the stock of products sold since
+// its last read. Product search runs against the local copy, so typing never
+// waits on the network.
+
+const PosCatalog = (function() {
+    const REFRESH_INTERVAL = 30000;
+    let storageKey = null;
+    let version = null;
+    let stockAsOf = null;
+    let products = new Map();
+    let refreshing = null;
+
+    function toProduct(fields, row) {
+        const product = { image: null };
+        fields.forEach((field, i) => { product[field] = row[i]; });
+        product.search = (product.name + ' ' + product.barcode).toLowerCase();
+        return product;
+    }
+
+    function apply(data) {
+        data.products.forEach(row => {
+            const product = toProduct(data.fields, row);
+            products.set(product.id, product);
+        });
+        (data.removed || []).forEach(id => products.delete(id));
+        (data.stock || []).forEach(([id, stock]) => {
+            const product = products.get(id);
+            if (product) {
+                product.stock = stock;
+            }
+        });
+        version = data.version;
+        stockAsOf = data.stock_as_of || null;
+    }
+
+    function save() {
+        try {
+            localStorage.setItem(storageKey, JSON.stringify({
+                version: version,
+                stock_as_of: stockAsOf,
+                fields: ['id', 'name', 'barcode', 'price', 'unit', 'stock'],
+                products: Array.from(products.values()).map(p => [p.id, p.name, p.barcode, p.price, p.unit, p.stock])
+            }));
+        } catch (e) {
+            // Over the storage quota; the in-memory copy still works
+        }
+    }
+
+    function load() {
+        try {
+            const stored = JSON.parse(localStorage.getItem(storageKey));
+            if (stored) {
+                apply(stored);
+            }
+        } catch (e) {
+            products = new Map();
+            version = null;
+            stockAsOf = null;
+        }
+    }
+
+    function downloadSnapshot() {
+        products = new Map();
+        return fetch('/billing/catalog/')
+            .then(response => response.json())
+            .then(data => { apply(data); save(); });
+    }
+
+    function refresh() {
+        if (refreshing || !navigator.onLine) {
+            return refreshing || Promise.resolve();
+        }
+        const request = version === null
+            ? downloadSnapshot()
+            : fetch(`/billing/catalog/delta/?since=${version}` + (stockAsOf ? `&stock_since=${stockAsOf}` : ''))
+                .then(response => response.json())
+                .then(data => {
+                    if (data.reset) {
+                        return downloadSnapshot();
+                    }
+                    if (data.products.length || data.removed.length || data.stock.length || data.version !== version) {
+                        apply(data);
+                        save();
+                    } else {
+                        // Nothing moved; the next delta can start from here
+                        stockAsOf = data.stock_as_of;
+                    }
+                });
+        refreshing = request
+            .catch(error => console.error('Catalog sync error:', error))
+            .finally(() => { refreshing = null; });
+        return refreshing;
+    }
+
+    function start(shopId) {
+        storageKey = `shopcloud_catalog_${shopId}`;
+        load();
+        refresh();
+        setInterval(refresh, REFRESH_INTERVAL);
+        window.addEventListener('online', refresh);
+    }
+
+    function ready() {
+        return version !== null;
+    }
+
+    // Same tiers as the server index: exact barcode, name prefix, word prefix, substring
+    function search(query, limit) {
+        query = query.trim().toLowerCase();
+        if (!query) {
+            return [];
+        }
+        const tiers = [[], [], [], []];
+        products.forEach(product => {
+            const name = product.name.toLowerCase();
+            if (product.barcode.toLowerCase() === query) {
+                tiers[0].push(product);
+            } else if (name.startsWith(query)) {
+                tiers[1].push(product);
+            } else if (name.split(/[\W_]+/).some(word => word.startsWith(query))) {
+                tiers[2].push(product);
+            } else if (query.length >= 3 && product.search.includes(query)) {
+                tiers[3].push(product);
+            }
+        });
+        const byName = (a, b) => a.name.localeCompare(b.name);
+        const matches = [].concat(...tiers.map(tier => tier.sort(byName)));
+        // In-stock products first, keeping the tier order within each group
+        return matches.filter(p => p.stock > 0).concat(matches.filter(p => p.stock <= 0)).slice(0, limit);
+    }
+
+    return {
+        start: start,
+        ready: ready,
+        refresh: refresh,
+        search: search
+    };
+})();
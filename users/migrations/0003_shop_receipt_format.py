@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_shop_logo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='receipt_format',
+            field=models.CharField(choices=[('standard', 'Standard Receipt (PDF)'), ('thermal58', 'Thermal Printer 58mm'), ('thermal80', 'Thermal Printer 80mm')], default='standard', max_length=10),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_shop_receipt_format'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='prices_include_tax',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='tax_rate',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=5),
+        ),
+    ]
@@ -2,11 +2,20 @@ from django.db import models
 from django.contrib.auth.models import User
 
 class Shop(models.Model):
+    RECEIPT_FORMAT_CHOICES = [
+        ('standard', 'Standard Receipt (PDF)'),
+        ('thermal58', 'Thermal Printer 58mm'),
+        ('thermal80', 'Thermal Printer 80mm'),
+    ]
+    
     name = models.CharField(max_length=100)
     address = models.TextField()
     whatsapp = models.CharField(max_length=15)
     email = models.EmailField(blank=True)
     logo = models.ImageField(upload_to='shop_logos/', blank=True, null=True)
+    receipt_format = models.CharField(max_length=10, choices=RECEIPT_FORMAT_CHOICES, default='standard')
+    tax_rate = models.DecimalField(max_digits=5, decimal_places=2, default=0)
+    prices_include_tax = models.BooleanField(default=False)
     owner = models.OneToOneField(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     